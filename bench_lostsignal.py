@@ -0,0 +1,453 @@
+"""Benchmarks for Lost Signal.
+
+Run with:  python bench_lostsignal.py               (compare with bench_baseline.json)
+           python bench_lostsignal.py --save-baseline
+           python bench_lostsignal.py --json results.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import lostsignalgame as game
+import lostsignal_server as server
+import lostsignal_replay
+import lostsignal_save
+
+
+def run_now(coro):
+    """Runs a coroutine that never has to wait, without an event loop."""
+    try:
+        coro.send(None)
+    except StopIteration as done:
+        return done.value
+    raise RuntimeError("coroutine tried to wait")
+
+
+# ============================================================
+#                   SESSION MEMORY
+# ============================================================
+
+STARTER_ITEMS = [game.KNIFE, game.BOTTLE, game.BADGE, game.MEDKIT]
+
+
+def bench_session_memory(count=10000):
+    """Returns the average bytes per session, empty and with items."""
+    results = {}
+    for label, items in (("empty", []), ("4 items", STARTER_ITEMS)):
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+
+        sessions = []
+        for _ in range(count):
+            session = game.GameSession(game.ScriptIO())
+            for item in items:
+                run_now(game.add_to_inventory(session, item))
+            session.io = None
+            sessions.append(session)
+
+        after = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        results[label] = (after - before) / count
+
+    return results
+
+
+# ============================================================
+#                   STARTUP
+# ============================================================
+
+STARTUP = """
+import resource, time
+started = time.perf_counter()
+import lostsignalgame
+if {eager}:
+    held = [lostsignalgame.CONTENT.passage(name) for name in lostsignalgame.CONTENT.index]
+print(time.perf_counter() - started, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def bench_startup(eager=False, runs=10):
+    """Returns the best import time in seconds and the peak RSS in bytes
+    of a fresh interpreter that imports the game. With eager, every
+    passage is decoded up front, the way the text used to be held when it
+    was written into the scene functions."""
+    times, rss = [], []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", STARTUP.format(eager=eager)],
+                             capture_output=True, text=True, check=True).stdout
+        seconds, kb = out.split()
+        times.append(float(seconds))
+        rss.append(int(kb) * 1024)
+    return min(times), min(rss)
+
+
+# ============================================================
+#                   SERVER LATENCY
+# ============================================================
+
+MENU_PROMPT = b"Choose an option: "
+
+
+async def _player(port, rounds, latencies):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    await reader.readuntil(MENU_PROMPT)
+    for _ in range(rounds):
+        await asyncio.sleep(random.uniform(0.5, 2.5))    # thinking
+        writer.write(b"2\r\n")     # View Inventory, then back to the menu
+        sent = time.perf_counter()
+        await reader.readuntil(MENU_PROMPT)
+        latencies.append(time.perf_counter() - sent)
+    writer.write(b"3\r\n")
+    await reader.read()
+    writer.close()
+
+
+async def _bench_server(clients, rounds):
+    listener = await server.GameServer(speed=0).start(port=0, backlog=clients)
+    port = listener.sockets[0].getsockname()[1]
+    latencies = []
+    async with listener:
+        await asyncio.gather(*(_player(port, rounds, latencies) for _ in range(clients)))
+    return latencies
+
+
+def bench_server(clients=5000, rounds=5):
+    """Connects `clients` players to an in-process server at once. Each
+    one thinks for a second or two between menu choices. Returns the
+    p50/p99 seconds from sending a choice to getting the menu prompt back."""
+    latencies = asyncio.run(_bench_server(clients, rounds))
+    return server.percentile(latencies, 50), server.percentile(latencies, 99)
+
+
+# ============================================================
+#                   TIMED CHOICES
+# ============================================================
+
+async def _bench_timer_wheel(count, answered):
+    wheel = server.TimerWheel()
+    deadlines = [wheel.schedule(random.uniform(0.2, 0.5), lambda: None)
+                 for _ in range(count)]
+    for deadline in random.sample(deadlines, int(count * answered)):
+        wheel.cancel(deadline)
+    await asyncio.sleep(0.6)
+    return wheel.metrics()
+
+
+def bench_timer_wheel(count=50000, answered=0.8):
+    """Registers `count` pending timed choices, answers `answered` of them
+    and lets the rest expire. Returns the wheel's accuracy and overhead."""
+    return asyncio.run(_bench_timer_wheel(count, answered))
+
+
+# ============================================================
+#                   REPLAY
+# ============================================================
+
+# Start, explore (take only the badge), solve the bartender, win the fight,
+# run and dive through the raid, leave quietly, then quit at the menu.
+DEMO_COMPLETE = (["1", "", "3", "no", "no", "yes", "no", "no", "no", "",
+                  "1", "yes", "no", "yes", "yes", ""]
+                 + ["1"] * 4
+                 + ["", "run", "dive", "quiet", "3"])
+
+
+def bench_replay(runs=20):
+    """Records a demo-complete run, then replays it. Returns the best
+    replay time in seconds and how long the typewriter would take to type
+    the same run at normal speed."""
+    path = os.path.join(tempfile.mkdtemp(), "demo.lsr")
+    io = game.ScriptIO(DEMO_COMPLETE)
+    session = game.GameSession(io, seed=1)
+    session.log = lostsignal_replay.InputLog(path, session.seed)
+    game.play(session)
+    session.log.close()
+    typed = sum(len(line) for line in io.output) * 0.02
+
+    best = float("inf")
+    for _ in range(runs):
+        started = time.perf_counter()
+        game.replay(path)
+        best = min(best, time.perf_counter() - started)
+    os.remove(path)
+    return best, typed
+
+
+# ============================================================
+#                   SAVES
+# ============================================================
+
+def bench_save(runs=1000):
+    """Plays the demo-complete run with autosave on. Returns the best
+    seconds to resume from its save and the journal bytes written per
+    change, with compaction off."""
+    path = os.path.join(tempfile.mkdtemp(), "demo.lss")
+    session = game.GameSession(game.ScriptIO(DEMO_COMPLETE), seed=1)
+    session.save = lostsignal_save.Autosave(path, session, compact_every=10**9)
+    game.play(session)
+    session.save.close()
+    written = os.path.getsize(lostsignal_save.journal_path(path)) - lostsignal_save.JOURNAL_HEADER.size
+    per_change = written / session.save.count
+
+    best = float("inf")
+    for _ in range(runs):
+        resumed = game.GameSession()
+        started = time.perf_counter()
+        lostsignal_save.load(path, resumed, game.ITEMS)
+        best = min(best, time.perf_counter() - started)
+    os.remove(path)
+    os.remove(lostsignal_save.journal_path(path))
+    return best, per_change
+
+
+# ============================================================
+#                   GAMEPLAY
+# ============================================================
+
+GAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lostsignalgame.py")
+
+
+def bench_startup_to_menu(runs=5):
+    """Returns the best time in seconds from launching the game to its
+    main menu prompt appearing."""
+    best = float("inf")
+    for _ in range(runs):
+        started = time.perf_counter()
+        proc = subprocess.Popen([sys.executable, GAME, "--speed", "instant"],
+                                stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        seen = b""
+        while MENU_PROMPT not in seen:
+            chunk = proc.stdout.read1(4096)
+            if not chunk:
+                raise RuntimeError("the game exited before its main menu")
+            seen += chunk
+        best = min(best, time.perf_counter() - started)
+        proc.communicate(b"3\n")
+    return best
+
+
+RENDER_LINE = "Clone: \"The breach should’ve erased you. That was the point.\""
+
+
+def bench_render(lines=20000):
+    """Returns seconds per character for the console to type a line with
+    typewriter delays off."""
+    with open(os.devnull, "w") as out:
+        console = game.ConsoleIO(speed=0, out=out)
+        started = time.perf_counter()
+        for _ in range(lines):
+            console.write(RENDER_LINE)
+        return (time.perf_counter() - started) / (lines * len(RENDER_LINE))
+
+
+def bench_frames(lines=20000):
+    """Returns seconds per line to get the typewriter frames for a line
+    typed at normal speed, which the server does for every line it types."""
+    typewriter = game.Typewriter(speed=1.0)
+    started = time.perf_counter()
+    for _ in range(lines):
+        typewriter.frames(RENDER_LINE)
+    return (time.perf_counter() - started) / lines
+
+
+# Story-heavy passages, with the curly quotes and dashes of the bartender
+# and the raid.
+SCENE_PASSAGES = ("talk_to_bartender", "talk_to_bartender.correct", "raid_event",
+                  "raid_run_route", "escape_kitchen", "demo_end")
+
+
+class _SocketTypewriter(game.Typewriter):
+    """Encodes frames as the server does, without a socket."""
+
+    encodes = True
+    encode = server.StreamIO.encode
+
+
+def bench_scene_render():
+    """Types the typed lines of SCENE_PASSAGES at normal speed into
+    /dev/null, as the server encodes them, with the frame cache warm.
+    Returns (peak bytes allocated while rendering the scene, bytes the
+    frame cache holds per line)."""
+    lines = [text for name in SCENE_PASSAGES
+             for typed, text in game.CONTENT.passage(name).lines if typed]
+    cache = game.FrameCache()
+    typewriter = _SocketTypewriter(speed=1.0, cache=cache)
+    with open(os.devnull, "wb") as out:
+        def render():
+            for text in lines:
+                for chunk, _ in typewriter.frames(text):
+                    out.write(chunk)
+
+        render()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        render()
+        peak = tracemalloc.get_traced_memory()[1] - before
+        tracemalloc.stop()
+    return peak, cache.bytes / len(cache.entries)
+
+
+def bench_combat(fights=2000):
+    """Returns seconds per clone fight, attacking every turn."""
+    started = time.perf_counter()
+    for seed in range(fights):
+        session = game.GameSession(game.ScriptIO(["1"] * 40), seed=seed)
+        run_now(game.combat_system(session))
+    return (time.perf_counter() - started) / fights
+
+
+def bench_playthrough(runs=200):
+    """Returns the best seconds for a scripted run from the main menu to
+    demo_end and back."""
+    best = float("inf")
+    for _ in range(runs):
+        session = game.GameSession(game.ScriptIO(DEMO_COMPLETE), seed=1)
+        started = time.perf_counter()
+        game.play(session)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def bench_step(sessions=10000, rounds=5):
+    """Steps `sessions` sessions from one thread, in batches: all of them to
+    the main menu, then `rounds` times through View Inventory and back.
+    Returns seconds per step and bytes per suspended session."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    batch = [game.new_session(seed) for seed in range(sessions)]
+    for session in batch:
+        game.step(session)
+    memory = (tracemalloc.get_traced_memory()[0] - before) / sessions
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for session in batch:
+            reply = game.step(session, "2")
+    assert reply.prompt.endswith(MENU_PROMPT.decode()), reply
+    return (time.perf_counter() - started) / (sessions * rounds), memory
+
+
+# ============================================================
+#                   RUN
+# ============================================================
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+
+
+def run_all(quick=False):
+    """Runs every benchmark. Returns {metric: value}, where every metric
+    is lower-is-better."""
+    results = {}
+
+    def record(name, value):
+        results[name] = round(value, 3)
+        print(f"  {name:<28}{value:12.3f}", flush=True)
+
+    record("startup_to_menu_ms", bench_startup_to_menu() * 1000)
+    seconds, rss = bench_startup()
+    record("import_ms", seconds * 1000)
+    record("import_rss_kb", rss / 1024)
+    record("render_ns_per_char", bench_render() * 1e9)
+    record("frames_us_per_line", bench_frames() * 1e6)
+    peak, per_line = bench_scene_render()
+    record("scene_render_peak_bytes", peak)
+    record("frame_cache_bytes_per_line", per_line)
+    record("combat_us_per_fight", bench_combat() * 1e6)
+    record("playthrough_ms", bench_playthrough() * 1000)
+    per_step, per_session = bench_step()
+    record("step_us", per_step * 1e6)
+    record("stepped_session_kb", per_session / 1024)
+    record("replay_ms", bench_replay()[0] * 1000)
+    resume, per_change = bench_save()
+    record("save_resume_us", resume * 1e6)
+    record("save_bytes_per_change", per_change)
+
+    sizes = bench_session_memory()
+    record("session_kb_empty", sizes["empty"] / 1024)
+    record("session_kb_4_items", sizes["4 items"] / 1024)
+
+    clients = 500 if quick else 5000
+    p50, p99 = bench_server(clients)
+    record("server_p50_ms", p50 * 1000)
+    record("server_p99_ms", p99 * 1000)
+
+    wheel = bench_timer_wheel()
+    record("timer_late_avg_ms", wheel["late_avg_ms"])
+    record("timer_us_per_batch", wheel["busy_per_batch_us"])
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Prints each metric against the baseline. Returns the names of the
+    metrics that got worse by more than tolerance (a fraction), and of
+    those the baseline doesn't have or no longer gets measured: a change
+    that adds, renames or drops a metric saves a new baseline with it."""
+    regressions = []
+    print(f"\n{'metric':<28}{'baseline':>12}{'now':>12}{'change':>10}")
+    for name, value in results.items():
+        before = baseline.get(name)
+        if before is None:
+            regressions.append(name)
+            print(f"{name:<28}{'-':>12}{value:12.3f}{'new':>10}  NOT IN BASELINE")
+            continue
+        change = (value - before) / before if before else 0.0
+        flag = ""
+        if change > tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<28}{before:12.3f}{value:12.3f}{change * 100:+9.1f}%{flag}")
+    for name in baseline.keys() - results.keys():
+        regressions.append(name)
+        print(f"{name:<28}{baseline[name]:12.3f}{'-':>12}{'gone':>10}  NOT MEASURED")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lost Signal benchmarks")
+    parser.add_argument("--json", metavar="FILE",
+                        help="also write the results to FILE as JSON")
+    parser.add_argument("--baseline", default=BASELINE,
+                        help="baseline to compare against (default: bench_baseline.json)")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store these results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="how much worse a metric may get before it counts "
+                             "as a regression (default: 0.25 = 25%%)")
+    parser.add_argument("--quick", action="store_true",
+                        help="500 server players instead of 5000")
+    args = parser.parse_args()
+
+    print(f"Python {platform.python_version()} on {platform.machine()}, "
+          f"{os.cpu_count()} CPU(s)")
+    results = run_all(args.quick)
+    document = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(document, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(document, f, indent=2)
+            f.write("\n")
+        print(f"\nBaseline saved to {os.path.relpath(args.baseline)}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            sys.exit(f"\n{len(regressions)} metric(s) failed against the baseline: "
+                     f"{', '.join(regressions)}")
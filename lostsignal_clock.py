@@ -0,0 +1,191 @@
+"""Virtual time for Lost Signal.
+
+Everything in the game that waits does it in an I/O object, and the
+asyncio ones (the server's StreamIO and TimerWheel, the load generator's
+bots, PacedIO below) sleep and set deadlines on their event loop's clock.
+That clock is the injection point: a plain asyncio loop runs in real time,
+and a VirtualClockLoop jumps straight to the next timer whenever nothing
+else is ready. Typewriter pauses and 8-second raid deadlines then pass
+instantly, and in the same order every run.
+
+The virtual clock is for simulations and checks whose sessions all live
+in this process. It doesn't know about bytes still in flight on a real
+socket, and would skip ahead past them.
+
+Check with:  python lostsignal_clock.py
+"""
+
+import argparse
+import asyncio
+import selectors
+import time
+from collections import deque
+
+import lostsignalgame as game
+
+
+# ============================================================
+#                   VIRTUAL CLOCK
+# ============================================================
+
+class _SkippingSelector(selectors.DefaultSelector):
+    """Polls without blocking, and moves the loop's clock on by however
+    long the loop asked to block for."""
+
+    clock = None
+
+    def select(self, timeout=None):
+        events = super().select(0)
+        if events or timeout == 0:
+            return events
+        if timeout is None:
+            return super().select(None)     # no timers: only another thread can wake us
+        self.clock.now += timeout
+        self.clock.skipped += timeout
+        return events
+
+
+class VirtualClockLoop(asyncio.SelectorEventLoop):
+    """An event loop whose time() only moves when every task is waiting on
+    a timer, and then straight to the earliest one."""
+
+    def __init__(self, start=0.0):
+        selector = _SkippingSelector()
+        super().__init__(selector)
+        selector.clock = self
+        self.now = start
+        self.skipped = 0.0      # virtual seconds jumped over
+
+    def time(self):
+        return self.now
+
+
+def run(main, start=0.0):
+    """Runs a coroutine on a VirtualClockLoop, like asyncio.run, and
+    returns its result."""
+    loop = VirtualClockLoop(start)
+    asyncio.set_event_loop(loop)
+    try:
+        return loop.run_until_complete(main)
+    finally:
+        pending = asyncio.all_tasks(loop)
+        for task in pending:
+            task.cancel()
+        if pending:
+            loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+# ============================================================
+#                   PACED SCRIPTS
+# ============================================================
+
+class PacedIO(game.Typewriter):
+    """Plays a list of (seconds, answer) in time: dialog is typed frame by
+    frame with the typewriter's pauses, and each answer comes that many
+    seconds after its prompt. A timed choice answered too late runs out,
+    and the late answer is dropped. Keeps the transcript, with the time
+    each prompt appeared."""
+
+    def __init__(self, answers=(), fps=25, speed=1.0):
+        super().__init__(fps, speed)
+        self.answers = deque(answers)
+        self.output = []
+        self.prompts = []       # [(loop time, answered in time?)]
+
+    async def say(self, text, delay=0.02):
+        for chunk, pause in self.frames(text, delay):
+            self.output.append(chunk)
+            if pause:
+                await asyncio.sleep(pause)
+
+    async def show(self, text=""):
+        self.output.append(text + "\n")
+
+    async def ask(self, prompt=""):
+        self.output.append(prompt)
+        return await self._answer(None)
+
+    async def ask_timed(self, timeout):
+        return await self._answer(timeout)
+
+    async def _answer(self, timeout):
+        if not self.answers:
+            raise EOFError("script ran out of answers")
+        seconds, answer = self.answers.popleft()
+        loop = asyncio.get_running_loop()
+        shown = loop.time()
+        typed = loop.create_future()
+        handle = loop.call_later(seconds, typed.set_result, answer)
+        try:
+            answer = await asyncio.wait_for(typed, timeout)
+        except asyncio.TimeoutError:
+            answer = None
+        finally:
+            handle.cancel()
+        self.prompts.append((shown, answer is not None))
+        return answer
+
+    def transcript(self):
+        return "".join(self.output)
+
+
+async def play_paced(answers, start="main_menu", seed=1, fps=25, speed=1.0):
+    """Plays a PacedIO session from `start`. Returns (io, seconds it took
+    on the loop's clock)."""
+    io = PacedIO(answers, fps, speed)
+    session = game.GameSession(io, seed)
+    started = asyncio.get_running_loop().time()
+    try:
+        await game.run_game(session, start)
+    except EOFError:
+        pass
+    return io, asyncio.get_running_loop().time() - started
+
+
+# ============================================================
+#                   CHECK
+# ============================================================
+
+# Raid routes that end in a timed choice left too long (9 s against 8),
+# then quit from the main menu.
+RAID_TIMEOUTS = {
+    "first choice": [(9.0, "run"), (1.0, "3")],
+    "hide": [(2.0, "hide"), (9.0, "crawl"), (1.0, "3")],
+    "run": [(2.0, "run"), (3.0, "dive"), (9.0, "quiet"), (1.0, "3")],
+    "blend": [(2.0, "blend"), (9.0, "vents"), (1.0, "3")],
+}
+
+
+def check(speed=1.0, runs=2):
+    """Plays every RAID_TIMEOUTS route `runs` times on a virtual clock and
+    prints how long each took in virtual and in real time. Returns False
+    if any route played differently from one run to the next."""
+    same = True
+    print(f"{'route':<14}{'virtual s':>10}{'wall ms':>9}{'prompts':>9}{'ran out':>9}  same")
+    for name, answers in RAID_TIMEOUTS.items():
+        results = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            io, seconds = run(play_paced(answers, "raid_event", speed=speed))
+            wall = time.perf_counter() - started
+            results.append((io.transcript(), io.prompts, seconds))
+        repeat = all(result == results[0] for result in results)
+        same = same and repeat
+        _, prompts, seconds = results[0]
+        print(f"{name:<14}{seconds:>10.2f}{wall * 1000:>9.1f}{len(prompts):>9}"
+              f"{sum(not answered for _, answered in prompts):>9}  {'yes' if repeat else 'NO'}")
+    return same
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lost Signal virtual clock check")
+    parser.add_argument("--speed", choices=game.TEXT_SPEEDS, default="normal",
+                        help="how fast dialog is typed out")
+    parser.add_argument("--runs", type=int, default=2,
+                        help="times to play each route; every run must match the first")
+    args = parser.parse_args()
+    if not check(game.TEXT_SPEEDS[args.speed], args.runs):
+        raise SystemExit("virtual time runs differed")
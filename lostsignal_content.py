@@ -0,0 +1,394 @@
+"""Story content for Lost Signal.
+
+lostsignal_content.txt holds every passage of dialog, menu and prompt,
+plus where each timed choice leads. It is compiled ahead of time into
+lostsignal_content.bin: a small index of (name, offset, length) followed
+by the encoded passages. The game memory-maps that file, reads only the
+index at startup and decodes a passage when a scene asks for it. If the
+file is missing or older than the source, the game compiles the source
+in memory instead; importing it never writes anything.
+
+A Watcher can reload the source while the game runs. Only the passages
+whose text changed are parsed again, and the new version keeps using the
+old one's memory map for the rest.
+
+Compile with:  python lostsignal_content.py
+"""
+
+import copy
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+import weakref
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+SOURCE = os.path.join(HERE, "lostsignal_content.txt")
+COMPILED = os.path.join(HERE, "lostsignal_content.bin")
+
+MAGIC = b"LSIG"
+VERSION = 1
+HEADER = struct.Struct("<4sHHI")      # magic, version, passage count, index size
+ENTRY = struct.Struct("<HII")         # name length, offset, length
+
+# Record kinds inside a compiled passage.
+TYPED, INSTANT, PROMPT, ARM, GOTO, DATA = "T", "I", "Q", "A", "G", "D"
+RECORD_SEP, FIELD_SEP = "\x1e", "\x1f"
+
+
+# ============================================================
+#                   SOURCE PARSER
+# ============================================================
+
+ESCAPES = {"n": "\n", "s": " "}     # any other \x is just x
+
+
+def unescape(text):
+    # A plain loop rather than a regex: the game imports this module, and
+    # re alone takes several milliseconds to import.
+    out = []
+    pos = 0
+    while True:
+        slash = text.find("\\", pos)
+        if slash < 0 or slash + 1 == len(text):
+            out.append(text[pos:])
+            return "".join(out)
+        out.append(text[pos:slash])
+        out.append(ESCAPES.get(text[slash + 1], text[slash + 1]))
+        pos = slash + 2
+
+
+def parse(text, filename="<content>", first_line=1):
+    """Parses content source into {passage name: [records]}, where each
+    record is a tuple starting with its kind."""
+    passages = {}
+    records = None
+    prompted = False
+
+    for number, raw in enumerate(text.splitlines(), first_line):
+        line = raw.rstrip()
+        if not line or line.startswith("#"):
+            continue
+
+        if line.startswith("[") and line.endswith("]"):
+            name = line[1:-1].strip()
+            if name in passages:
+                raise ValueError(f"{filename}:{number}: passage [{name}] defined twice")
+            records = passages[name] = []
+            prompted = False
+            continue
+
+        if records is None:
+            raise ValueError(f"{filename}:{number}: text before the first [passage]")
+
+        if line.startswith("->"):
+            records.append((GOTO, line[2:].strip()))
+        elif prompted:
+            if "->" not in line:
+                raise ValueError(f"{filename}:{number}: expected 'answer -> next' after a prompt")
+            answer, target = line.split("->", 1)
+            records.append((ARM, answer.strip(), target.strip()))
+        elif line.startswith("|"):
+            records.append((INSTANT, unescape(line[2:])))
+        elif line.startswith("@"):
+            key, colon, value = line[1:].partition(":")
+            if not colon:
+                raise ValueError(f"{filename}:{number}: expected '@ key: value'")
+            records.append((DATA, key.strip(), value.strip()))
+        elif line.startswith("?"):
+            timeout, _, prompt = line[1:].partition(" ")
+            records.append((PROMPT, timeout, unescape(prompt)))
+            prompted = True
+        else:
+            records.append((TYPED, unescape(line)))
+
+    return passages
+
+
+def split_source(text):
+    """Splits content source into {passage name: (first line, source)}, so
+    a reload can tell which passages changed."""
+    blocks = {}
+    name = None
+    lines = []
+    for number, raw in enumerate(text.splitlines(), 1):
+        line = raw.rstrip()
+        if line.startswith("[") and line.endswith("]"):
+            if name is not None:
+                blocks[name] = (first, "\n".join(lines))
+            name, first, lines = line[1:-1].strip(), number, []
+        if name is not None:
+            lines.append(line)
+    if name is not None:
+        blocks[name] = (first, "\n".join(lines))
+    return blocks
+
+
+# ============================================================
+#                   COMPILER
+# ============================================================
+
+def encode_passage(records):
+    return RECORD_SEP.join(FIELD_SEP.join(record) for record in records).encode("utf-8")
+
+
+def compile_bytes(source=SOURCE):
+    """Compiles the content source. Returns (passage count, the indexed
+    binary file's contents)."""
+    with open(source, encoding="utf-8") as f:
+        passages = parse(f.read(), source)
+
+    index = bytearray()
+    blob = bytearray()
+    for name, records in passages.items():
+        body = encode_passage(records)
+        encoded_name = name.encode("utf-8")
+        index += ENTRY.pack(len(encoded_name), len(blob), len(body)) + encoded_name
+        blob += body
+    return len(passages), HEADER.pack(MAGIC, VERSION, len(passages), len(index)) + index + blob
+
+
+def compile_content(source=SOURCE, target=COMPILED):
+    """Compiles the content source into the indexed binary file."""
+    count, data = compile_bytes(source)
+    temp = target + ".tmp"
+    with open(temp, "wb") as f:
+        f.write(data)
+    os.replace(temp, target)
+    return count
+
+
+# ============================================================
+#                   LOADER
+# ============================================================
+
+class Passage:
+    """One decoded passage: its lines, optional prompt, and where it leads."""
+
+    __slots__ = ("lines", "prompt", "timeout", "arms", "goto", "data")
+
+    def __init__(self, data):
+        self.lines = []          # [(typed?, text)]
+        self.prompt = None
+        self.timeout = None
+        self.arms = {}           # {answer: next}
+        self.goto = None
+        self.data = {}           # {key: value}, tunables for the scene
+
+        for record in data.decode("utf-8").split(RECORD_SEP):
+            kind, *fields = record.split(FIELD_SEP)
+            if kind == TYPED:
+                self.lines.append((True, fields[0]))
+            elif kind == INSTANT:
+                self.lines.append((False, fields[0]))
+            elif kind == PROMPT:
+                self.timeout = int(fields[0]) if fields[0] else None
+                self.prompt = fields[1]
+            elif kind == ARM:
+                self.arms[fields[0]] = fields[1]
+            elif kind == GOTO:
+                self.goto = fields[0]
+            elif kind == DATA:
+                self.data[fields[0]] = fields[1]
+
+    def next_scene(self, answer):
+        """Returns where the player goes after answering this passage."""
+        if self.arms:
+            if answer is None and "timeout" in self.arms:
+                return self.arms["timeout"]
+            return self.arms.get(answer, self.arms.get("*", self.goto))
+        return self.goto
+
+
+class Content:
+    """A memory-mapped compiled content file, or a reloaded version of one
+    (see revised()). Given data, the compiled bytes are used in place of
+    the file."""
+
+    def __init__(self, path=COMPILED, data=None):
+        if data is None:
+            with open(path, "rb") as f:
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.data = data
+
+        magic, version, count, index_size = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} content file")
+
+        self.index = {}          # {name: (start, end)}
+        pos = HEADER.size
+        blob = HEADER.size + index_size
+        for _ in range(count):
+            name_length, offset, length = ENTRY.unpack_from(self.data, pos)
+            pos += ENTRY.size
+            name = self.data[pos:pos + name_length].decode("utf-8")
+            pos += name_length
+            self.index[name] = (blob + offset, blob + offset + length)
+
+        self.version = 1
+        self.changed = {}        # {name: encoded passage} reloaded since the file was compiled
+
+    def __contains__(self, name):
+        return name in self.changed or name in self.index
+
+    def __iter__(self):
+        """Every passage name in this version."""
+        return iter(dict.fromkeys([*self.index, *self.changed]))
+
+    def passage(self, name):
+        data = self.changed.get(name)
+        if data is None:
+            start, end = self.index[name]
+            data = self.data[start:end]
+        return Passage(data)
+
+    def revised(self, changed, removed=()):
+        """Returns the next version of this content, with the passages in
+        changed ({name: encoded passage}) new or replaced and those in
+        removed gone. This version is left as it was."""
+        new = copy.copy(self)
+        new.version = self.version + 1
+        new.changed = {**self.changed, **changed}
+        new.index = dict(self.index)
+        for name in removed:
+            new.changed.pop(name, None)
+            new.index.pop(name, None)
+        return new
+
+    def kept_bytes(self):
+        """Memory this version holds that its memory map doesn't: the
+        reloaded passages and its own index."""
+        return (sys.getsizeof(self.index) + sys.getsizeof(self.changed)
+                + sum(sys.getsizeof(data) for data in self.changed.values()))
+
+
+def load(source=SOURCE, target=COMPILED):
+    """Opens the compiled content. If the source is newer (or the .bin was
+    never built), compiles it in memory rather than writing the file: the
+    game may be installed read-only, and loading it has no side effects.
+    Build the .bin with `python lostsignal_content.py`; a deploy can ship
+    it alone."""
+    if os.path.exists(source) and (
+            not os.path.exists(target)
+            or os.path.getmtime(target) < os.path.getmtime(source)):
+        return Content(source, compile_bytes(source)[1])
+    return Content(target)
+
+
+# ============================================================
+#                   HOT RELOAD
+# ============================================================
+
+class Watcher:
+    """Polls the content source's mtime and, when it changes, builds a new
+    version of the content from the passages whose text changed.
+
+    The new version replaces `content` in one assignment. Anything still
+    holding an older version (a session partway through a scene) keeps
+    reading it until it lets go. validate(content), if given, can raise
+    ValueError to turn a reload down; the last version stays. It is given
+    the whole new version, not just what changed.
+    """
+
+    def __init__(self, content, source=SOURCE, validate=None):
+        self.content = content
+        self.source = source
+        self.validate = validate
+        self.mtime = os.stat(source).st_mtime_ns
+        with open(source, encoding="utf-8") as f:
+            self.blocks = split_source(f.read())
+        self.versions = weakref.WeakSet([content])
+        self.reloads = 0
+        self.failures = 0
+        self.reload_seconds = 0.0
+        self.last = None        # (names reloaded, seconds) or the last error
+
+    def check(self):
+        """Reloads if the source changed. Returns the new content, or None
+        if nothing changed or the reload failed (see last)."""
+        try:
+            mtime = os.stat(self.source).st_mtime_ns
+            if mtime == self.mtime:
+                return None
+            self.mtime = mtime
+            started = time.perf_counter()
+            with open(self.source, encoding="utf-8") as f:
+                blocks = split_source(f.read())
+        except OSError as error:      # e.g. caught between an editor's delete and write
+            self.failures += 1
+            self.last = str(error)
+            return None
+
+        changed = [name for name, (_, text) in blocks.items()
+                   if name not in self.blocks or self.blocks[name][1] != text]
+        removed = [name for name in self.blocks if name not in blocks]
+        if not changed and not removed:
+            return None
+
+        try:
+            parsed = {}
+            for name in changed:
+                first_line, text = blocks[name]
+                parsed.update(parse(text, self.source, first_line))
+            content = self.content.revised(
+                {name: encode_passage(records) for name, records in parsed.items()}, removed)
+            if self.validate is not None:
+                self.validate(content)
+        except ValueError as error:
+            self.failures += 1     # and compare the next save with the last good one
+            self.last = str(error)
+            return None
+
+        seconds = time.perf_counter() - started
+        self.content = content
+        self.blocks = blocks
+        self.versions.add(content)
+        self.reloads += 1
+        self.reload_seconds += seconds
+        self.last = (changed + removed, seconds)
+        return content
+
+    def watch(self, on_reload, every=1.0):
+        """Checks every `every` seconds on a daemon thread, calling
+        on_reload(content) with each new version."""
+        def run():
+            while True:
+                time.sleep(every)
+                content = self.check()
+                if content is not None:
+                    on_reload(content)
+                    print(f"\n[content v{content.version}] {self.report()}", file=sys.stderr)
+                elif isinstance(self.last, str):
+                    print(f"\n[content] reload failed, keeping v{self.content.version}: "
+                          f"{self.last}", file=sys.stderr)
+                    self.last = None
+
+        thread = threading.Thread(target=run, name="content-watcher", daemon=True)
+        thread.start()
+        return thread
+
+    def metrics(self):
+        old = [content for content in self.versions if content is not self.content]
+        return {
+            "version": self.content.version,
+            "reloads": self.reloads,
+            "failures": self.failures,
+            "reload_ms_avg": self.reload_seconds / self.reloads * 1000 if self.reloads else 0.0,
+            "old_versions": len(old),
+            "old_kb": sum(content.kept_bytes() for content in old) / 1024,
+        }
+
+    def report(self):
+        names, seconds = self.last
+        metrics = self.metrics()
+        return (f"reloaded {', '.join(names)} in {seconds * 1000:.2f} ms; "
+                f"older versions still in use: {metrics['old_versions']} "
+                f"({metrics['old_kb']:.1f} KB)")
+
+
+if __name__ == "__main__":
+    count = compile_content()
+    print(f"Compiled {count} passages into {os.path.relpath(COMPILED)} "
+          f"({os.path.getsize(COMPILED)} bytes)", file=sys.stderr)
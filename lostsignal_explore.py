@@ -0,0 +1,561 @@
+"""Exhaustive story-path explorer for Lost Signal.
+
+Drives the game headlessly and tries every answer at every prompt: each
+menu option, yes and no, every timed choice including letting it run
+out, and one nonsense answer to cover the "invalid" branches.
+
+The search goes scene by scene. Whenever a scene is entered, the session
+(scene, inventory, flags and RNG state) is snapshotted, and a snapshot
+equal to one seen before, ignoring the RNG state, is not explored
+again. Inside a scene, each branch is reached by restoring the snapshot
+and replaying only that scene's answers, and two branches that reach
+the same prompt with the same locals in every game frame are collapsed
+into one state. Fights are explored per strategy (see STRATEGIES)
+rather than move by move; lostsignal_sim.py covers the fight itself.
+
+Reports the endings reached and how many explored states can lead to each,
+the passages and scenes never reached and, with --coverage, the lines of
+the scenes, item effects and the helpers they call that never ran.
+
+Run with:  python lostsignal_explore.py --workers 4 --coverage
+"""
+
+import argparse
+import ast
+import hashlib
+import inspect
+import multiprocessing
+import os
+import random
+import re
+import sys
+import textwrap
+import time
+from collections import deque
+
+import lostsignal_content
+import lostsignalgame as game
+
+
+SEED = 1
+INVALID = "x"     # one nonsense answer per prompt, for the "invalid" branches
+
+# How a fight is played once the explorer picks a strategy at its first
+# turn: one (choice, item) per turn, the last repeating.
+STRATEGIES = {
+    "attack": [("1", None)],
+    "defend": [("3", None)],
+    "fumble": [(INVALID, None)],
+    "items": [("2", "broken bottle"), ("2", "discarded knife"), ("2", "starfighter badge"),
+              ("2", "strange access card"), ("2", "medkit"), ("2", INVALID), ("1", None)],
+    "bleed": [("2", "discarded knife"), ("1", None), ("1", None)],
+    "hint": [("4", None), ("1", None)],
+}
+STRATEGY = "strategy:"
+
+
+# ============================================================
+#                   SNAPSHOTS AND FINGERPRINTS
+# ============================================================
+
+def snapshot(session):
+    """Everything about a session that carries over from one scene to the
+    next, as plain tuples."""
+    return (session.scene,
+            tuple((item.id, session.inventory.uses_left(item)) for item in session.inventory),
+            session.badge_buff, session.basement_unlocked, session.clone_defeated,
+            session.rng.getstate() if session.rng is not None else None)
+
+
+def restore(state, io):
+    """Builds a session from a snapshot."""
+    scene, inventory, badge_buff, basement_unlocked, clone_defeated, rng = state
+    session = game.GameSession(io, seed=SEED)
+    session.scene = scene
+    for item_id, uses in inventory:
+        session.inventory.add(game.ITEMS[item_id], uses)
+    session.badge_buff = badge_buff
+    session.basement_unlocked = basement_unlocked
+    session.clone_defeated = clone_defeated
+    if rng is not None:
+        session.rng = random.Random()
+        session.rng.setstate(rng)
+    return session
+
+
+def scene_key(state):
+    """The part of a snapshot that decides what can happen next. The order
+    items were picked up in only changes how the inventory is listed, and
+    the RNG state only changes the clone's damage rolls, which the fight
+    strategies don't branch on."""
+    return (state[0], tuple(sorted(state[1]))) + state[2:5]
+
+
+def digest(value):
+    return hashlib.blake2b(repr(value).encode("utf-8"), digest_size=16).digest()
+
+
+def freeze(value):
+    """Turns a value into nested tuples that compare and print the same
+    for equal game state."""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, (list, tuple, deque)):
+        return tuple(freeze(item) for item in value)
+    if isinstance(value, dict):
+        return tuple((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, game.Inventory):
+        return value.uses.tobytes()     # pickup order only changes the listing
+    if isinstance(value, game.Item):
+        return ("Item", value.id)
+    if isinstance(value, game.GameSession):
+        return "session"     # fingerprint() adds it once
+    if isinstance(value, lostsignal_content.Passage):
+        return "Passage"     # the frame that loaded it holds its name
+    slots = getattr(type(value), "__slots__", None)
+    if slots:
+        return (type(value).__name__,) + tuple(freeze(getattr(value, name, None)) for name in slots)
+    return type(value).__name__
+
+
+def fingerprint(prompt, timed, frame):
+    """Hashes the locals of every game frame from `frame` out to
+    run_scene, the session among them, which together decide everything
+    that can happen next."""
+    session = frame.f_locals["session"]
+    state = [prompt, timed, session.scene, freeze(session.inventory), session.badge_buff,
+             session.basement_unlocked, session.clone_defeated]
+    while frame is not None and frame.f_code.co_filename == game.__file__:
+        state.append((frame.f_code.co_name, freeze(frame.f_locals)))
+        frame = frame.f_back
+    return digest(state)
+
+
+# ============================================================
+#                   HEADLESS PROBE
+# ============================================================
+
+class Frontier(Exception):
+    """The game asked something the probe has no answer for yet."""
+
+    def __init__(self, prompt, timed, key):
+        super().__init__(prompt)
+        self.prompt = prompt
+        self.timed = timed
+        self.key = key
+
+
+class ExploreIO:
+    """Answers prompts from a fixed list, then stops at the first prompt
+    past its end. Keeps track of every passage told on the way."""
+
+    def __init__(self, answers):
+        self.answers = deque(answers)
+        self.scene = None
+        self.speed = 0
+        self.last_line = ""
+        self.told = set()
+        self.ending = None
+        self.catching = False
+        self.strategy = None
+        self.turn = -1
+
+    def passage(self, name):
+        self.told.add(name)
+        if name == "demo_end":
+            self.ending = "demo complete"
+        elif name == "got_caught":
+            self.catching = True
+
+    async def say(self, text, delay=0.02):
+        if self.catching:
+            self.ending = "captured: " + text.strip()
+            self.catching = False
+        self.last_line = text
+
+    async def show(self, text=""):
+        pass
+
+    async def ask(self, prompt=""):
+        return self._answer(prompt, False)
+
+    async def ask_timed(self, timeout):
+        return self._answer(self.last_line, True)
+
+    def _answer(self, prompt, timed):
+        if self.strategy is not None:
+            return self._fight(prompt)
+
+        if self.answers:
+            answer = self.answers.popleft()
+            if answer is not None and answer.startswith(STRATEGY):
+                self.strategy = STRATEGIES[answer[len(STRATEGY):]]
+                return self._fight(prompt)
+            return answer
+
+        raise Frontier(prompt, timed, fingerprint(prompt, timed, sys._getframe(2)))
+
+    def _fight(self, prompt):
+        if prompt == ITEM_PROMPT:
+            return self.strategy[min(self.turn, len(self.strategy) - 1)][1]
+        self.turn += 1
+        return self.strategy[min(self.turn, len(self.strategy) - 1)][0]
+
+
+class TracingContent:
+    """Passes passages through from the real content, noting each one."""
+
+    def __init__(self, content):
+        self.content = content
+        self.io = None
+
+    def passage(self, name):
+        self.io.passage(name)
+        return self.content.passage(name)
+
+
+CONTENT = game.CONTENT
+TRACE = TracingContent(CONTENT)
+ITEM_PROMPT = CONTENT.passage("use_item.prompt").prompt
+TURN_PROMPT = CONTENT.passage("combat_system.turn").prompt
+LINES = None      # lines of lostsignalgame.py run so far, when tracing coverage
+
+
+def _trace_lines(frame, event, arg):
+    if frame.f_code.co_filename != game.__file__:
+        return None
+    if event in ("call", "line"):
+        LINES.add(frame.f_lineno)
+    return _trace_lines
+
+
+def setup_worker(coverage):
+    global LINES
+    game.CONTENT = TRACE
+    if coverage:
+        LINES = set()
+
+
+def probe(work):
+    """Restores a scene-entry snapshot, plays `answers` into that scene
+    and reports where it stops: ("prompt", key, candidates) inside the
+    scene, ("scene", snapshot) on leaving it, or ("ending", label). Also
+    returns the passages and lines it went through."""
+    state, answers = work
+    io = ExploreIO(answers)
+    TRACE.io = io
+    session = restore(state, io)
+    run = game.run_scene(session)
+
+    if LINES is not None:
+        sys.settrace(_trace_lines)
+    try:
+        run.send(None)
+        raise RuntimeError("probe I/O never waits")
+    except StopIteration as done:
+        session.scene = done.value
+        if io.ending is not None:
+            stop = ("ending", io.ending)
+        elif session.scene is None:
+            stop = ("ending", "quit")
+        else:
+            stop = ("scene", snapshot(session))
+    except Frontier as frontier:
+        stop = ("prompt", frontier.key,
+                candidates(frontier.prompt, frontier.timed, session))
+    finally:
+        sys.settrace(None)
+        run.close()
+
+    lines = frozenset(LINES) if LINES is not None else frozenset()
+    if LINES is not None:
+        LINES.clear()
+    return work, stop, frozenset(io.told), lines
+
+
+# ============================================================
+#                   ANSWERS TO TRY
+# ============================================================
+
+def _prompt_passages():
+    found = {}
+    for name in CONTENT.index:
+        passage = CONTENT.passage(name)
+        if passage.prompt is not None:
+            found.setdefault(passage.prompt, passage)
+    return found
+
+
+PROMPTS = _prompt_passages()
+CHOICES = re.compile(r"\(([a-z]+(?:/[a-z]+)+)\)")
+EITHER = re.compile(r"\b([a-z]+) or ([a-z]+)\b")
+
+
+def candidates(prompt, timed, session):
+    """Returns every answer worth trying at a prompt."""
+    if prompt == TURN_PROMPT:
+        return [STRATEGY + name for name in STRATEGIES]
+
+    passage = PROMPTS.get(prompt)
+    answers = []
+    if passage is not None and passage.arms:
+        answers = [answer for answer in passage.arms if answer not in ("*", "timeout")]
+    elif CHOICES.search(prompt):
+        answers = CHOICES.search(prompt).group(1).split("/")
+    elif EITHER.search(prompt):
+        answers = list(EITHER.search(prompt).groups())
+    elif passage is not None and any(re.match(r"\d\.", text) for _, text in passage.lines):
+        answers = [text[0] for _, text in passage.lines if re.match(r"\d\.", text)]
+    elif "item" in prompt:
+        answers = [item.name for item in session.inventory] + (["exit"] if "exit" in prompt else [])
+    elif "Press Enter" in prompt:
+        return [""]
+
+    answers.append(INVALID)
+    if timed:
+        answers.append(None)
+    return answers
+
+
+# ============================================================
+#                   SEARCH
+# ============================================================
+
+def explore(workers=0, coverage=False, limit=200_000):
+    """Explores every distinct state reachable from the main menu,
+    breadth first, one wave of probes at a time. Returns the state graph
+    (node 0 is the main menu) and what was reached."""
+    nodes = {}        # {state key: node id}, for scene entries and prompts
+    edges = []        # [[(answer, node id or ending label)]] per node
+    told, scenes, lines = set(), set(), set()
+    probes = 0
+
+    def node(key):
+        """Returns (node id, whether it is new) for a state key."""
+        if key in nodes:
+            return nodes[key], False
+        nodes[key] = len(edges)
+        edges.append([])
+        return nodes[key], True
+
+    if workers:
+        pool = multiprocessing.Pool(workers, setup_worker, (coverage,))
+        run_wave = lambda wave: pool.map(probe, wave, chunksize=max(1, len(wave) // (workers * 4)))
+    else:
+        pool = None
+        setup_worker(coverage)
+        run_wave = lambda wave: [probe(work) for work in wave]
+
+    start = game.GameSession(seed=SEED)
+    start.scene = "main_menu"
+    start = snapshot(start)
+    node(digest(scene_key(start)))
+    wave = [(start, ())]
+    parents = {wave[0]: (0, None)}     # {(snapshot, answers): (parent node, answer)}
+    try:
+        while wave:
+            probes += len(wave)
+            if probes > limit:
+                raise RuntimeError(f"more than {limit} probes; is there an unbounded loop?")
+
+            next_wave = []
+            for work, stop, passages, ran in run_wave(wave):
+                told |= passages
+                lines |= ran
+                parent, answer = parents.pop(work)
+                state, answers = work
+                scenes.add(state[0])
+
+                if stop[0] == "ending":
+                    target = stop[1]
+                elif stop[0] == "scene":
+                    target, new = node(digest(scene_key(stop[1])))
+                    if new:
+                        child = (stop[1], ())
+                        parents[child] = (target, None)
+                        next_wave.append(child)
+                else:
+                    _, key, options = stop
+                    target, new = node(key)
+                    if new:
+                        for option in options:
+                            child = (state, answers + (option,))
+                            parents[child] = (target, option)
+                            next_wave.append(child)
+                edges[parent].append((answer, target))
+            wave = next_wave
+    finally:
+        if pool is not None:
+            pool.close()
+
+    return {"edges": edges, "told": told, "scenes": scenes, "lines": lines, "probes": probes}
+
+
+def reaching_states(edges):
+    """Returns {ending: (states it can be reached from, states one answer
+    away from it)}. The state graph has cycles (the tavern loop, menus),
+    so it has no finite count of paths; states are what can be counted."""
+    callers = [[] for _ in edges]   # {node: nodes with an answer leading to it}
+    endings = {}                    # {ending: nodes with an answer ending there}
+    for node, answers in enumerate(edges):
+        for _, target in answers:
+            if isinstance(target, str):
+                endings.setdefault(target, set()).add(node)
+            else:
+                callers[target].append(node)
+
+    reached = {}
+    for ending, last in endings.items():
+        seen = set(last)
+        todo = list(last)
+        while todo:
+            for caller in callers[todo.pop()]:
+                if caller not in seen:
+                    seen.add(caller)
+                    todo.append(caller)
+        reached[ending] = (len(seen), len(last))
+    return reached
+
+
+# ============================================================
+#                   UNREACHED CODE
+# ============================================================
+
+# Hooks a session only has when it is instrumented, which explored sessions
+# never are: lines that run only with one of them set aren't story lines.
+HOOKS = {"metrics", "log", "save", "events"}
+
+# Passages told by helpers such as the inventory rather than entered as scenes.
+HELPER_PASSAGES = {"inventory", "text_speed", "use_item", "got_caught"}
+
+
+def story_functions():
+    """Returns {name: function} for the scenes and item effects in
+    lostsignalgame.py and the module's functions they call, directly or
+    not. The drivers, the command line and the decorators that register
+    scenes at import are left out."""
+    todo = list(game.SCENES.values()) + [func for func in game.EFFECTS if func is not None]
+    found = {}
+    while todo:
+        func = todo.pop()
+        if func.__name__ in found:
+            continue
+        found[func.__name__] = func
+        codes = [func.__code__]
+        while codes:
+            code = codes.pop()
+            codes.extend(const for const in code.co_consts if inspect.iscode(const))
+            for name in code.co_names:
+                value = getattr(game, name, None)
+                if inspect.isfunction(value) and value.__module__ == game.__name__:
+                    todo.append(value)
+    return found
+
+
+def _hook_test(test):
+    """Returns (hook, True) for `if session.<hook> is not None`, (hook, False)
+    for `if session.<hook> is None`, or None for any other test."""
+    if (isinstance(test, ast.Compare) and len(test.ops) == 1
+            and isinstance(test.ops[0], (ast.Is, ast.IsNot))
+            and isinstance(test.left, ast.Attribute) and test.left.attr in HOOKS
+            and isinstance(test.comparators[0], ast.Constant)
+            and test.comparators[0].value is None):
+        return test.left.attr, isinstance(test.ops[0], ast.IsNot)
+    return None
+
+
+def _lines(nodes):
+    return {child.lineno for node in nodes for child in ast.walk(node)
+            if hasattr(child, "lineno")}
+
+
+def instrumented_lines(tree):
+    """Lines under `tree` that only run when the session has a hook set:
+    the body of `if session.metrics is not None:`, and the else branch of
+    `if session.metrics is None:` or, when that body returns, the rest of
+    the block after it."""
+    lines = set()
+    for node in ast.walk(tree):
+        for field in ("body", "orelse", "finalbody"):
+            block = getattr(node, field, None)
+            if not isinstance(block, list):
+                continue
+            for index, statement in enumerate(block):
+                if not isinstance(statement, ast.If):
+                    continue
+                hook = _hook_test(statement.test)
+                if hook is None:
+                    continue
+                if hook[1]:
+                    lines |= _lines(statement.body)
+                else:
+                    lines |= _lines(statement.orelse)
+                    if isinstance(statement.body[-1], ast.Return):
+                        lines |= _lines(block[index + 1:])
+    return lines
+
+
+def story_lines():
+    """Returns {function name: executable lines} for the story code in
+    lostsignalgame.py, leaving out the lines only instrumented sessions
+    run."""
+    found = {}
+    for name, func in sorted(story_functions().items(),
+                             key=lambda item: item[1].__code__.co_firstlineno):
+        lines = set()
+        todo = [func.__code__]
+        while todo:
+            code = todo.pop()
+            lines |= {line for _, _, line in code.co_lines() if line is not None}
+            lines.discard(code.co_firstlineno)
+            todo.extend(const for const in code.co_consts if inspect.iscode(const))
+        source, first = inspect.getsourcelines(func)
+        tree = ast.parse(textwrap.dedent("".join(source)))
+        ast.increment_lineno(tree, first - 1)
+        found[name] = lines - instrumented_lines(tree)
+    return found
+
+
+def report(result, seconds, workers):
+    edges = result["edges"]
+    print(f"Explored {len(edges):,} distinct states with {result['probes']:,} probes "
+          f"in {seconds:.2f} s ({workers or 'no'} worker processes)\n")
+
+    reached = reaching_states(edges)
+    print("Endings reached, with the states that can still reach each "
+          "and those one answer away:")
+    for ending in sorted(reached, key=lambda ending: (ending != "demo complete", ending)):
+        states, last = reached[ending]
+        print(f"  {states:>9,} {last:>7,}  {ending}")
+
+    missed = sorted(set(CONTENT.index) - result["told"])
+    print(f"\nPassages never shown: {', '.join(missed) if missed else 'none'}")
+
+    scenes = set(game.SCENES) | {name for name in CONTENT.index
+                                 if "." not in name and name not in HELPER_PASSAGES}
+    never = sorted(scenes - result["scenes"])
+    print(f"Scenes never entered: {', '.join(never) if never else 'none'}")
+
+    if result["lines"]:
+        print("\nLines of lostsignalgame.py never run:")
+        unreached = 0
+        for name, lines in story_lines().items():
+            missing = sorted(lines - result["lines"])
+            if missing:
+                unreached += len(missing)
+                print(f"  {name:<24}{', '.join(map(str, missing))}")
+        if not unreached:
+            print("  none")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lost Signal story-path explorer")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="worker processes (0 explores in this process)")
+    parser.add_argument("--coverage", action="store_true",
+                        help="also report story lines of lostsignalgame.py that never ran (slower)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    result = explore(args.workers, args.coverage)
+    report(result, time.perf_counter() - started, args.workers)
@@ -0,0 +1,169 @@
+"""Golden transcripts for Lost Signal.
+
+Every NAME.script in the golden directory is a list of answers, and
+NAME.golden next to it is everything the game printed when it was played
+from them. Playing every script again and diffing what the game prints
+now against the golden files catches any change to the story text or to
+where an answer leads.
+
+A script has one answer per line, played in order, with a blank line for
+Enter. Lines starting with # are comments, and these set up the run:
+
+  @seed N        dice rolls for the session (the default is 1)
+  @start SCENE   where the game starts (the default is main_menu)
+  @timeout       lets a timed choice run out
+
+Scripts play instantly, spread over a pool of processes. Transcripts
+echo each answer after its prompt, as a terminal would, so a diff shows
+what was typed where.
+
+Check:       python lostsignal_golden.py
+Some:        python lostsignal_golden.py raid_*
+Regenerate:  python lostsignal_golden.py --update
+"""
+
+import argparse
+import concurrent.futures
+import difflib
+import fnmatch
+import glob
+import multiprocessing
+import os
+import sys
+import time
+
+import lostsignalgame as game
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden")
+SCRIPT = ".script"
+GOLDEN = ".golden"
+
+
+def read_script(path):
+    """Returns (seed, start scene, answers) for a script file."""
+    seed, start, answers = 1, "main_menu", []
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f.read().splitlines(), 1):
+            if line.startswith("#"):
+                continue
+            if not line.startswith("@"):
+                answers.append(line)
+                continue
+            directive, _, value = line[1:].partition(" ")
+            if directive == "seed":
+                seed = int(value)
+            elif directive == "start":
+                start = value.strip()
+            elif directive == "timeout":
+                answers.append(None)
+            else:
+                raise ValueError(f"{path}:{number}: unknown directive @{directive}")
+    return seed, start, answers
+
+
+class EchoIO(game.ScriptIO):
+    """ScriptIO that writes each answer into the transcript."""
+
+    async def ask(self, prompt=""):
+        answer = await super().ask(prompt)
+        self.output.append(answer + "\n")
+        return answer
+
+    async def ask_timed(self, timeout):
+        answer = await super().ask_timed(timeout)
+        self.output.append("[timed out]\n" if answer is None else answer + "\n")
+        return answer
+
+
+def play_script(path):
+    """Plays a script and returns its transcript, ending in how the game
+    stopped."""
+    seed, start, answers = read_script(path)
+    io = EchoIO(answers)
+    session = game.GameSession(io, seed)
+    try:
+        game.play(session, start)
+        end = "[quit]"
+    except EOFError:
+        end = f"[out of answers in {session.scene}]"
+    return io.transcript() + "\n" + end + "\n"
+
+
+def play_all(paths, jobs):
+    """Returns [transcript] for the scripts at paths, played over `jobs`
+    processes."""
+    if jobs <= 1 or len(paths) <= 1:
+        return [play_script(path) for path in paths]
+    context = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(jobs, mp_context=context) as pool:
+        return list(pool.map(play_script, paths, chunksize=max(1, len(paths) // (jobs * 4))))
+
+
+def golden_path(script):
+    return script[:-len(SCRIPT)] + GOLDEN
+
+
+def diff(name, golden, now, context=3):
+    """Returns a unified diff from the golden transcript to this one."""
+    return "".join(difflib.unified_diff(golden.splitlines(keepends=True),
+                                        now.splitlines(keepends=True),
+                                        f"{name}{GOLDEN}", f"{name} (now)", n=context))
+
+
+def check(paths, jobs, update=False, context=3):
+    """Plays every script and compares it with its golden file, or with
+    update=True rewrites the golden files. Returns the number of scripts
+    that failed."""
+    started = time.perf_counter()
+    transcripts = play_all(paths, jobs)
+    failed = written = 0
+    for path, now in zip(paths, transcripts):
+        name = os.path.basename(path)[:-len(SCRIPT)]
+        golden = None
+        if os.path.exists(golden_path(path)):
+            with open(golden_path(path), encoding="utf-8", newline="") as f:
+                golden = f.read()
+        if golden == now:
+            continue
+        if update:
+            with open(golden_path(path), "w", encoding="utf-8", newline="") as f:
+                f.write(now)
+            print(f"{'wrote' if golden is None else 'updated'} {name}{GOLDEN}")
+            written += 1
+        elif golden is None:
+            print(f"FAIL {name}: no {name}{GOLDEN} yet (run with --update)")
+            failed += 1
+        else:
+            print(f"FAIL {name}\n{diff(name, golden, now, context)}")
+            failed += 1
+    seconds = time.perf_counter() - started
+    summary = f"{len(paths)} scripts in {seconds:.2f} s over {jobs} processes: "
+    if update:
+        print(summary + f"{written} golden files written, {len(paths) - written} unchanged")
+    else:
+        print(summary + f"{len(paths) - failed} passed, {failed} failed")
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lost Signal golden transcripts")
+    parser.add_argument("names", nargs="*", metavar="NAME",
+                        help="scripts to play, by name or pattern (default: all)")
+    parser.add_argument("--dir", default=GOLDEN_DIR,
+                        help="where the scripts and golden files are")
+    parser.add_argument("--update", action="store_true",
+                        help="rewrite the golden files from what the game prints now")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count() or 1, metavar="N",
+                        help="processes to play scripts over (default: one per core)")
+    parser.add_argument("--context", type=int, default=3, metavar="LINES",
+                        help="lines of context around each change in a diff")
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.dir, "*" + SCRIPT)))
+    if args.names:
+        paths = [path for path in paths
+                 if any(fnmatch.fnmatch(os.path.basename(path)[:-len(SCRIPT)], pattern)
+                        for pattern in args.names)]
+    if not paths:
+        sys.exit(f"no scripts to play in {args.dir}")
+    sys.exit(1 if check(paths, args.jobs, args.update, args.context) else 0)
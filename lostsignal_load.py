@@ -0,0 +1,565 @@
+"""Load generator for Lost Signal.
+
+Spawns simulated players that arrive at random, at a given average rate,
+and play through the tavern, the bartender, the basement fight and the
+raid's timed choices, some of them letting the timer run out. Each bot
+either follows one of the SCRIPTS or picks at random among the answers
+every prompt offers.
+
+Bots play against sessions in this process, which encode their output
+exactly as the server does but skip the sockets, or over TCP against
+lostsignal_server.py: one started here on a free port, or one already
+running elsewhere.
+
+Reports prompt latency (from a bot's answer, or its arrival, to the
+game's next prompt) at p50/p95/p99, prompts and sessions per second, and
+how much this process's memory grew while the bots played. Text is
+instant by default; at any other --speed the latency includes typing.
+Against a server started here, also reports what it wrote per scene; with
+--compress, bots accept its MCCP2 offer and inflate what they read. With
+--virtual, in-process bots play on a virtual clock (lostsignal_clock.py),
+so a run with typing and thinking takes only the CPU time it needs. With
+--store, every bot plays as its own callsign, saved in a player store
+(lostsignal_store.py), and the report adds its writes and commit latency;
+run the same load twice to see every player come back. With --events,
+sessions record telemetry (lostsignal_telemetry.py) for funnel queries.
+
+In-process:  python lostsignal_load.py --players 2000 --rate 500
+Over TCP:    python lostsignal_load.py --tcp --players 500 --rate 100
+Remote:      python lostsignal_load.py --host 10.0.0.5 --port 4000
+Scaling:     python lostsignal_load.py --scale --policy demo --players 2000
+Store:       python lostsignal_load.py --store /tmp/players.db --players 2000 --rate 0
+"""
+
+import argparse
+import asyncio
+import concurrent.futures
+import multiprocessing
+import os
+import random
+import re
+import time
+import zlib
+
+import lostsignalgame as game
+import lostsignal_clock
+import lostsignal_server
+import lostsignal_store
+import lostsignal_telemetry
+from lostsignal_server import percentile
+
+
+# Scripted routes, minus the fight: every combat turn is answered with
+# FIGHT_MOVE without using up the script. A bot whose fight goes badly
+# drifts off its script, and answers whatever the game asks next with
+# what is left of it.
+SCRIPTS = {
+    # The bartender, the basement fight, then out of the raid through the hatch.
+    "demo": ["1", "", "1", "yes", "no", "yes", "yes", "", "",
+             "run", "dive", "quiet", "3"],
+    # Asks the bartender everything wrong before getting the basement.
+    "wrong": ["1", "", "1", "maybe", "no", "no", "no", "1", "yes", "no", "yes", "yes", "", "",
+              "blend", "vents", "3"],
+    # Lets the raid's timed choices run out, getting caught each time.
+    "timeouts": ["1", "", "1", "yes", "no", "yes", "yes", "", "", None,
+                 "1", "", "1", "yes", "no", "yes", "yes", "", "", "hide", None,
+                 "1", "", "1", "yes", "no", "yes", "yes", "", "", "run", "dive", None, "3"],
+}
+FIGHT_MOVE = "1"
+POLICIES = ("mix", "random") + tuple(SCRIPTS)
+
+INVALID = "x"
+CHOICES = re.compile(r"\(([a-z]+(?:/[a-z]+)+)\)")
+EITHER = re.compile(r"\b([a-z]+) or ([a-z]+)\b")
+OPTION = re.compile(r"^(\d)\. (.+)$", re.M)
+ITEM = re.compile(r"^- ([^(\n]+?)(?: \([^)\n]*\))?$", re.M)
+SKIP_OPTIONS = {"Text Speed"}      # random bots keep the speed they were given
+QUIT_CHANCE = 0.1                  # ...and mostly pass over Quit, to get further in
+
+TURN_MENU = game.CONTENT.passage("combat_system.turn").lines[-1][1]
+GOODBYE = game.CONTENT.passage("main_menu.quit").lines[-1][1].strip()
+STOP = object()     # a bot's answer when it is done playing
+
+
+def encode(text):
+    """Encodes text the way the server sends it."""
+    return lostsignal_server.StreamIO.encode(None, text)
+
+
+def _prompts():
+    """Returns {encoded prompt: timed?} for every prompt in the content
+    file, as the last bytes a server sends before waiting on the player.
+    A timed prompt is typed out as a line of its own."""
+    prompts = {}
+    for name in game.CONTENT.index:
+        passage = game.CONTENT.passage(name)
+        if passage.prompt is None:
+            continue
+        if passage.timeout:
+            prompts[encode(passage.prompt + "\n")] = True
+        else:
+            prompts[encode(passage.prompt)] = False
+    return prompts
+
+
+PROMPTS = _prompts()
+PROMPTS[encode(lostsignal_server.LOGIN_PROMPT)] = False     # servers run with --store
+
+
+def waiting_for(screen):
+    """Returns whether the output ends in a timed prompt, or None if it
+    does not end in a prompt at all."""
+    for prompt, timed in PROMPTS.items():
+        if screen.endswith(prompt):
+            return timed
+    return None
+
+
+def rss_kb(pid="self"):
+    """A process's resident memory in KB. Where /proc is missing, this
+    process's peak instead."""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except OSError:
+        if pid != "self":
+            return 0
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+# ============================================================
+#                   BOTS
+# ============================================================
+
+class LoadStats:
+    """What every bot in a run measured."""
+
+    def __init__(self):
+        self.latencies = []     # seconds from an answer to the next prompt
+        self.prompts = 0
+        self.expired = 0        # timed choices left to run out
+        self.finished = 0       # sessions that reached the end of the game
+        self.stopped = 0        # sessions the bot walked away from
+        self.failed = 0         # connections lost or refused
+        self.playing = 0
+        self.most_playing = 0
+        self.output = None      # the server's OutputStats, when it runs here
+        self.store = None       # the Store's metrics, when it runs here
+        self.events = None      # the Telemetry's metrics, when it runs here
+
+    def add(self, other):
+        """Adds in what another process's bots measured."""
+        self.latencies += other.latencies
+        for name in ("prompts", "expired", "finished", "stopped", "failed", "most_playing"):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+
+class Bot:
+    """One simulated player. Collects the game's output since its last
+    answer and decides what to answer at each prompt."""
+
+    def __init__(self, stats, rng, script=None, expire=0.3, invalid=0.05,
+                 think=0.0, max_answers=300, name=None):
+        self.stats = stats
+        self.rng = rng
+        self.name = name                # callsign, for servers that ask for one
+        self.script = None if script is None else list(reversed(script))
+        self.expire = expire            # chance a random bot lets a timed choice run out
+        self.invalid = invalid          # chance a random bot answers nonsense
+        self.think = think              # mean seconds spent thinking before answering
+        self.max_answers = max_answers
+        self.answers = 0
+        self.screen = bytearray()
+        self.answered_at = asyncio.get_running_loop().time()     # arrival
+
+    async def reply(self, timed):
+        """Returns the answer to the prompt the output ends in, None to let
+        a timed choice run out, or STOP."""
+        clock = asyncio.get_running_loop()      # real or virtual time (lostsignal_clock.py)
+        now = clock.time()
+        stats = self.stats
+        stats.prompts += 1
+        if self.answered_at is not None:
+            stats.latencies.append(now - self.answered_at)
+
+        screen = self.screen.decode("utf-8", "replace").replace("\r\n", "\n")
+        self.screen.clear()
+        if self.answers >= self.max_answers:
+            return STOP
+        self.answers += 1
+        answer = self._choose(screen, timed)
+
+        if self.think and answer is not STOP:
+            await asyncio.sleep(self.rng.expovariate(1 / self.think))
+        if answer is None:
+            stats.expired += 1
+            self.answered_at = None
+        else:
+            self.answered_at = clock.time()
+        return answer
+
+    def _choose(self, screen, timed):
+        if self.name is not None and screen.endswith(lostsignal_server.LOGIN_PROMPT):
+            return self.name
+        if self.script is not None:
+            if TURN_MENU in screen:
+                return FIGHT_MOVE
+            if not self.script:
+                return STOP
+            answer = self.script.pop()
+            return answer if answer is not None or timed else ""
+
+        rng = self.rng
+        if timed and rng.random() < self.expire:
+            return None
+        if rng.random() < self.invalid:
+            return INVALID
+
+        prompt = screen.rstrip("\n").rsplit("\n", 1)[-1]
+        if "Press Enter" in prompt:
+            return ""
+        if "item" in prompt:
+            answers = ITEM.findall(screen) + (["exit"] if "exit" in prompt else [])
+        elif CHOICES.search(prompt):
+            answers = CHOICES.search(prompt).group(1).split("/")
+        elif EITHER.search(prompt):
+            answers = list(EITHER.search(prompt).groups())
+        else:
+            answers = [number for number, label in OPTION.findall(screen)
+                       if label not in SKIP_OPTIONS
+                       and (label != "Quit" or rng.random() < QUIT_CHANCE)]
+        return rng.choice(answers) if answers else ""
+
+
+class BotIO(game.Typewriter):
+    """Game I/O that hands the game's output straight to a Bot, encoded
+    and paced as StreamIO would send it. Every prompt yields to the event
+    loop once, as waiting on a socket would, so at instant speed the bots
+    still take turns instead of each playing to the end in one go."""
+
+    encodes = True
+    encode = lostsignal_server.StreamIO.encode
+
+    def __init__(self, bot, fps=25, speed=0):
+        super().__init__(fps, speed)
+        self.bot = bot
+
+    async def say(self, text, delay=0.02):
+        for chunk, pause in self.frames(text, delay):
+            self.bot.screen += chunk
+            if pause:
+                await asyncio.sleep(pause)
+
+    async def show(self, text=""):
+        self.bot.screen += self.cached(text).data
+
+    async def ask(self, prompt=""):
+        self.bot.screen += self.cached(prompt, end="").data
+        await asyncio.sleep(0)
+        answer = await self.bot.reply(False)
+        if answer is STOP:
+            raise EOFError("bot is done playing")
+        return answer
+
+    async def ask_timed(self, timeout):
+        await asyncio.sleep(0)
+        answer = await self.bot.reply(True)
+        if answer is STOP:
+            raise EOFError("bot is done playing")
+        if answer is None and self.bot.think:
+            await asyncio.sleep(timeout)
+        return answer
+
+
+async def play_in_process(bot, fps, speed, seed, store=None, events=None):
+    session = game.GameSession(BotIO(bot, fps, speed), seed)
+    if events is not None:
+        session.events = events.session()
+    if store is not None:
+        store.load(bot.name, session, game.ITEMS)
+        session.save = store.player(bot.name, session)
+    try:
+        await game.run_game(session)
+    except EOFError:
+        return False
+    return True
+
+
+COMPRESS_OFFER = bytes((lostsignal_server.IAC, lostsignal_server.WILL, lostsignal_server.COMPRESS2))
+COMPRESS_START = bytes((lostsignal_server.IAC, lostsignal_server.SB, lostsignal_server.COMPRESS2,
+                        lostsignal_server.IAC, lostsignal_server.SE))
+
+
+async def play_over_tcp(bot, host, port, compress=False):
+    reader, writer = await asyncio.open_connection(host, port)
+    inflate = None
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                if GOODBYE.encode("utf-8") not in bot.screen:
+                    raise ConnectionResetError("server hung up mid-game")
+                return True
+            if inflate is not None:
+                data = inflate.decompress(data)
+            elif compress:
+                if COMPRESS_OFFER in data:
+                    data = data.replace(COMPRESS_OFFER, b"", 1)
+                    writer.write(bytes((lostsignal_server.IAC, lostsignal_server.DO,
+                                        lostsignal_server.COMPRESS2)))
+                if COMPRESS_START in data:
+                    data, _, rest = data.partition(COMPRESS_START)
+                    inflate = zlib.decompressobj()
+                    data += inflate.decompress(rest)
+            bot.screen += data
+            timed = waiting_for(bot.screen)
+            if timed is None:
+                continue
+            answer = await bot.reply(timed)
+            if answer is STOP:
+                return False
+            if answer is not None:
+                writer.write(answer.encode("utf-8") + b"\r\n")
+    finally:
+        writer.close()
+
+
+# ============================================================
+#                   LOAD RUN
+# ============================================================
+
+async def run_load(players, rate, policy="mix", seed=1, fps=25, speed=0, think=0.0,
+                   expire=0.3, max_answers=300, host=None, port=None, tcp=False,
+                   workers=None, procs=0, compress=False, store_path=None, events_dir=None):
+    """Starts `players` bots, `rate` per second on average (0 for all at
+    once), and waits for every one of them to finish.
+
+    Plays in this process unless given a port or tcp=True, which starts a
+    server here: a GameServer on this event loop, or a WorkerPool of
+    `workers` processes. With procs, the bots are split over that many
+    processes of their own. With store_path, players are saved there by
+    the sessions here or by the server started here, and with events_dir
+    they record telemetry there. Returns (stats, seconds, memory samples in KB
+    for this process and any workers).
+    """
+    stats = LoadStats()
+    rng = random.Random(seed)
+    loop = asyncio.get_running_loop()
+    listener = pool = store = events = None
+    if store_path is not None and not (tcp and workers):
+        store = lostsignal_store.Store(store_path)
+    if events_dir is not None and not (tcp and workers):
+        events = lostsignal_telemetry.Telemetry(events_dir)
+    if tcp and workers:
+        pool = lostsignal_server.WorkerPool(workers, fps, speed, quiet=True, compress=compress,
+                                            store_path=store_path, events_dir=events_dir)
+        host, port = (await pool.start("127.0.0.1", 0))[:2]
+    elif tcp:
+        server = lostsignal_server.GameServer(fps, speed, compress=compress, store=store,
+                                              events=events)
+        stats.output = server.output
+        listener = await server.start("127.0.0.1", 0)
+        host, port = listener.sockets[0].getsockname()[:2]
+
+    def memory_now():
+        pids = ["self"] if pool is None else ["self"] + [w.process.pid for w in pool.workers]
+        return sum(rss_kb(pid) for pid in pids)
+
+    memory = [memory_now()]
+
+    async def sample():
+        while True:
+            await asyncio.sleep(0.25)
+            memory.append(memory_now())
+
+    async def player(number):
+        name = rng.choice(POLICIES[1:]) if policy == "mix" else policy
+        bot = Bot(stats, random.Random(seed * 1_000_003 + number), SCRIPTS.get(name),
+                  expire=expire, think=think, max_answers=max_answers,
+                  name=f"bot{seed}_{number}")
+        stats.playing += 1
+        stats.most_playing = max(stats.most_playing, stats.playing)
+        try:
+            if port is None:
+                done = await play_in_process(bot, fps, speed, rng.getrandbits(32), store,
+                                             events)
+            else:
+                done = await play_over_tcp(bot, host, port, compress)
+        except (ConnectionError, OSError):
+            stats.failed += 1
+        else:
+            if done:
+                stats.finished += 1
+            else:
+                stats.stopped += 1
+        finally:
+            stats.playing -= 1
+
+    sampler = asyncio.ensure_future(sample())
+    started = due = loop.time()
+    if procs:
+        shares = [dict(players=players // procs + (number < players % procs),
+                       rate=rate / procs, policy=policy, seed=seed * procs + number,
+                       fps=fps, speed=speed, think=think, expire=expire,
+                       max_answers=max_answers, host=host, port=port, compress=compress)
+                  for number in range(procs)]
+        context = multiprocessing.get_context("spawn")
+        with concurrent.futures.ProcessPoolExecutor(procs, mp_context=context) as executor:
+            for share in await asyncio.gather(*(loop.run_in_executor(executor, _generate, share)
+                                                 for share in shares)):
+                stats.add(share)
+    else:
+        bots = []
+        for number in range(players):
+            if rate:
+                due += rng.expovariate(rate)
+                await asyncio.sleep(max(0.0, due - loop.time()))
+            bots.append(asyncio.ensure_future(player(number)))
+        await asyncio.gather(*bots)
+    seconds = loop.time() - started
+
+    sampler.cancel()
+    memory.append(memory_now())
+    if listener is not None:
+        listener.close()
+        await listener.wait_closed()
+    if pool is not None:
+        pool.close()
+    if store is not None:
+        store.close()
+        stats.store = store.metrics()
+    if events is not None:
+        events.close()
+        stats.events = events.metrics()
+    return stats, seconds, memory
+
+
+def _generate(share):
+    """Runs one process's share of the bots. See run_load(procs=...)."""
+    return asyncio.run(run_load(**share))[0]
+
+
+def report(stats, seconds, memory, whose="game and bots"):
+    values = stats.latencies
+    print(f"{stats.finished + stats.stopped + stats.failed} players in {seconds:.2f} s, "
+          f"at most {stats.most_playing} at once: {stats.finished} finished the game, "
+          f"{stats.stopped} walked away, {stats.failed} failed")
+    print(f"prompt latency: p50 {percentile(values, 50) * 1000:.2f} ms, "
+          f"p95 {percentile(values, 95) * 1000:.2f} ms, "
+          f"p99 {percentile(values, 99) * 1000:.2f} ms, "
+          f"max {max(values, default=0) * 1000:.2f} ms")
+    if seconds > 0:     # on a virtual clock, instant play takes no time at all
+        print(f"throughput: {stats.prompts / seconds:,.0f} prompts/s, "
+              f"{(stats.finished + stats.stopped) / seconds:,.1f} sessions/s; "
+              f"{stats.expired} timed choices left to run out")
+    else:
+        print(f"throughput: {stats.prompts:,} prompts in no time; "
+              f"{stats.expired} timed choices left to run out")
+    start, peak, end = memory[0], max(memory), memory[-1]
+    print(f"memory ({whose}): {start / 1024:.1f} MB at start, "
+          f"{peak / 1024:.1f} MB peak (+{(peak - start) / 1024:.1f} MB, "
+          f"{(peak - start) / max(1, stats.most_playing):.1f} KB per player at once), "
+          f"{end / 1024:.1f} MB at end")
+    if stats.output is not None:
+        stats.output.report()
+    if stats.store is not None:
+        print("store:", ", ".join(f"{name} {value:g}" for name, value in stats.store.items()))
+    if stats.events is not None:
+        print("events:", ", ".join(f"{name} {value:g}" for name, value in stats.events.items()))
+
+
+def scale(most, players, **settings):
+    """Plays the same load against worker pools of 1, 2, 4... up to `most`
+    processes, with as many bot processes, and prints how throughput
+    grows with them."""
+    counts = sorted({1 << power for power in range(most.bit_length())} | {most})
+    print(f"{'workers':>7}{'prompts/s':>12}{'speedup':>9}{'p50 ms':>9}{'p99 ms':>9}{'failed':>8}")
+    base = None
+    for count in counts:
+        stats, seconds, _ = asyncio.run(run_load(players, 0, tcp=True, workers=count,
+                                                 procs=count, **settings))
+        throughput = stats.prompts / seconds
+        base = base or throughput
+        print(f"{count:>7}{throughput:>12,.0f}{throughput / base:>9.2f}"
+              f"{percentile(stats.latencies, 50) * 1000:>9.2f}"
+              f"{percentile(stats.latencies, 99) * 1000:>9.2f}{stats.failed:>8}")
+    print(f"({os.cpu_count()} cores here)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lost Signal load generator")
+    parser.add_argument("--players", type=int, default=200,
+                        help="how many bots to start in all")
+    parser.add_argument("--rate", type=float, default=50,
+                        help="bots arriving per second on average (0 starts them all at once)")
+    parser.add_argument("--policy", choices=POLICIES, default="mix",
+                        help="a script for every bot, random answers, or a mix of both")
+    parser.add_argument("--expire", type=float, default=0.3,
+                        help="chance a random bot lets a timed choice run out")
+    parser.add_argument("--think", type=float, default=0.0, metavar="SECONDS",
+                        help="mean time a bot thinks before answering; when set, "
+                             "in-process bots also wait out timed choices")
+    parser.add_argument("--max-answers", type=int, default=300,
+                        help="answers after which a bot walks away")
+    parser.add_argument("--speed", choices=game.TEXT_SPEEDS, default="instant",
+                        help="how fast dialog is typed out")
+    parser.add_argument("--fps", type=int, default=25,
+                        help="typewriter frames per second")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--tcp", action="store_true",
+                        help="start a server in this process and play over TCP")
+    parser.add_argument("--workers", type=int, metavar="N",
+                        help="with --tcp, serve from a pool of N worker processes")
+    parser.add_argument("--procs", type=int, default=0, metavar="N",
+                        help="run the bots from N processes of their own")
+    parser.add_argument("--scale", type=int, nargs="?", const=os.cpu_count(), metavar="MOST",
+                        help="measure throughput against 1, 2, 4... up to MOST workers "
+                             "(default: one per core) and exit")
+    parser.add_argument("--compress", action="store_true",
+                        help="have the server offer MCCP2 compression and the bots accept it")
+    parser.add_argument("--virtual", action="store_true",
+                        help="play in-process bots on a virtual clock, so typing, --think "
+                             "and timed choices take no real time; rates are per virtual second")
+    parser.add_argument("--store", metavar="FILE",
+                        help="save every player in the SQLite player store FILE, by callsign; "
+                             "bots also answer the callsign prompt of a --port server with --store")
+    parser.add_argument("--events", metavar="DIR",
+                        help="record telemetry from every session into DIR "
+                             "(query it with lostsignal_telemetry.py)")
+    parser.add_argument("--host", default="127.0.0.1",
+                        help="server to play against, with --port")
+    parser.add_argument("--port", type=int,
+                        help="play against a server already running on this port")
+    args = parser.parse_args()
+    if args.procs and not (args.tcp or args.port):
+        parser.error("--procs needs --tcp or --port")
+    if (args.store or args.events) and (args.port or args.scale):
+        parser.error("--store and --events work with bots in-process or against a server "
+                     "started here")
+    if args.virtual and (args.tcp or args.port or args.scale):
+        parser.error("--virtual only works with in-process bots")
+
+    speed = game.TEXT_SPEEDS[args.speed]
+    if args.scale:
+        scale(args.scale, args.players, policy=args.policy, seed=args.seed, fps=args.fps,
+              speed=speed, think=args.think, expire=args.expire, max_answers=args.max_answers)
+        raise SystemExit
+
+    started = time.perf_counter()
+    stats, seconds, memory = (lostsignal_clock.run if args.virtual else asyncio.run)(run_load(
+        args.players, args.rate, args.policy, args.seed, args.fps, speed, args.think,
+        args.expire, args.max_answers, args.host, args.port, args.tcp, args.workers, args.procs,
+        args.compress, args.store, args.events))
+    if args.virtual:
+        print(f"virtual clock: {seconds:,.1f} s of play in {time.perf_counter() - started:.2f} s")
+    if args.port is not None:
+        whose = "load generator only"
+    elif args.procs:
+        whose = "server only"
+    else:
+        whose = "game and bots"
+    report(stats, seconds, memory, whose)
+    if args.port is None and not args.workers:
+        print("frame cache:", ", ".join(f"{name} {value:g}"
+                                        for name, value in game.FRAMES.metrics().items()))
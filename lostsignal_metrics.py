@@ -0,0 +1,200 @@
+"""Live metrics for Lost Signal sessions.
+
+A session records into Metrics only when session.metrics is set, so an
+uninstrumented session pays one `is None` check per hook. What is
+recorded:
+
+  - entries into each scene and the time spent in it
+  - how long players take to answer, as a histogram per kind of prompt
+  - time spent typing lines out (the typewriter's sleeps)
+  - timed choices and how many of them ran out
+  - combat turns, and fights won and lost
+
+Metrics are exported in the Prometheus text format, to a file or from a
+small HTTP endpoint on localhost. A session created with profile=True
+also keeps its own copy of the numbers, printed when it ends.
+
+Console:  python lostsignalgame.py --metrics metrics.prom --profile
+Server:   python lostsignal_server.py --metrics-port 9100 --profile-every 100
+"""
+
+import os
+import time
+from bisect import bisect_left
+
+# Histogram buckets for seconds spent answering a prompt.
+BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120, 300)
+
+
+class Histogram:
+    """Counts of observations per bucket, Prometheus style."""
+
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)    # the last is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Metrics:
+    """Totals for every instrumented session in this process."""
+
+    def __init__(self):
+        self.sessions = 0
+        self.scene_entries = {}     # {scene: count}
+        self.scene_seconds = {}     # {scene: seconds}
+        self.answer_seconds = {"prompt": Histogram(), "timed": Histogram()}
+        self.typing_seconds = 0.0
+        self.timed_choices = 0
+        self.timeouts = 0
+        self.combat_turns = 0
+        self.fights = {"won": 0, "lost": 0}
+
+    def session(self, profile=False):
+        """Returns a recorder for one new session."""
+        self.sessions += 1
+        return SessionMetrics(self, profile)
+
+    def prometheus(self):
+        """Returns every metric in the Prometheus text exposition format."""
+        out = []
+
+        def metric(name, kind, help_text, samples):
+            out.append(f"# HELP lostsignal_{name} {help_text}")
+            out.append(f"# TYPE lostsignal_{name} {kind}")
+            for labels, value in samples:
+                out.append(f"lostsignal_{name}{labels} {value:g}")
+
+        metric("sessions_total", "counter", "Instrumented sessions started.",
+               [("", self.sessions)])
+        metric("scene_entries_total", "counter", "Times each scene was entered.",
+               [(f'{{scene="{scene}"}}', count) for scene, count in self.scene_entries.items()])
+        metric("scene_seconds_total", "counter", "Seconds spent in each scene, waiting included.",
+               [(f'{{scene="{scene}"}}', seconds)
+                for scene, seconds in self.scene_seconds.items()])
+
+        out.append("# HELP lostsignal_answer_seconds Seconds players took to answer a prompt.")
+        out.append("# TYPE lostsignal_answer_seconds histogram")
+        for kind, histogram in self.answer_seconds.items():
+            total = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), histogram.counts):
+                total += count
+                out.append(f'lostsignal_answer_seconds_bucket{{kind="{kind}",le="{bound}"}} {total}')
+            out.append(f'lostsignal_answer_seconds_sum{{kind="{kind}"}} {histogram.sum:g}')
+            out.append(f'lostsignal_answer_seconds_count{{kind="{kind}"}} {histogram.count}')
+
+        metric("typing_seconds_total", "counter", "Seconds spent typing lines out.",
+               [("", self.typing_seconds)])
+        metric("timed_choices_total", "counter", "Timed choices offered.",
+               [("", self.timed_choices)])
+        metric("timed_choice_timeouts_total", "counter", "Timed choices that ran out.",
+               [("", self.timeouts)])
+        metric("combat_turns_total", "counter", "Combat turns played.",
+               [("", self.combat_turns)])
+        metric("fights_total", "counter", "Clone fights finished, by result.",
+               [(f'{{result="{result}"}}', count) for result, count in self.fights.items()])
+        return "\n".join(out) + "\n"
+
+    def write(self, path):
+        """Writes the metrics to path, replacing it in one step so a
+        scraper never reads half a file."""
+        temp = path + ".tmp"
+        with open(temp, "w") as f:
+            f.write(self.prometheus())
+        os.replace(temp, path)
+
+    async def write_every(self, path, seconds):
+        import asyncio      # only servers need it; the game imports this module too
+
+        while True:
+            self.write(path)
+            await asyncio.sleep(seconds)
+
+    async def serve(self, port, host="127.0.0.1"):
+        """Serves the metrics over HTTP at http://host:port/metrics."""
+        import asyncio
+
+        return await asyncio.start_server(self._handle, host, port)
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request.split()
+            if len(parts) >= 2 and parts[1] == b"/metrics":
+                body = self.prometheus().encode("utf-8")
+                status = b"200 OK"
+            else:
+                body = b"not found; try /metrics\n"
+                status = b"404 Not Found"
+            writer.write(b"HTTP/1.0 " + status + b"\r\n"
+                         b"Content-Type: text/plain; version=0.0.4\r\n"
+                         b"Content-Length: " + str(len(body)).encode() + b"\r\n\r\n" + body)
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+class SessionMetrics:
+    """Records one session into the shared Metrics and, when profiling,
+    into a Metrics of its own as well."""
+
+    __slots__ = ("targets", "profile", "started")
+
+    def __init__(self, metrics, profile=False):
+        self.profile = Metrics() if profile else None
+        self.targets = (metrics,) if self.profile is None else (metrics, self.profile)
+        self.started = time.perf_counter()
+
+    def scene(self, name, seconds):
+        for metrics in self.targets:
+            metrics.scene_entries[name] = metrics.scene_entries.get(name, 0) + 1
+            metrics.scene_seconds[name] = metrics.scene_seconds.get(name, 0.0) + seconds
+
+    def answer(self, seconds, timed=False, timed_out=False):
+        for metrics in self.targets:
+            if timed:
+                metrics.timed_choices += 1
+                if timed_out:
+                    metrics.timeouts += 1
+                    continue
+            metrics.answer_seconds["timed" if timed else "prompt"].observe(seconds)
+
+    def typing(self, seconds):
+        for metrics in self.targets:
+            metrics.typing_seconds += seconds
+
+    def combat_turn(self):
+        for metrics in self.targets:
+            metrics.combat_turns += 1
+
+    def fight(self, won):
+        for metrics in self.targets:
+            metrics.fights["won" if won else "lost"] += 1
+
+    def report(self):
+        """Returns this session's profile as text, or "" when not profiling."""
+        own = self.profile
+        if own is None:
+            return ""
+        lines = [f"session profile ({time.perf_counter() - self.started:.1f} s):",
+                 f"  {'scene':<22}{'entries':>8}{'seconds':>10}"]
+        for scene, count in own.scene_entries.items():
+            lines.append(f"  {scene:<22}{count:>8}{own.scene_seconds[scene]:>10.2f}")
+        answers = own.answer_seconds["prompt"]
+        timed = own.answer_seconds["timed"]
+        lines.append(f"  answers: {answers.count}, {answers.sum:.1f} s waiting; "
+                     f"timed choices: {own.timed_choices}, {own.timeouts} ran out, "
+                     f"{timed.sum:.1f} s waiting")
+        lines.append(f"  typing: {own.typing_seconds:.1f} s; combat turns: {own.combat_turns}; "
+                     f"fights won/lost: {own.fights['won']}/{own.fights['lost']}")
+        return "\n".join(lines)
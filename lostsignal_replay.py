@@ -0,0 +1,134 @@
+"""Record and replay Lost Signal sessions.
+
+A recording is the session's RNG seed followed by every answer the player
+gave, appended the moment they give it, so even a crashed session leaves
+a usable log. Each answer is stored with a checksum of the prompt it
+answered and whether it was a timed choice that ran out.
+
+Replaying feeds the answers back to a fresh session with the same seed,
+with no typewriter delays, and stops at the first prompt that differs
+from the recording.
+
+Record:  python lostsignalgame.py --record run.lsr
+Replay:  python lostsignalgame.py --replay run.lsr
+"""
+
+import struct
+import zlib
+from collections import deque
+
+MAGIC = b"LSRP"
+VERSION = 2                         # 2: answer lengths widened to 32 bits
+HEADER = struct.Struct("<4sBQ")     # magic, version, seed
+RECORD = struct.Struct("<BII")      # kind, prompt crc32, answer length
+
+# Record kinds.
+ANSWER, TIMED, TIMEOUT = 0, 1, 2
+
+
+def prompt_crc(prompt):
+    return zlib.crc32(prompt.encode("utf-8"))
+
+
+class ReplayDivergence(Exception):
+    """The game asked something the recording did not answer."""
+
+
+class InputLog:
+    """Appends a session's inputs to a recording file as they happen."""
+
+    def __init__(self, path, seed):
+        self.file = open(path, "wb")
+        self.file.write(HEADER.pack(MAGIC, VERSION, seed))
+        self.file.flush()
+        self.count = 0
+
+    def record(self, prompt, line, timed=False):
+        """Records one answer. line is None for a timed choice that ran out."""
+        if line is None:
+            kind, answer = TIMEOUT, b""
+        else:
+            kind, answer = (TIMED if timed else ANSWER), line.encode("utf-8")
+        self.file.write(RECORD.pack(kind, prompt_crc(prompt), len(answer)) + answer)
+        self.file.flush()
+        self.count += 1
+
+    def close(self):
+        self.file.close()
+
+
+def read_log(path):
+    """Returns (seed, records) from a recording, where each record is
+    (kind, prompt crc32, answer). A record cut short by a crash is dropped."""
+    with open(path, "rb") as f:
+        data = f.read()
+
+    if len(data) < HEADER.size:
+        raise ValueError(f"{path} is not a Lost Signal recording")
+    magic, version, seed = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a version {VERSION} Lost Signal recording")
+
+    records = []
+    pos = HEADER.size
+    while pos + RECORD.size <= len(data):
+        kind, crc, length = RECORD.unpack_from(data, pos)
+        pos += RECORD.size
+        if pos + length > len(data):
+            break
+        records.append((kind, crc, data[pos:pos + length].decode("utf-8")))
+        pos += length
+
+    return seed, records
+
+
+class ReplayIO:
+    """Plays a recording back into a session, instantly.
+
+    Output goes to `out` if given (a file-like object) and is dropped
+    otherwise. Raises ReplayDivergence when the game asks a question the
+    recording didn't answer, and EOFError when the recording runs out.
+    """
+
+    def __init__(self, records, out=None):
+        self.records = deque(records)
+        self.out = out
+        self.scene = None
+        self.speed = 0
+        self.count = 0          # inputs replayed so far
+        self.last_line = ""     # timed prompts are said just before they're asked
+
+    def _write(self, text):
+        if self.out is not None:
+            self.out.write(text)
+
+    async def say(self, text, delay=0.02):
+        self.last_line = text
+        self._write(text + "\n")
+
+    async def show(self, text=""):
+        self._write(text + "\n")
+
+    async def ask(self, prompt=""):
+        self._write(prompt)
+        return self._next(prompt, timed=False)
+
+    async def ask_timed(self, timeout):
+        return self._next(self.last_line, timed=True)
+
+    def _next(self, prompt, timed):
+        if not self.records:
+            raise EOFError("end of recording")
+
+        kind, crc, answer = self.records.popleft()
+        self.count += 1
+        if (kind != ANSWER) != timed or crc != prompt_crc(prompt):
+            raise ReplayDivergence(
+                f"input {self.count}, scene {self.scene}: the game asked "
+                f"{prompt.strip()!r}, which is not the prompt that was recorded")
+
+        if kind == TIMEOUT:
+            self._write("(no answer in time)\n")
+            return None
+        self._write(answer.rstrip("\n") + "\n")
+        return answer
@@ -0,0 +1,158 @@
+"""Save files for Lost Signal.
+
+A save is two files. The snapshot (the path you give) holds the whole
+session: seed, flags and inventory, with each item stored as its id
+(its position in lostsignalgame.ITEMS) plus its uses left. The journal
+(path + ".journal") gets one 4-byte delta appended for every change
+after that: an item picked up, discarded or used, or a flag set. Every
+COMPACT_EVERY deltas the journal is folded into a new snapshot and
+started over.
+
+Snapshot and journal carry a generation number. A new snapshot is
+written beside the old one and renamed over it before the journal is
+reset, so a crash at any point leaves either the old snapshot and its
+journal or the new snapshot and a journal from the old generation,
+which is ignored.
+
+Resuming puts the player back at the main menu with everything they
+had, the same as after being captured.
+
+Play with:  python lostsignalgame.py --save slot1.lss
+"""
+
+import os
+import struct
+
+MAGIC = b"LSSV"
+JOURNAL_MAGIC = b"LSJN"
+VERSION = 1
+HEADER = struct.Struct("<4sBQIBB")      # magic, version, seed, generation, flags, item count
+ITEM = struct.Struct("<BH")             # item id, uses
+JOURNAL_HEADER = struct.Struct("<4sBI")  # magic, version, generation
+DELTA = struct.Struct("<BBH")           # op, item id or flag, value
+
+# Delta ops.
+PICK_UP, DISCARD, USES, FLAG = range(4)
+
+FLAGS = ("badge_buff", "basement_unlocked", "clone_defeated")
+COMPACT_EVERY = 64
+
+
+def journal_path(path):
+    return path + ".journal"
+
+
+def _item(items, item_id):
+    if item_id >= len(items):
+        raise ValueError(f"unknown item id {item_id}; is the save from a newer version?")
+    return items[item_id]
+
+
+def load(path, session, items):
+    """Restores a save file and its journal into a new session, where
+    items is the game's item list. Returns the save's generation, for
+    Autosave."""
+    with open(path, "rb") as f:
+        data = f.read()
+
+    if len(data) < HEADER.size:
+        raise ValueError(f"{path} is not a Lost Signal save")
+    magic, version, seed, generation, flags, count = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a version {VERSION} Lost Signal save")
+
+    session.seed = seed
+    session.rng = None
+    for bit, name in enumerate(FLAGS):
+        setattr(session, name, bool(flags & (1 << bit)))
+    inventory = session.inventory
+    for item_id, uses in ITEM.iter_unpack(data[HEADER.size:HEADER.size + count * ITEM.size]):
+        inventory.add(_item(items, item_id), uses)
+
+    try:
+        with open(journal_path(path), "rb") as f:
+            journal = f.read()
+    except FileNotFoundError:
+        return generation
+
+    if len(journal) < JOURNAL_HEADER.size:
+        return generation
+    magic, version, journal_generation = JOURNAL_HEADER.unpack_from(journal, 0)
+    if magic != JOURNAL_MAGIC or version != VERSION or journal_generation != generation:
+        return generation    # left over from before the last compaction
+
+    end = JOURNAL_HEADER.size + (len(journal) - JOURNAL_HEADER.size) // DELTA.size * DELTA.size
+    for op, target, value in DELTA.iter_unpack(journal[JOURNAL_HEADER.size:end]):
+        if op == PICK_UP:
+            inventory.add(_item(items, target), value)
+        elif op == DISCARD:
+            inventory.remove(_item(items, target))
+        elif op == USES:
+            if value:
+                inventory.set_uses(_item(items, target), value)
+            else:
+                inventory.remove(_item(items, target))
+        elif op == FLAG:
+            setattr(session, FLAGS[target], bool(value))
+
+    return generation
+
+
+class Autosave:
+    """Journals every change to a session as it happens."""
+
+    def __init__(self, path, session, generation=0, compact_every=COMPACT_EVERY):
+        self.path = path
+        self.session = session
+        self.generation = generation
+        self.compact_every = compact_every
+        self.journal = None
+        self.count = 0        # deltas in the journal
+        self.compact()
+
+    def pick_up(self, item, uses):
+        self._append(PICK_UP, item.id, uses)
+
+    def discard(self, item):
+        self._append(DISCARD, item.id, 0)
+
+    def uses(self, item, uses):
+        """Records an item's uses going down. 0 means it is gone."""
+        self._append(USES, item.id, uses)
+
+    def flag(self, name, value):
+        self._append(FLAG, FLAGS.index(name), value)
+
+    def _append(self, op, target, value):
+        self.journal.write(DELTA.pack(op, target, value))
+        self.journal.flush()
+        self.count += 1
+        if self.count >= self.compact_every:
+            self.compact()
+
+    def compact(self):
+        """Writes the whole session as a new snapshot and starts an empty
+        journal for it."""
+        session = self.session
+        self.generation += 1
+        flags = sum(1 << bit for bit, name in enumerate(FLAGS) if getattr(session, name))
+        items = b"".join(ITEM.pack(item.id, session.inventory.uses_left(item))
+                         for item in session.inventory)
+
+        temp = self.path + ".tmp"
+        with open(temp, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, session.seed, self.generation,
+                                flags, len(session.inventory)) + items)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, self.path)
+
+        if self.journal is not None:
+            self.journal.close()
+        self.journal = open(journal_path(self.path), "wb")
+        self.journal.write(JOURNAL_HEADER.pack(JOURNAL_MAGIC, VERSION, self.generation))
+        self.journal.flush()
+        self.count = 0
+
+    def close(self):
+        self.journal.close()
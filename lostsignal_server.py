@@ -0,0 +1,861 @@
+"""Multi-player Lost Signal server.
+
+Every TCP (or telnet) connection gets its own GameSession, and one asyncio
+event loop runs them all. Typewriter pauses are asyncio.sleep and timed
+raid choices wait on that connection alone, so no player blocks another.
+
+One event loop uses one core. With --workers, sessions are spread over
+a pool of worker processes instead, each running its own event loop (see
+WorkerPool).
+
+Run with:  python lostsignal_server.py --port 4000
+           python lostsignal_server.py --port 4000 --workers 0   (one per core)
+           python lostsignal_server.py --port 4000 --store players.db
+           python lostsignal_server.py --port 4000 --events events/
+Connect:   telnet localhost 4000
+"""
+
+import argparse
+import asyncio
+import math
+import multiprocessing
+import os
+import re
+import signal
+import socket
+import sqlite3
+import sys
+import time
+import zlib
+from collections import deque
+
+import lostsignalgame as game
+import lostsignal_metrics
+import lostsignal_replay
+import lostsignal_store
+import lostsignal_telemetry
+
+
+LATENCIES = deque(maxlen=100_000)   # seconds from a player's answer to the first byte of the reply
+
+OUTPUT_HIGH_WATER = 16 * 1024   # bytes a client may fall behind before its session waits
+DRAIN_TIMEOUT = 30              # seconds a session waits on a client that stopped reading
+LINE_LIMIT = 4096               # longest line a player can send
+
+# Telnet bytes for MCCP2 (compression negotiated in-band, as MUD clients do).
+IAC, SE, SB, WILL, WONT, DO, DONT = 255, 240, 250, 251, 252, 253, 254
+COMPRESS2 = 86
+
+CALLSIGN = re.compile(r"[A-Za-z0-9_-]{1,20}")
+LOGIN_PROMPT = "Callsign: "
+
+
+def percentile(values, pct):
+    """Returns the pct-th percentile of values (nearest rank)."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(len(ordered) * pct / 100))
+    return ordered[index]
+
+
+# ============================================================
+#                   DEADLINE SCHEDULER
+# ============================================================
+
+class Deadline:
+    """A pending timed choice in a TimerWheel."""
+
+    __slots__ = ("due", "callback", "slot", "rounds", "fired")
+
+    def __init__(self, due, callback):
+        self.due = due
+        self.callback = callback
+        self.slot = None
+        self.rounds = 0
+        self.fired = False
+
+
+class TimerWheel:
+    """Hashed timing wheel shared by every session's timed choices.
+
+    Each deadline sits in the slot for the tick it falls due in (a dict, so
+    cancelling when the player answers is O(1)). One loop callback per tick
+    fires everything due in that slot as a batch, and the wheel stops
+    ticking while nothing is pending. Deadlines fire up to one tick late.
+    """
+
+    def __init__(self, tick=0.05, slots=256):
+        self.tick = tick
+        self.slots = [{} for _ in range(slots)]
+        self.loop = None
+        self.origin = None      # loop time of tick 0
+        self.ticks = 0          # ticks processed so far
+        self.pending = 0
+        self.handle = None
+
+        self.scheduled = 0
+        self.cancelled = 0
+        self.fired = 0
+        self.late_total = 0.0
+        self.late_max = 0.0
+        self.busy = 0.0         # seconds spent inside tick callbacks
+        self.batches = 0
+
+    def schedule(self, delay, callback):
+        """Calls callback() once `delay` seconds have passed."""
+        if self.loop is None:
+            self.loop = asyncio.get_running_loop()
+            self.origin = self.loop.time()
+        if self.handle is None:
+            # The wheel was idle, so skip the ticks that passed meanwhile.
+            self.ticks = max(self.ticks, int((self.loop.time() - self.origin) / self.tick))
+
+        deadline = Deadline(self.loop.time() + delay, callback)
+        target = max(self.ticks + 1, math.ceil((deadline.due - self.origin) / self.tick))
+        deadline.slot = target % len(self.slots)
+        deadline.rounds = (target - self.ticks - 1) // len(self.slots)
+        self.slots[deadline.slot][deadline] = None
+
+        self.pending += 1
+        self.scheduled += 1
+        if self.handle is None:
+            self._arm()
+        return deadline
+
+    def cancel(self, deadline):
+        if deadline.slot is None:
+            return
+        del self.slots[deadline.slot][deadline]
+        deadline.slot = None
+        self.pending -= 1
+        self.cancelled += 1
+
+    def _arm(self):
+        when = self.origin + (self.ticks + 1) * self.tick
+        self.handle = self.loop.call_at(when, self._on_tick)
+
+    def _on_tick(self):
+        started = time.perf_counter()
+        now = self.loop.time()
+
+        while self.pending and self.origin + (self.ticks + 1) * self.tick <= now:
+            self.ticks += 1
+            slot = self.slots[self.ticks % len(self.slots)]
+            due = [d for d in slot if d.rounds == 0]
+            for deadline in slot:
+                deadline.rounds -= 1
+            for deadline in due:
+                del slot[deadline]
+                deadline.slot = None
+                deadline.fired = True
+                late = now - deadline.due
+                self.late_total += late
+                self.late_max = max(self.late_max, late)
+                deadline.callback()
+            self.pending -= len(due)
+            self.fired += len(due)
+
+        self.batches += 1
+        self.busy += time.perf_counter() - started
+        self.handle = None
+        if self.pending:
+            self._arm()
+
+    def metrics(self):
+        return {
+            "scheduled": self.scheduled,
+            "cancelled": self.cancelled,
+            "fired": self.fired,
+            "pending": self.pending,
+            "late_avg_ms": self.late_total / self.fired * 1000 if self.fired else 0.0,
+            "late_max_ms": self.late_max * 1000,
+            "batches": self.batches,
+            "busy_ms": self.busy * 1000,
+            "busy_per_batch_us": self.busy / self.batches * 1e6 if self.batches else 0.0,
+        }
+
+
+# ============================================================
+#                   CONNECTION I/O
+# ============================================================
+
+class OutputStats:
+    """What sessions wrote, per scene: the writes the game asked for and
+    the bytes in them, next to the socket sends and bytes on the wire once
+    coalesced (and compressed)."""
+
+    def __init__(self):
+        self.scenes = {}    # {scene: [writes, bytes, sends, wire bytes]}
+
+    def metrics(self):
+        writes, size, sends, wire = (sum(column) for column in zip(*self.scenes.values())) \
+            if self.scenes else (0, 0, 0, 0)
+        return {
+            "writes": writes,
+            "sends": sends,
+            "kb": size / 1024,
+            "wire_kb": wire / 1024,
+            "writes_per_send": writes / sends if sends else 0.0,
+            "wire_ratio": wire / size if size else 0.0,
+        }
+
+    def report(self):
+        print(f"\n{'scene':<22}{'writes':>9}{'sends':>9}{'bytes':>11}{'wire bytes':>12}")
+        for name, (writes, size, sends, wire) in sorted(self.scenes.items(), key=str):
+            print(f"{name or '-':<22}{writes:>9}{sends:>9}{size:>11}{wire:>12}")
+        print("output:", ", ".join(f"{name} {value:g}" for name, value in self.metrics().items()))
+
+
+class StreamIO(game.Typewriter):
+    """Game I/O for one asyncio connection.
+
+    A small reader task queues the player's lines as they arrive, so a
+    timed choice just waits for the next queued line or its deadline in the
+    shared TimerWheel, whichever comes first. Pressing Enter while a line
+    is typing skips to its end, as on the console.
+
+    Output is queued and sent in one write whenever the session is about
+    to wait (for the next frame or for the player), so a menu or a burst of
+    instant lines is one packet instead of one per line. A client that
+    stops reading holds at most OUTPUT_HIGH_WATER bytes before its session
+    waits for it, and is dropped after DRAIN_TIMEOUT.
+
+    With compress, the connection offers MCCP2; if the client accepts,
+    everything after is one deflate stream, flushed at each send. That
+    pays off at instant speed; a typed frame is only a few bytes, less
+    than the flush costs.
+    """
+
+    def __init__(self, reader, writer, wheel, fps=25, speed=1.0, compress=False, output=None):
+        super().__init__(fps, speed)
+        self.reader = reader
+        self.writer = writer
+        self.wheel = wheel
+        self.output = OutputStats() if output is None else output
+        self.queued = []
+        self.counts = None      # the OutputStats row of the scene the queued output is from
+        self.deflate = None
+        self.lines = deque()
+        self.waiter = None
+        self.closed = False
+        self.answered_at = None
+        writer.transport.set_write_buffer_limits(OUTPUT_HIGH_WATER)
+        if compress:
+            writer.write(bytes((IAC, WILL, COMPRESS2)))
+        self.pump = asyncio.ensure_future(self._pump())
+
+    async def _pump(self):
+        pending = b""
+        while True:
+            try:
+                data = await self.reader.read(4096)
+            except ConnectionError:
+                data = b""
+            if data:
+                *lines, pending = self._telnet(pending + data).split(b"\n")
+                self.lines.extend(line.decode("utf-8", "replace") + "\n" for line in lines)
+            if not data or len(pending) > LINE_LIMIT:
+                self.closed = True
+                self._wake()
+                return
+            self._wake()
+
+    def _telnet(self, data):
+        """Strips telnet commands out of the player's input, acting on the
+        answer to a compression offer. An unfinished command at the end is
+        left for the next read to complete."""
+        if IAC not in data:
+            return data
+        text = bytearray()
+        pos = 0
+        while pos < len(data):
+            if data[pos] != IAC:
+                text.append(data[pos])
+                pos += 1
+                continue
+            if pos + 1 == len(data):
+                break
+            verb = data[pos + 1]
+            if verb == IAC:
+                text.append(IAC)
+                pos += 2
+            elif verb in (WILL, WONT, DO, DONT):
+                if pos + 2 == len(data):
+                    break
+                if verb == DO and data[pos + 2] == COMPRESS2 and self.deflate is None:
+                    self._compress()
+                pos += 3
+            elif verb == SB:
+                end = data.find(bytes((IAC, SE)), pos)
+                if end < 0:
+                    break
+                pos = end + 2
+            else:
+                pos += 2
+        return bytes(text) + data[pos:]
+
+    def _compress(self):
+        self._flush()
+        self.writer.write(bytes((IAC, SB, COMPRESS2, IAC, SE)))
+        # A 4 KB window and small memLevel keep each stream's state near 32 KB.
+        self.deflate = zlib.compressobj(6, zlib.DEFLATED, 12, 5)
+
+    def _wake(self):
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+    encodes = True
+
+    def encode(self, text):
+        return text.replace("\n", "\r\n").encode("utf-8")
+
+    def _send(self, data):
+        if self.queued and self.counts is not self.output.scenes.get(self.scene):
+            self._flush()       # so each send is counted against one scene
+        if not self.queued:
+            self.counts = self.output.scenes.get(self.scene)
+            if self.counts is None:
+                self.counts = self.output.scenes[self.scene] = [0, 0, 0, 0]
+        self.queued.append(data)
+        self.counts[0] += 1
+        self.counts[1] += len(data)
+
+    def _flush(self):
+        """Sends everything queued in one write."""
+        if not self.queued:
+            return
+        data = b"".join(self.queued) if len(self.queued) > 1 else self.queued[0]
+        self.queued.clear()
+        if self.deflate is not None:
+            data = self.deflate.compress(data) + self.deflate.flush(zlib.Z_SYNC_FLUSH)
+        if self.answered_at is not None:
+            LATENCIES.append(time.perf_counter() - self.answered_at)
+            self.answered_at = None
+        self.counts[2] += 1
+        self.counts[3] += len(data)
+        self.writer.write(data)
+
+    async def drain(self):
+        """Sends what's queued, then waits while the client is too far behind."""
+        self._flush()
+        if self.closed:
+            raise ConnectionResetError("player disconnected")
+        if self.writer.transport.get_write_buffer_size() > OUTPUT_HIGH_WATER:
+            try:
+                await asyncio.wait_for(self.writer.drain(), DRAIN_TIMEOUT)
+            except asyncio.TimeoutError:
+                raise ConnectionResetError("player stopped reading") from None
+
+    async def _next_line(self, timeout=None):
+        """Returns the player's next line, or None once timeout runs out."""
+        timer = None if timeout is None else self.wheel.schedule(timeout, self._wake)
+        try:
+            while not self.lines:
+                if self.closed:
+                    raise ConnectionResetError("player disconnected")
+                if timer is not None and timer.fired:
+                    return None
+
+                self.waiter = asyncio.get_running_loop().create_future()
+                try:
+                    await self.waiter
+                finally:
+                    self.waiter = None
+        finally:
+            if timer is not None:
+                self.wheel.cancel(timer)
+
+        self.answered_at = time.perf_counter()
+        return self.lines.popleft()
+
+    async def say(self, text, delay=0.02):
+        frames = self.frames(text, delay)
+        for index, (chunk, pause) in enumerate(frames):
+            self._send(chunk)
+            if pause:
+                await self.drain()
+                await asyncio.sleep(pause)
+                if self.lines:
+                    self.lines.popleft()
+                    self._send(frames.rest(index))
+                    break
+
+    async def show(self, text=""):
+        self._send(self.cached(text).data)
+
+    async def ask(self, prompt=""):
+        self._send(self.cached(prompt, end="").data)
+        await self.drain()
+        return await self._next_line()
+
+    async def ask_timed(self, timeout):
+        await self.drain()
+        return await self._next_line(timeout)
+
+    def close(self):
+        self.pump.cancel()
+        self._flush()
+        self.writer.close()
+
+
+# ============================================================
+#                   SERVER
+# ============================================================
+
+class GameServer:
+    """Accepts connections and runs one game session per connection."""
+
+    def __init__(self, fps=25, speed=1.0, record_dir=None, metrics=None, profile_every=0,
+                 compress=False, store=None, events=None):
+        self.fps = fps
+        self.speed = speed
+        self.compress = compress        # offer MCCP2 compression to every client
+        self.record_dir = record_dir    # one recording per session, for bug reports
+        self.metrics = metrics          # lostsignal_metrics.Metrics, or None for no instrumentation
+        self.profile_every = profile_every  # print the profile of every Nth session
+        self.store = store              # lostsignal_store.Store, or None for no saved players
+        self.events = events            # lostsignal_telemetry.Telemetry, or None for no telemetry
+        self.players = set()            # callsigns playing in this process
+        self.sessions = 0
+        self.served = 0
+        self.wheel = TimerWheel()
+        self.output = OutputStats()
+        self.preloaded = None           # the content version whose lines are pinned in the frame cache
+        self.playing = set()            # session tasks; the loop only holds weak references
+
+    async def handle(self, reader, writer):
+        io = StreamIO(reader, writer, self.wheel, self.fps, self.speed, self.compress,
+                      self.output)
+        if self.preloaded is not game.CONTENT:      # the first session, or the first since a reload
+            self.preloaded = game.CONTENT
+            io.preload(game.CONTENT)
+        self.sessions += 1
+        self.served += 1
+        number = self.served
+        session = game.GameSession(io)
+        name = None
+        try:
+            if self.store is not None:
+                name = await self.login(io, session)
+                if name is None:
+                    await io.drain()
+                    return
+            # After login: a returning player's seed is the one they started with.
+            if self.record_dir is not None:
+                path = os.path.join(self.record_dir, f"session-{number}-{session.seed}.lsr")
+                session.log = lostsignal_replay.InputLog(path, session.seed)
+            if self.metrics is not None:
+                profile = self.profile_every and number % self.profile_every == 0
+                session.metrics = self.metrics.session(profile)
+            if self.events is not None:
+                session.events = self.events.session()
+            await game.run_game(session)
+            await io.drain()
+        except (ConnectionError, EOFError):
+            pass        # the player left; a CancelledError goes on up once we've cleaned up
+        finally:
+            self.sessions -= 1
+            io.close()
+            if name is not None:
+                self.players.discard(name)
+            if session.log is not None:
+                session.log.close()
+            if session.metrics is not None and session.metrics.profile is not None:
+                print(f"session {number}: " + session.metrics.report())
+
+    async def login(self, io, session):
+        """Asks for a callsign until it gets one that isn't already playing,
+        then restores that player from the store and saves to it from now on.
+        Returns None, having told the player, if the store can't load them.
+        Only this process's players count as playing: with --workers, the
+        same callsign on two workers would overwrite each other's saves."""
+        while True:
+            name = (await io.ask(LOGIN_PROMPT)).strip()
+            if not CALLSIGN.fullmatch(name):
+                await io.show("Up to 20 letters, digits, - or _.")
+            elif name in self.players:
+                await io.show(f"{name} is already on this channel.")
+            else:
+                break
+        self.players.add(name)
+        loop = asyncio.get_running_loop()
+        try:
+            found = await loop.run_in_executor(None, self.store.load, name, session, game.ITEMS)
+        except (sqlite3.Error, ValueError) as error:
+            self.players.discard(name)
+            print(f"[store] could not load {name}: {error}", file=sys.stderr)
+            await io.show("The signal breaks up. Try again later.")
+            return None
+        except BaseException:       # cancelled: the name is free again
+            self.players.discard(name)
+            raise
+        session.save = self.store.player(name, session)
+        await io.show(f"Welcome back, {name}." if found else f"Logged in as {name}.")
+        return name
+
+    async def start(self, host="127.0.0.1", port=4000, backlog=1024):
+        return await asyncio.start_server(self._connected, host, port, backlog=backlog)
+
+    def _connected(self, reader, writer):
+        # A task of our own rather than start_server's, which on Python 3.11
+        # logs every session cancelled at shutdown as an error.
+        task = asyncio.ensure_future(self.handle(reader, writer))
+        self.playing.add(task)
+        task.add_done_callback(self.playing.discard)
+
+    async def adopt(self, control):
+        """Runs a session for every connection a WorkerPool passes in over
+        `control`, until the pool closes it. Reports each session that
+        ends back over `control`."""
+        loop = asyncio.get_running_loop()
+        closed = loop.create_future()
+        playing = set()     # the loop only holds weak references to tasks
+
+        def receive():
+            try:
+                _, fds, _, _ = socket.recv_fds(control, 1, 1)
+            except ConnectionError:
+                fds = None
+            if not fds:
+                loop.remove_reader(control.fileno())
+                closed.set_result(None)
+                return
+            task = asyncio.ensure_future(self._adopted(socket.socket(fileno=fds[0]), control))
+            playing.add(task)
+            task.add_done_callback(playing.discard)
+
+        loop.add_reader(control.fileno(), receive)
+        control.send(b"+")
+        await closed
+
+    async def _adopted(self, conn, control):
+        try:
+            reader, writer = await asyncio.open_connection(sock=conn)
+            await self.handle(reader, writer)
+        finally:
+            try:
+                control.send(b"-")
+            except OSError:
+                pass    # the pool is gone
+
+
+# ============================================================
+#                   WORKER POOL
+# ============================================================
+
+class Worker:
+    """A worker process, as the front end sees it."""
+
+    __slots__ = ("number", "process", "control", "ready", "sessions", "handed")
+
+    def __init__(self, number, process, control, ready):
+        self.number = number
+        self.process = process
+        self.control = control      # Unix socket for passing connections in
+        self.ready = ready          # future done once the worker is up
+        self.sessions = 0           # live sessions
+        self.handed = 0             # connections handed to it in all
+
+
+def run_worker(number, control, frame_cache, fps, speed, record_dir, profile_every, quiet,
+               watch, compress, store_path, events_dir):
+    """Main function of a worker process: one GameServer on its own loop."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)   # the front end shuts workers down
+    game.FRAMES.max_bytes = frame_cache
+    if watch:
+        game.watch_content()     # each worker reloads its own copy
+    if record_dir is not None:
+        record_dir = os.path.join(record_dir, f"worker-{number}")
+        os.makedirs(record_dir, exist_ok=True)
+    metrics = lostsignal_metrics.Metrics() if profile_every else None
+    # Each worker has its own pool on the shared database; WAL lets them
+    # all read while one commits.
+    store = None if store_path is None else lostsignal_store.Store(store_path)
+    events = (None if events_dir is None
+              else lostsignal_telemetry.Telemetry(events_dir, f"worker{number}"))
+    server = GameServer(fps, speed, record_dir, metrics, profile_every, compress, store, events)
+    try:
+        asyncio.run(server.adopt(control))
+    finally:
+        if store is not None:
+            store.close()
+        if events is not None:
+            events.close()
+    if not quiet:
+        print(f"worker {number}: {server.served} sessions served. {latency_report()}")
+        print(f"worker {number} output:", ", ".join(f"{name} {value:g}"
+                                                    for name, value in server.output.metrics().items()))
+        if events is not None:
+            print(f"worker {number} events:", ", ".join(f"{name} {value:g}"
+                                                        for name, value in events.metrics().items()))
+        if store is not None:
+            print(f"worker {number} store:", ", ".join(f"{name} {value:g}"
+                                                       for name, value in store.metrics().items()))
+
+
+def _send_connection(control, conn):
+    """Sends conn down a worker's control socket, then closes our copy."""
+    with conn:
+        socket.send_fds(control, [b"c"], [conn.fileno()])
+
+
+class WorkerPool:
+    """Spreads sessions over worker processes, each with a GameServer.
+
+    The front end accepts every connection itself and passes the socket to
+    the worker with the fewest live sessions, over a Unix socket pair, so
+    a session stays in the worker it started in for its whole life.
+    Workers report each session that ends. A worker that dies takes only
+    its own sessions with it, and a new one is started in its place.
+    """
+
+    def __init__(self, workers, fps=25, speed=1.0, record_dir=None, profile_every=0,
+                 quiet=False, watch=False, compress=False, store_path=None, events_dir=None):
+        self.size = workers
+        self.settings = (fps, speed, record_dir, profile_every, quiet, watch, compress,
+                         store_path, events_dir)
+        self.context = multiprocessing.get_context("spawn")
+        self.workers = []
+        self.listener = None
+        self.acceptor = None
+        self.handing = set()    # connections on their way to a worker
+        self.closing = False
+        self.served = 0
+        self.dropped = 0        # sessions lost with a worker that died
+        self.restarts = 0
+
+    def _spawn(self, number):
+        front, back = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        process = self.context.Process(
+            target=run_worker, name=f"lostsignal-worker-{number}", daemon=True,
+            args=(number, back, game.FRAMES.max_bytes) + self.settings)
+        process.start()
+        back.close()
+        loop = asyncio.get_running_loop()
+        worker = Worker(number, process, front, loop.create_future())
+        loop.add_reader(front.fileno(), self._on_report, worker)
+        return worker
+
+    async def start(self, host="127.0.0.1", port=4000, backlog=1024):
+        """Starts the workers and, once they are all up, starts accepting.
+        Returns the address listened on."""
+        self.workers = [self._spawn(number) for number in range(self.size)]
+        await asyncio.gather(*(worker.ready for worker in self.workers))
+        self.listener = socket.create_server((host, port), backlog=backlog)
+        self.listener.setblocking(False)
+        self.acceptor = asyncio.ensure_future(self._accept())
+        return self.listener.getsockname()
+
+    async def _accept(self):
+        while True:
+            conn, _ = await asyncio.get_running_loop().sock_accept(self.listener)
+            worker = min(self.workers, key=lambda worker: worker.sessions)
+            worker.sessions += 1
+            worker.handed += 1
+            task = asyncio.ensure_future(self._hand(worker, conn))
+            self.handing.add(task)
+            task.add_done_callback(self.handing.discard)
+
+    async def _hand(self, worker, conn):
+        """Passes conn to the worker from a thread: the send blocks while
+        the worker's control buffer is full, and must not hold up accepts."""
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                None, _send_connection, worker.control, conn)
+        except OSError:
+            # It died just now. If _on_report hasn't seen that yet, take this
+            # one off its count, so it is dropped once.
+            if worker.control.fileno() != -1:
+                worker.sessions -= 1
+                worker.handed -= 1
+                self.dropped += 1
+
+    def _on_report(self, worker):
+        try:
+            report = worker.control.recv(16)
+        except ConnectionError:
+            report = b""
+        if report == b"+":
+            worker.ready.set_result(None)
+            return
+        if report:
+            worker.sessions -= 1
+            self.served += 1
+            return
+
+        # The worker is gone, and its connections were closed with it.
+        asyncio.get_running_loop().remove_reader(worker.control.fileno())
+        worker.control.close()
+        worker.process.join()
+        self.dropped += worker.sessions
+        if self.closing:
+            return
+        if not worker.ready.done():
+            # One that cannot even start would only fail again.
+            self.workers.remove(worker)
+            worker.ready.set_exception(RuntimeError(
+                f"worker {worker.number} exited with code {worker.process.exitcode} "
+                "before it was up"))
+            return
+        print(f"worker {worker.number} exited with code {worker.process.exitcode}, "
+              f"dropping {worker.sessions} sessions; starting another")
+        self.workers[self.workers.index(worker)] = self._spawn(worker.number)
+        self.restarts += 1
+
+    def close(self, timeout=5):
+        """Stops accepting and shuts every worker down, cutting off the
+        sessions still playing."""
+        self.closing = True
+        if self.acceptor is not None:
+            self.acceptor.cancel()
+            self.listener.close()
+        loop = asyncio.get_running_loop()
+        for worker in self.workers:
+            if worker.control.fileno() != -1:
+                loop.remove_reader(worker.control.fileno())
+                worker.control.close()
+        for worker in self.workers:
+            worker.process.join(timeout)
+            if worker.process.is_alive():
+                worker.process.kill()
+
+    def metrics(self):
+        return {
+            "workers": self.size,
+            "served": self.served,
+            "playing": sum(worker.sessions for worker in self.workers),
+            "dropped": self.dropped,
+            "restarts": self.restarts,
+        }
+
+
+def latency_report():
+    values = list(LATENCIES)
+    return (f"{len(values)} replies: p50 {percentile(values, 50) * 1000:.2f} ms, "
+            f"p99 {percentile(values, 99) * 1000:.2f} ms, "
+            f"max {max(values, default=0) * 1000:.2f} ms")
+
+
+METRICS_EVERY = 15     # seconds between rewrites of --metrics-file
+
+
+async def serve_pool(workers, host, port, fps, speed, record_dir=None, profile_every=0,
+                     watch=False, compress=False, store_path=None, events_dir=None):
+    pool = WorkerPool(workers, fps, speed, record_dir, profile_every, watch=watch,
+                      compress=compress, store_path=store_path, events_dir=events_dir)
+    await pool.start(host, port)
+    print(f"Lost Signal server listening on {host}:{port} with {workers} worker processes")
+    try:
+        await pool.acceptor
+    finally:
+        pool.close()
+        print(f"\n{pool.served} sessions served. "
+              + ", ".join(f"{name} {value:g}" for name, value in pool.metrics().items()))
+        print("sessions per worker:", ", ".join(f"{worker.number}: {worker.handed}"
+                                                for worker in pool.workers))
+
+
+async def serve(host, port, fps, speed, record_dir=None,
+                metrics_file=None, metrics_port=None, profile_every=0, watch=False,
+                compress=False, store_path=None, events_dir=None):
+    metrics = writer = endpoint = watcher = store = events = None
+    if metrics_file or metrics_port or profile_every:
+        metrics = lostsignal_metrics.Metrics()
+    if metrics_file:
+        writer = asyncio.ensure_future(metrics.write_every(metrics_file, METRICS_EVERY))
+    if metrics_port:
+        endpoint = await metrics.serve(metrics_port)
+        print(f"Metrics at http://127.0.0.1:{metrics_port}/metrics")
+    if watch:
+        watcher = game.watch_content()
+    if store_path:
+        store = lostsignal_store.Store(store_path)
+    if events_dir:
+        events = lostsignal_telemetry.Telemetry(events_dir)
+
+    server = GameServer(fps, speed, record_dir, metrics, profile_every, compress, store, events)
+    listener = await server.start(host, port)
+    print(f"Lost Signal server listening on {host}:{port}")
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        if writer is not None:
+            writer.cancel()
+            metrics.write(metrics_file)
+        if endpoint is not None:
+            endpoint.close()
+        if server.served:
+            server.output.report()
+        print(f"\n{server.served} sessions served. {latency_report()}")
+        print("timed choices:", ", ".join(f"{name} {value:g}"
+                                          for name, value in server.wheel.metrics().items()))
+        print("frame cache:", ", ".join(f"{name} {value:g}"
+                                        for name, value in game.FRAMES.metrics().items()))
+        if watcher is not None:
+            print("content:", ", ".join(f"{name} {value:g}"
+                                        for name, value in watcher.metrics().items()))
+        if events is not None:
+            events.close()
+            print("events:", ", ".join(f"{name} {value:g}"
+                                       for name, value in events.metrics().items()))
+        if store is not None:
+            store.close()
+            print("store:", ", ".join(f"{name} {value:g}"
+                                      for name, value in store.metrics().items()))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lost Signal multi-player server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=4000)
+    parser.add_argument("--speed", choices=game.TEXT_SPEEDS, default="normal",
+                        help="how fast dialog is typed out")
+    parser.add_argument("--fps", type=int, default=25,
+                        help="typewriter frames per second")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes to spread sessions over (0 for one per core)")
+    parser.add_argument("--frame-cache", type=float, default=4, metavar="MB",
+                        help="memory cap for typewriter frames shared by all sessions (in each worker)")
+    parser.add_argument("--metrics-file", metavar="FILE",
+                        help=f"keep Prometheus metrics in FILE, rewritten every {METRICS_EVERY} s")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="serve Prometheus metrics at http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--profile-every", type=int, default=0, metavar="N",
+                        help="print where the time went for every Nth session")
+    parser.add_argument("--record", metavar="DIR",
+                        help="record every session's inputs into DIR "
+                             "(replay one with lostsignalgame.py --replay)")
+    parser.add_argument("--watch", action="store_true",
+                        help="reload lostsignal_content.txt whenever it's saved; "
+                             "sessions switch over at their next scene")
+    parser.add_argument("--compress", action="store_true",
+                        help="offer clients MCCP2 (deflate) compression, worth it with "
+                             "--speed instant; netcat-style clients will see its 3-byte offer")
+    parser.add_argument("--store", metavar="FILE",
+                        help="ask every player for a callsign and keep their inventory and "
+                             "progress in the SQLite database FILE, across restarts")
+    parser.add_argument("--events", metavar="DIR",
+                        help="record every passage players see and every answer into segment "
+                             "files in DIR (query them with lostsignal_telemetry.py)")
+    args = parser.parse_args()
+    workers = args.workers or os.cpu_count() or 1
+    if workers > 1 and (args.metrics_file or args.metrics_port):
+        parser.error("--metrics-file and --metrics-port need a single worker")
+
+    if args.record:
+        os.makedirs(args.record, exist_ok=True)
+    game.FRAMES.max_bytes = int(args.frame_cache * 1024 * 1024)
+    speed = game.TEXT_SPEEDS[args.speed]
+    try:
+        if workers > 1:
+            asyncio.run(serve_pool(workers, args.host, args.port, args.fps, speed,
+                                   args.record, args.profile_every, args.watch, args.compress,
+                                   args.store, args.events))
+        else:
+            asyncio.run(serve(args.host, args.port, args.fps, speed, args.record,
+                              args.metrics_file, args.metrics_port, args.profile_every,
+                              args.watch, args.compress, args.store, args.events))
+    except KeyboardInterrupt:
+        pass
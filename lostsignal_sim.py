@@ -0,0 +1,295 @@
+"""Headless combat simulator for balancing the clone fight.
+
+Runs the combat_system rules from lostsignalgame for many fights at once,
+one NumPy lane per fight, for a scripted player policy and loadout, and
+reports the win rate, how many turns the kill took and the HP left.
+The balance numbers (PLAYER_HP, CLONE_DAMAGE, MEDKIT_HEAL, ...) are read
+from the game, so tuning them there changes both.
+
+Needs numpy (pip install numpy). The game itself does not.
+
+Run with:  python lostsignal_sim.py --policy bottle,knife,attack --items knife,bottle,badge
+           python lostsignal_sim.py --check      (vectorized vs scalar rules)
+"""
+
+import argparse
+import random
+import time
+
+import numpy as np
+
+import lostsignalgame as game
+
+
+# Player actions. The item actions do nothing if the item is missing or
+# used up, which is what happens in the game when you pick one you lack.
+ACTIONS = ("attack", "defend", "knife", "bottle", "medkit", "badge", "pass")
+ATTACK, DEFEND, KNIFE, BOTTLE, MEDKIT, BADGE, PASS = range(len(ACTIONS))
+
+# Loadout names to inventory names.
+ITEMS = {
+    "knife": "discarded knife",
+    "bottle": "broken bottle",
+    "badge": "starfighter badge",
+    "medkit": "medkit",
+}
+
+MAX_TURNS = 64    # no fight lasts this long: the clone always deals at least 1
+
+
+# ============================================================
+#                   VECTORIZED FIGHTS
+# ============================================================
+
+def simulate(fights, policy=("attack",), items=(), heal_below=0,
+             seed=None, rolls=None, max_turns=MAX_TURNS):
+    """Simulates `fights` clone fights at once.
+
+    policy lists the player's action for each turn; the last one repeats.
+    With heal_below, the player uses the medkit instead whenever their HP
+    is at or under it and the medkit is still there. rolls, if given, is a
+    (fights, attacks) array of the clone's damage rolls, used in order per
+    fight; otherwise rolls are drawn from a generator seeded with seed.
+
+    Returns a dict of arrays with one entry per fight: won, finished,
+    turns, player_hp and clone_hp at the end.
+    """
+    plan = np.array([ACTIONS.index(action) for action in policy], dtype=np.int8)
+    damage = np.int16(game.ATTACK_DAMAGE + (game.BADGE_BONUS if "badge" in items else 0))
+    low, high = game.CLONE_DAMAGE
+    rng = np.random.default_rng(seed)
+    knife = "knife" in items
+
+    # State for the fights still going; finished lanes are compacted away.
+    lane = np.arange(fights)
+    player = np.full(fights, game.PLAYER_HP, np.int16)
+    clone = np.full(fights, game.CLONE_HP, np.int16)
+    bleed = np.zeros(fights, np.int8)
+    stun = np.zeros(fights, bool)
+    bottles = np.full(fights, game.BOTTLE.uses if "bottle" in items else 0, np.int16)
+    medkits = np.full(fights, game.MEDKIT.uses if "medkit" in items else 0, np.int16)
+    attacks = np.zeros(fights, np.intp)     # clone attacks so far, to index rolls
+
+    results = {
+        "won": np.zeros(fights, bool),
+        "finished": np.zeros(fights, bool),
+        "turns": np.full(fights, max_turns, np.int16),
+        "player_hp": np.zeros(fights, np.int16),
+        "clone_hp": np.zeros(fights, np.int16),
+    }
+
+    for turn in range(max_turns):
+        action = np.full(lane.size, plan[min(turn, len(plan) - 1)], np.int8)
+        if heal_below:
+            action[(player <= heal_below) & (medkits > 0)] = MEDKIT
+
+        # ------------------ PLAYER TURN ------------------
+        clone -= (action == ATTACK) * damage
+        if knife:
+            bleed[action == KNIFE] = game.BLEED_TURNS
+
+        thrown = (action == BOTTLE) & (bottles > 0)
+        bottles -= thrown
+        stun |= thrown
+
+        healed = (action == MEDKIT) & (medkits > 0)
+        medkits -= healed
+        player = np.where(healed, np.minimum(player + game.MEDKIT_HEAL, game.PLAYER_HP), player)
+
+        # ------------------ BLEED DAMAGE ------------------
+        bleeding = bleed > 0
+        clone -= bleeding * np.int16(game.BLEED_DAMAGE)
+        bleed -= bleeding
+
+        # ------------------ CLONE TURN ------------------
+        strikes = clone > 0
+        stunned = strikes & stun
+        stun &= ~stunned
+        hits = strikes & ~stunned
+
+        if rolls is None:
+            roll = rng.integers(low, high + 1, lane.size, dtype=np.int16)
+        else:
+            roll = rolls[lane, np.minimum(attacks, rolls.shape[1] - 1)].astype(np.int16)
+            attacks += hits
+        roll = np.where(action == DEFEND, np.maximum(1, roll // 2), roll)
+        player -= hits * roll
+
+        # ------------------ FINISHED FIGHTS ------------------
+        done = (player <= 0) | (clone <= 0)
+        if done.any():
+            ids = lane[done]
+            results["finished"][ids] = True
+            results["won"][ids] = clone[done] <= 0
+            results["turns"][ids] = turn + 1
+            results["player_hp"][ids] = player[done]
+            results["clone_hp"][ids] = clone[done]
+
+            keep = ~done
+            lane, player, clone, bleed, stun, bottles, medkits, attacks = (
+                column[keep] for column in
+                (lane, player, clone, bleed, stun, bottles, medkits, attacks))
+            if not lane.size:
+                break
+
+    results["player_hp"][lane] = player
+    results["clone_hp"][lane] = clone
+    return results
+
+
+def summarize(results):
+    """Win rate, turns-to-kill and remaining HP for a simulate() result."""
+    won = results["won"]
+    wins = int(won.sum())
+    kill_turns = results["turns"][won]
+    hp_left = results["player_hp"][won]
+
+    return {
+        "fights": won.size,
+        "win_rate": wins / won.size if won.size else 0.0,
+        "unfinished": int((~results["finished"]).sum()),
+        "turns_to_kill": {turn: int(count) for turn, count
+                          in enumerate(np.bincount(kill_turns)) if count},
+        "hp_left_mean": float(hp_left.mean()) if wins else 0.0,
+        "hp_left_p10": float(np.percentile(hp_left, 10)) if wins else 0.0,
+        "hp_left_p50": float(np.percentile(hp_left, 50)) if wins else 0.0,
+    }
+
+
+# ============================================================
+#                   SCALAR PARITY
+# ============================================================
+
+def fight_scalar(policy, items, heal_below, rolls, max_turns=MAX_TURNS):
+    """Plays one fight with the game's own combat_turn and use_item_combat.
+    Returns (won, finished, turns, player_hp, clone_hp)."""
+    session = game.GameSession(game.ScriptIO())
+    for item in game.ITEMS:
+        if item.name in (ITEMS[name] for name in items):
+            session.inventory.add(item, item.uses)
+
+    fight = game.Fight(game.BADGE in session.inventory)
+    rolls = iter(rolls)
+
+    def roll():
+        return next(rolls)
+
+    turns = 0
+    while not fight.over() and turns < max_turns:
+        action = policy[min(turns, len(policy) - 1)]
+        if heal_below and fight.player_hp <= heal_below and game.MEDKIT in session.inventory:
+            action = "medkit"
+
+        if action in ITEMS:
+            session.io.answers.clear()
+            session.io.answers.append(ITEMS[action])
+            action = run_now(game.use_item_combat(session))
+        elif action == "pass":
+            action = None
+
+        game.combat_turn(fight, action, roll)
+        turns += 1
+
+    return (fight.clone_hp <= 0, fight.over(), turns, fight.player_hp, fight.clone_hp)
+
+
+def run_now(coro):
+    """Runs a coroutine that never has to wait, without an event loop."""
+    try:
+        coro.send(None)
+    except StopIteration as done:
+        return done.value
+    raise RuntimeError("coroutine tried to wait")
+
+
+CHECKS = [   # (policy, items, heal_below)
+    (("attack",), (), 0),
+    (("attack",), ("badge",), 0),
+    (("defend",), (), 0),
+    (("knife", "attack", "attack", "knife"), ("knife",), 0),
+    (("bottle", "knife", "attack"), ("knife", "bottle", "badge"), 0),
+    (("bottle", "bottle", "medkit", "attack"), ("bottle",), 0),
+    (("attack", "defend"), ("medkit",), 10),
+    (("knife", "defend", "attack"), ("knife", "bottle", "badge", "medkit"), 12),
+    (("badge", "pass", "attack"), ("badge",), 0),
+]
+
+
+def check_parity(fights=2000, seed=0):
+    """Runs every CHECKS setup through simulate() and fight_scalar() with
+    the same clone rolls. Returns the number of fights compared; raises
+    AssertionError on the first fight where they disagree."""
+    rng = random.Random(seed)
+    low, high = game.CLONE_DAMAGE
+    compared = 0
+
+    for policy, items, heal_below in CHECKS:
+        rolls = np.array([[rng.randint(low, high) for _ in range(MAX_TURNS)]
+                          for _ in range(fights)], dtype=np.int16)
+        vector = simulate(fights, policy, items, heal_below, rolls=rolls)
+
+        for i in range(fights):
+            scalar = fight_scalar(policy, items, heal_below, rolls[i].tolist())
+            lane = (bool(vector["won"][i]), bool(vector["finished"][i]),
+                    int(vector["turns"][i]), int(vector["player_hp"][i]),
+                    int(vector["clone_hp"][i]))
+            assert scalar == lane, (
+                f"{policy} with {items or 'no items'}, fight {i}: "
+                f"scalar {scalar} != vectorized {lane}")
+        compared += fights
+
+    return compared
+
+
+# ============================================================
+#                   RUN
+# ============================================================
+
+def report(summary, seconds):
+    print(f"{summary['fights']:,} fights in {seconds:.2f} s "
+          f"({summary['fights'] / seconds:,.0f} fights/s)")
+    print(f"win rate:   {summary['win_rate'] * 100:.2f}%"
+          + (f"   ({summary['unfinished']} unfinished)" if summary['unfinished'] else ""))
+    print(f"HP left:    mean {summary['hp_left_mean']:.1f}, "
+          f"p10 {summary['hp_left_p10']:.0f}, p50 {summary['hp_left_p50']:.0f}")
+
+    wins = sum(summary["turns_to_kill"].values())
+    print("turns to kill:" if wins else "turns to kill: no wins")
+    for turn, count in summary["turns_to_kill"].items():
+        share = count / wins
+        print(f"  {turn:>3}  {share * 100:6.2f}%  {'#' * round(share * 50)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lost Signal combat simulator")
+    parser.add_argument("--fights", type=int, default=1_000_000)
+    parser.add_argument("--policy", default="attack",
+                        help="comma-separated actions per turn, the last repeats: "
+                             + ", ".join(ACTIONS))
+    parser.add_argument("--items", default="",
+                        help="comma-separated loadout: " + ", ".join(ITEMS))
+    parser.add_argument("--heal-below", type=int, default=0,
+                        help="use the medkit whenever HP is at or below this")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--check", action="store_true",
+                        help="check the vectorized rules against the game's")
+    args = parser.parse_args()
+
+    if args.check:
+        started = time.perf_counter()
+        count = check_parity()
+        print(f"parity ok: {count:,} fights across {len(CHECKS)} setups "
+              f"({time.perf_counter() - started:.1f} s)")
+    else:
+        policy = tuple(args.policy.split(","))
+        items = tuple(item for item in args.items.split(",") if item)
+        for name in policy:
+            if name not in ACTIONS:
+                parser.error(f"unknown action {name!r}")
+        for name in items:
+            if name not in ITEMS:
+                parser.error(f"unknown item {name!r}")
+
+        started = time.perf_counter()
+        results = simulate(args.fights, policy, items, args.heal_below, args.seed)
+        report(summarize(results), time.perf_counter() - started)
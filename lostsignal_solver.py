@@ -0,0 +1,334 @@
+"""Exact solver for the clone fight.
+
+Works out, for every state a fight can be in, the chance of winning it
+with perfect play and the move that gets that chance: an expectimax
+over the clone's damage roll, each roll equally likely. A state is the
+player's and the clone's HP, bleed turns left, whether the clone is
+stunned, and bottle and medkit uses left. Whether the player wears the
+badge and holds the knife never changes mid-fight, so each of those four
+loadouts gets a table of its own.
+
+Every turn the clone loses HP, the player does, or a bottle, a medkit
+or a stun is spent, so no state can come back around. One pass over the
+states in order, each looking up states already solved, is the whole
+search. Tables are cached on disk under solver_cache/, keyed by the
+balance numbers, so a tuning change is solved once.
+
+The game's "Tactical Hint" option reads the same tables.
+
+Run with:  python lostsignal_solver.py                  (current balance)
+           python lostsignal_solver.py --clone-hp 26    (try a change)
+           python lostsignal_solver.py --grid --items knife,medkit
+           python lostsignal_solver.py --check          (against the game's rules)
+"""
+
+import os
+import random
+import struct
+import time
+from array import array
+from collections import namedtuple
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(HERE, "solver_cache")
+
+MAGIC = b"LSCS"
+VERSION = 1
+HEADER = struct.Struct("<4sBI")       # magic, version, states
+
+ACTIONS = ("attack", "defend", "knife", "bottle", "heal")
+ATTACK, DEFEND, KNIFE, BOTTLE, HEAL = range(len(ACTIONS))
+
+
+class Rules(namedtuple("Rules", "player_hp clone_hp attack_damage badge_bonus clone_damage "
+                                "bleed_turns bleed_damage medkit_heal bottles medkits")):
+    """The balance numbers a fight is played by. bottles and medkits are
+    the uses each of those items comes with."""
+
+    __slots__ = ()
+
+    def key(self):
+        import hashlib      # only the disk cache needs it
+
+        return hashlib.sha1(repr((VERSION,) + tuple(self)).encode()).hexdigest()[:16]
+
+
+class Table:
+    """The solved fight for one loadout: the chance of winning from each
+    state with perfect play, and the move that gets it."""
+
+    __slots__ = ("rules", "badge", "knife", "strides", "win", "best")
+
+    def __init__(self, rules, badge, knife, win=None, best=None):
+        self.rules = rules
+        self.badge = badge
+        self.knife = knife
+        # Index strides for bleed, player HP, clone HP, stun, bottles, medkits.
+        strides = [1, rules.bleed_turns + 1]
+        for size in (rules.player_hp + 1, rules.clone_hp + 1, 2, rules.bottles + 1,
+                     rules.medkits + 1):
+            strides.append(strides[-1] * size)
+        self.strides = tuple(strides)
+        self.win = win if win is not None else array("d", bytes(8 * strides[-1]))
+        self.best = best if best is not None else bytearray(strides[-1])
+
+    def index(self, player, clone, bleed=0, stun=False, bottles=0, medkits=0):
+        _, s_player, s_clone, s_stun, s_bottles, s_medkits, _ = self.strides
+        return (bleed + player * s_player + clone * s_clone + stun * s_stun
+                + bottles * s_bottles + medkits * s_medkits)
+
+    def lookup(self, player, clone, bleed=0, stun=False, bottles=0, medkits=0):
+        """Returns (best action, chance of winning) for a fight in progress.
+        Uses beyond what the rules hand out count as the most they do."""
+        rules = self.rules
+        index = self.index(min(player, rules.player_hp), min(clone, rules.clone_hp), bleed,
+                           stun, min(bottles, rules.bottles), min(medkits, rules.medkits))
+        return ACTIONS[self.best[index]], self.win[index]
+
+    def start(self, bottles=0, medkits=0):
+        """Returns (best opening, chance of winning) for a fresh fight."""
+        return self.lookup(self.rules.player_hp, self.rules.clone_hp,
+                           bottles=bottles, medkits=medkits)
+
+
+def solve(rules, badge=False, knife=False):
+    """Solves every state of the fight for one loadout."""
+    low, high = rules.clone_damage
+    if low < 1:
+        raise ValueError("the clone has to deal at least 1 damage, or fights could go on forever")
+
+    table = Table(rules, badge, knife)
+    win, best = table.win, table.best
+    _, s_player, s_clone, s_stun, s_bottles, s_medkits, _ = table.strides
+    damage = rules.attack_damage + (rules.badge_bonus if badge else 0)
+    rolls = range(low, high + 1)
+    braced = [max(1, roll // 2) for roll in rolls]
+    count = len(rolls)
+
+    def clone_turn(player, clone, bleed, stun, rest, defend):
+        """Chance of winning once the player has acted, where rest is the
+        index of the bottles and medkits left."""
+        if bleed:
+            clone -= rules.bleed_damage
+            bleed -= 1
+        if clone <= 0:
+            return 1.0
+        base = rest + clone * s_clone + bleed
+        if stun:
+            return win[base + player * s_player]
+        total = 0.0
+        for hit in braced if defend else rolls:
+            if hit < player:
+                total += win[base + (player - hit) * s_player]
+        return total / count
+
+    # Every move leads to a state earlier in this order, which is already solved.
+    for medkits in range(rules.medkits + 1):
+        for bottles in range(rules.bottles + 1):
+            rest = bottles * s_bottles + medkits * s_medkits
+            for stun in (0, 1):
+                for clone in range(1, rules.clone_hp + 1):
+                    for player in range(1, rules.player_hp + 1):
+                        for bleed in range(rules.bleed_turns + 1):
+                            choice = ATTACK
+                            chance = clone_turn(player, clone - damage, bleed, stun, rest, False)
+                            value = clone_turn(player, clone, bleed, stun, rest, True)
+                            if value > chance:
+                                choice, chance = DEFEND, value
+                            if knife:
+                                value = clone_turn(player, clone, rules.bleed_turns, stun,
+                                                   rest, False)
+                                if value > chance:
+                                    choice, chance = KNIFE, value
+                            if bottles:
+                                value = clone_turn(player, clone, bleed, 1,
+                                                   rest - s_bottles, False)
+                                if value > chance:
+                                    choice, chance = BOTTLE, value
+                            if medkits:
+                                value = clone_turn(min(rules.player_hp,
+                                                       player + rules.medkit_heal),
+                                                   clone, bleed, stun, rest - s_medkits, False)
+                                if value > chance:
+                                    choice, chance = HEAL, value
+
+                            index = (bleed + player * s_player + clone * s_clone
+                                     + stun * s_stun + rest)
+                            win[index] = chance
+                            best[index] = choice
+    return table
+
+
+# ============================================================
+#                   CACHE
+# ============================================================
+
+TABLES = {}   # {(rules, badge, knife): Table}, this process's solved tables
+
+
+def cache_path(rules, badge, knife, cache_dir=CACHE_DIR):
+    loadout = ("badge-" if badge else "") + ("knife-" if knife else "")
+    return os.path.join(cache_dir, f"{rules.key()}-{loadout}fight.bin")
+
+
+def table(rules, badge=False, knife=False, cache_dir=CACHE_DIR):
+    """Returns the solved table for a loadout: from memory, from the disk
+    cache, or solved now and cached in both."""
+    key = (rules, badge, knife)
+    found = TABLES.get(key)
+    if found is None:
+        found = TABLES[key] = _load(rules, badge, knife, cache_dir)
+    return found
+
+
+def _load(rules, badge, knife, cache_dir):
+    path = cache_path(rules, badge, knife, cache_dir)
+    empty = Table(rules, badge, knife)
+    states = len(empty.best)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, version, count = HEADER.unpack_from(data, 0)
+        if magic == MAGIC and version == VERSION and count == states:
+            win = array("d")
+            win.frombytes(data[HEADER.size:HEADER.size + 8 * states])
+            best = bytearray(data[HEADER.size + 8 * states:])
+            if len(win) == states and len(best) == states:
+                return Table(rules, badge, knife, win, best)
+    except (OSError, struct.error):
+        pass
+
+    solved = solve(rules, badge, knife)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        temp = path + ".tmp"
+        with open(temp, "wb") as f:
+            f.write(HEADER.pack(MAGIC, VERSION, states) + solved.win.tobytes() + solved.best)
+        os.replace(temp, path)
+    except OSError:
+        pass    # a read-only install just solves again next time
+    return solved
+
+
+# ============================================================
+#                   DESIGNER TOOLS
+# ============================================================
+
+LOADOUTS = [(badge, knife, bottle, medkit)
+            for badge in (False, True) for knife in (False, True)
+            for bottle in (False, True) for medkit in (False, True)]
+
+
+def loadout_name(badge, knife, bottle, medkit):
+    names = [name for name, held in (("badge", badge), ("knife", knife),
+                                     ("bottle", bottle), ("medkit", medkit)) if held]
+    return ",".join(names) or "nothing"
+
+
+def compare(rules, baseline=None, cache_dir=CACHE_DIR):
+    """Prints the chance of winning a fresh fight and the best opening for
+    every loadout, next to baseline's where the rules differ."""
+    started = time.perf_counter()
+    tables = {(badge, knife): table(rules, badge, knife, cache_dir)
+              for badge in (False, True) for knife in (False, True)}
+    seconds = time.perf_counter() - started
+
+    print(f"{'loadout':<28}{'win':>8}{'change':>9}   opening")
+    for badge, knife, bottle, medkit in LOADOUTS:
+        action, chance = tables[badge, knife].start(bottle * rules.bottles,
+                                                   medkit * rules.medkits)
+        change = ""
+        if baseline is not None:
+            _, before = table(baseline, badge, knife, cache_dir).start(
+                bottle * baseline.bottles, medkit * baseline.medkits)
+            change = f"{(chance - before) * 100:+.1f}"
+        print(f"{loadout_name(badge, knife, bottle, medkit):<28}"
+              f"{chance * 100:>7.1f}%{change:>9}   {action}")
+    states = sum(len(found.best) for found in tables.values())
+    print(f"\n{states:,} states, {seconds * 1000:.1f} ms (rules {rules.key()})")
+
+
+def grid(rules, badge, knife, bottles, medkits, cache_dir=CACHE_DIR):
+    """Prints the best move for every pair of HPs, no bleed, no stun."""
+    found = table(rules, badge, knife, cache_dir)
+    letters = {action: action[0].upper() for action in ACTIONS}
+    print("best move by player HP (rows) and clone HP (columns): "
+          + ", ".join(f"{letter} {action}" for action, letter in letters.items()))
+    print("    " + "".join(f"{clone:>3}" for clone in range(1, rules.clone_hp + 1)))
+    for player in range(rules.player_hp, 0, -1):
+        row = (letters[found.lookup(player, clone, 0, False, bottles, medkits)[0]]
+               for clone in range(1, rules.clone_hp + 1))
+        print(f"{player:>3} " + "".join(f"{letter:>3}" for letter in row))
+
+
+def check(fights=20_000, seed=0, cache_dir=CACHE_DIR):
+    """Plays fights with the game's own combat_turn, following the table
+    for the game's rules, and compares the win rate with the solved chance
+    for every loadout. Returns the largest gap in standard errors."""
+    import lostsignalgame as game
+
+    rng = random.Random(seed)
+    worst = 0.0
+    for badge, knife, bottle, medkit in LOADOUTS:
+        found = table(game.RULES, badge, knife, cache_dir)
+        bottles = bottle * game.RULES.bottles
+        medkits = medkit * game.RULES.medkits
+        wins = 0
+        for _ in range(fights):
+            fight = game.Fight(badge)
+            left = {"bottle": bottles, "heal": medkits}
+            while not fight.over():
+                action, _ = found.lookup(fight.player_hp, fight.clone_hp, fight.bleed_turns,
+                                         fight.stun_next_turn, left["bottle"], left["heal"])
+                if action in left:
+                    left[action] -= 1
+                game.combat_turn(fight, action, lambda: rng.randint(*game.CLONE_DAMAGE))
+            wins += fight.clone_hp <= 0
+
+        _, chance = found.start(bottles, medkits)
+        error = (chance * (1 - chance) / fights) ** 0.5 or 1 / fights
+        gap = abs(wins / fights - chance) / error
+        worst = max(worst, gap)
+        print(f"{loadout_name(badge, knife, bottle, medkit):<28}solved {chance * 100:6.2f}%   "
+              f"played {wins / fights * 100:6.2f}%   ({gap:.1f} standard errors)")
+    return worst
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import lostsignalgame as game
+
+    parser = argparse.ArgumentParser(description="Lost Signal combat solver")
+    for field in Rules._fields:
+        if field != "clone_damage":
+            parser.add_argument("--" + field.replace("_", "-"), type=int, metavar="N",
+                                help=f"(now {getattr(game.RULES, field)})")
+    parser.add_argument("--clone-damage", metavar="LOW-HIGH",
+                        help="the clone's damage roll (now {}-{})".format(*game.RULES.clone_damage))
+    parser.add_argument("--grid", action="store_true",
+                        help="print the best move for every pair of HPs")
+    parser.add_argument("--items", default="",
+                        help="with --grid, the loadout: badge, knife, bottle, medkit")
+    parser.add_argument("--check", action="store_true",
+                        help="play the solved moves with the game's rules and compare")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    args = parser.parse_args()
+
+    changes = {field: getattr(args, field) for field in Rules._fields
+               if field != "clone_damage" and getattr(args, field) is not None}
+    if args.clone_damage:
+        low, _, high = args.clone_damage.partition("-")
+        changes["clone_damage"] = (int(low), int(high or low))
+    rules = game.RULES._replace(**changes)
+
+    if args.check:
+        worst = check(cache_dir=args.cache_dir)
+        print(f"\nlargest gap: {worst:.1f} standard errors")
+        raise SystemExit(worst > 4)
+    if args.grid:
+        items = set(filter(None, args.items.split(",")))
+        grid(rules, "badge" in items, "knife" in items, rules.bottles * ("bottle" in items),
+             rules.medkits * ("medkit" in items), args.cache_dir)
+    else:
+        compare(rules, game.RULES if changes else None, args.cache_dir)
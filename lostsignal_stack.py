@@ -0,0 +1,75 @@
+"""Stack check for Lost Signal's scene driver.
+
+Scenes hand the next scene's name back to run_game() instead of calling
+it, so a session should be no deeper on its ten-thousandth trip round
+the tavern than on its first. This steps one session through LOOPS
+rounds of tavern_loop -> talk_to_merc -> tavern_loop and checks that its
+suspended coroutine chain stays the same depth and that the memory it
+holds doesn't grow.
+
+Check with:  python lostsignal_stack.py
+"""
+
+import argparse
+import time
+import tracemalloc
+
+import lostsignalgame as game
+
+LOOPS = 10_000
+TO_TAVERN = ("1", "")       # start the game, then Enter past the intro
+MEMORY_SLACK = 1024         # bytes the session may grow by, for allocator noise
+
+
+def depth(session):
+    """Frames in a stepped session's suspended coroutine chain, from
+    run_game() down to the one awaiting the prompt."""
+    frames = 0
+    coro = session.io.game
+    while getattr(coro, "cr_frame", None) is not None:     # the Prompt at the bottom isn't one
+        frames += 1
+        coro = coro.cr_await
+    return frames
+
+
+def check(loops=LOOPS):
+    """Plays `loops` rounds of the tavern loop. Returns (frames deep at
+    the tavern menu, at the merc's prompt, bytes the session grew by);
+    raises AssertionError if either depth changes or memory grows."""
+    session = game.new_session(seed=1)
+    game.step(session)
+    for answer in TO_TAVERN:
+        game.step(session, answer)
+    assert session.scene == "tavern_loop", session.scene
+
+    tracemalloc.start()
+    try:
+        expected = None
+        for loop in range(loops):
+            game.step(session, "2")
+            assert session.scene == "talk_to_merc", (loop, session.scene)
+            merc = depth(session)
+            game.step(session, "")
+            assert session.scene == "tavern_loop", (loop, session.scene)
+            depths = (depth(session), merc)
+            if expected is None:
+                expected = depths
+                before = tracemalloc.get_traced_memory()[0]
+            assert depths == expected, f"loop {loop}: {depths} frames deep, expected {expected}"
+        grew = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    assert grew <= MEMORY_SLACK, f"the session grew by {grew} bytes over {loops} loops"
+    return (*expected, grew)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lost Signal stack check")
+    parser.add_argument("--loops", type=int, default=LOOPS,
+                        help="rounds of tavern_loop -> talk_to_merc to play")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    tavern, merc, grew = check(args.loops)
+    print(f"stack ok: {args.loops:,} loops at {tavern} frames deep in the tavern and {merc} "
+          f"at the merc, {grew:+} bytes ({time.perf_counter() - started:.1f} s)")
@@ -0,0 +1,278 @@
+"""Shared player store for the Lost Signal server.
+
+Where lostsignal_save.py gives one player a pair of files, the store
+keeps every player of a server in one SQLite database, by callsign, so
+their inventory and flags survive the server restarting. Each player is
+one row: seed, flags, and the inventory packed as lostsignal_save packs
+it, (item id, uses) in pickup order.
+
+Picking things up and putting them down makes lots of small changes, so
+none of them is written as it happens. A change only replaces the
+player's pending row in memory, and a writer thread commits every
+pending row in one transaction every FLUSH_EVERY seconds. The database
+runs in WAL mode with synchronous=NORMAL: a commit is one append to the
+log, and readers never wait on the writer. If the process dies, at most
+the last FLUSH_EVERY seconds of changes are lost. A commit that fails
+(the database locked for longer than busy_timeout, say) puts its rows
+back, and the next one tries them again.
+
+Connections come from a small pool, so the writer thread and the
+threads loading players as they log in don't open their own. Loads and
+saves go through the same few SQL strings, which sqlite3 prepares once
+per connection and then reuses.
+
+Serve with:  python lostsignal_server.py --store players.db
+"""
+
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+from collections import deque
+
+from lostsignal_save import FLAGS, ITEM
+
+FLUSH_EVERY = 0.05      # seconds between group commits
+POOL_SIZE = 4
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS players (
+    name    TEXT PRIMARY KEY,
+    seed    INTEGER NOT NULL,
+    flags   INTEGER NOT NULL,
+    items   BLOB NOT NULL,
+    saved   REAL NOT NULL
+) WITHOUT ROWID
+"""
+LOAD = "SELECT seed, flags, items FROM players WHERE name = ?"
+SAVE = ("INSERT INTO players (name, seed, flags, items, saved) VALUES (?, ?, ?, ?, ?) "
+        "ON CONFLICT (name) DO UPDATE SET seed = excluded.seed, flags = excluded.flags, "
+        "items = excluded.items, saved = excluded.saved")
+
+
+def _row(session):
+    """Returns (seed, flags, packed items) for a session."""
+    flags = sum(1 << bit for bit, name in enumerate(FLAGS) if getattr(session, name))
+    items = b"".join(ITEM.pack(item.id, session.inventory.uses_left(item))
+                     for item in session.inventory)
+    return session.seed, flags, items
+
+
+# ============================================================
+#                   CONNECTION POOL
+# ============================================================
+
+class ConnectionPool:
+    """A fixed set of connections to one database, shared between threads.
+    Take one with `with pool.connection() as conn:`."""
+
+    def __init__(self, path, size=POOL_SIZE):
+        self.path = path
+        self.idle = queue.LifoQueue()
+        self.connections = []
+        for _ in range(size):
+            conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False,
+                                   cached_statements=16)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.execute("PRAGMA busy_timeout = 5000")
+            self.connections.append(conn)
+            self.idle.put(conn)
+
+    def connection(self):
+        return _Borrowed(self)
+
+    def close(self):
+        for conn in self.connections:
+            conn.close()
+
+
+class _Borrowed:
+    __slots__ = ("pool", "conn")
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def __enter__(self):
+        self.conn = self.pool.idle.get()
+        return self.conn
+
+    def __exit__(self, *exc):
+        self.pool.idle.put(self.conn)
+
+
+# ============================================================
+#                   STORE
+# ============================================================
+
+class Store:
+    """Every player's saved state, for all the sessions in one process."""
+
+    def __init__(self, path, flush_every=FLUSH_EVERY, pool_size=POOL_SIZE):
+        self.pool = ConnectionPool(path, pool_size)
+        with self.pool.connection() as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version not in (0, SCHEMA_VERSION):
+                raise ValueError(f"{path} is a version {version} player store, "
+                                 f"expected {SCHEMA_VERSION}")
+            conn.execute(SCHEMA)
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+        self.flush_every = flush_every
+        self.lock = threading.Lock()
+        self.pending = {}       # {name: (seed, flags, items)} not committed yet
+        self.closed = threading.Event()
+        self.writer = threading.Thread(target=self._write_loop, name="player-store", daemon=True)
+
+        self.changes = 0        # changes reported by sessions
+        self.rows = 0           # rows written
+        self.commits = 0
+        self.failures = 0       # commits that failed and were retried
+        self.loads = 0
+        self.found = 0          # loads that found a saved player
+        self.commit_seconds = deque(maxlen=100_000)
+        self.started = time.perf_counter()
+        self.writer.start()
+
+    def load(self, name, session, items):
+        """Restores the player called name into a new session, where items
+        is the game's item list. Returns False if there is no such player.
+        Safe to call from any thread."""
+        with self.pool.connection() as conn:
+            row = conn.execute(LOAD, (name,)).fetchone()
+        with self.lock:         # loads run on executor threads
+            self.loads += 1
+            self.found += row is not None
+        if row is None:
+            return False
+        seed, flags, packed = row
+        if len(packed) % ITEM.size:
+            raise ValueError(f"items are {len(packed)} bytes, "
+                             f"not a whole number of {ITEM.size}-byte entries")
+        session.seed = seed
+        session.rng = None
+        for bit, flag in enumerate(FLAGS):
+            setattr(session, flag, bool(flags & (1 << bit)))
+        for item_id, uses in ITEM.iter_unpack(packed):
+            if item_id >= len(items):
+                raise ValueError(f"unknown item id {item_id}; "
+                                 "is the store from a newer version?")
+            session.inventory.add(items[item_id], uses)
+        return True
+
+    def player(self, name, session):
+        """Returns the session.save hook that keeps name's row up to date,
+        and queues the row as it is now."""
+        save = PlayerSave(self, name, session)
+        save.changed()
+        return save
+
+    def _queue(self, name, row):
+        with self.lock:
+            self.pending[name] = row
+            self.changes += 1
+
+    def _write_loop(self):
+        while True:
+            closing = self.closed.wait(self.flush_every)
+            try:
+                self.flush()
+            except Exception as error:      # keep writing; the rows are pending again
+                self.failures += 1
+                print(f"[store] commit failed, {len(self.pending)} players left to retry: "
+                      f"{error}", file=sys.stderr)
+            if closing:
+                return
+
+    def flush(self):
+        """Commits every pending row in one transaction. If that fails the
+        rows are pending again, unless a newer change has replaced them,
+        and the error is raised."""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        if not pending:
+            return
+        now = time.time()
+        rows = [(name, seed, flags, items, now) for name, (seed, flags, items) in pending.items()]
+        started = time.perf_counter()
+        try:
+            with self.pool.connection() as conn:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    conn.executemany(SAVE, rows)
+                    conn.execute("COMMIT")
+                except BaseException:
+                    if conn.in_transaction:
+                        conn.execute("ROLLBACK")
+                    raise
+        except BaseException:
+            with self.lock:
+                self.pending = {**pending, **self.pending}
+            raise
+        self.commit_seconds.append(time.perf_counter() - started)
+        self.commits += 1
+        self.rows += len(rows)
+
+    def close(self):
+        """Commits what is pending and closes the database."""
+        self.closed.set()
+        self.writer.join()
+        self.pool.close()
+
+    def metrics(self):
+        seconds = time.perf_counter() - self.started
+        ordered = sorted(self.commit_seconds)
+
+        def pct(p):
+            return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] * 1000 if ordered else 0.0
+
+        return {
+            "changes": self.changes,
+            "changes_per_s": self.changes / seconds,
+            "rows": self.rows,
+            "commits": self.commits,
+            "rows_per_commit": self.rows / self.commits if self.commits else 0.0,
+            "failures": self.failures,
+            "commit_p50_ms": pct(50),
+            "commit_p99_ms": pct(99),
+            "loads": self.loads,
+            "found": self.found,
+        }
+
+
+class PlayerSave:
+    """session.save for a player in a Store. Every change queues the
+    player's whole row, which is a few bytes, in place of the last one."""
+
+    __slots__ = ("store", "name", "session")
+
+    def __init__(self, store, name, session):
+        self.store = store
+        self.name = name
+        self.session = session
+
+    def changed(self):
+        self.store._queue(self.name, _row(self.session))
+
+    def pick_up(self, item, uses):
+        self.changed()
+
+    def discard(self, item):
+        self.changed()
+
+    def uses(self, item, uses):
+        self.changed()
+
+    def flag(self, name, value):
+        self.changed()
+
+    def close(self):
+        pass    # the store commits it with everything else
+
+
+def size_kb(path):
+    """The database's size on disk, log included."""
+    return sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p)) / 1024
@@ -0,0 +1,398 @@
+"""Gameplay telemetry for Lost Signal: every passage a player sees and
+every answer they give, as fixed-width events, plus the funnel queries
+to make sense of them.
+
+A session records only when session.events is set. Each event is twelve
+bytes in three columns:
+
+  - session  u32   numbered by the writer, from 0
+  - ms       u32   milliseconds since the segment started
+  - key      u32   passage id | choice id << 16, plus FIRST (bit 31) the
+                   first time this session records this passage and choice
+
+Choice ENTER means the passage was shown, TIMEOUT a timed choice ran
+out, and any other choice is the player's answer (OTHER once too many
+different answers have come in). Because the writer sets FIRST, the
+number of sessions that reached a step is a plain count, with no need to
+deduplicate millions of rows.
+
+Events are appended to arrays and written a batch at a time to segment
+files, which rotate at SEGMENT_BYTES. Every batch starts with the names
+of passages and choices first seen since the last one, so a segment can
+be read on its own. The query side maps each segment and counts a column
+with Counter, which runs in C: tens of millions of events take seconds.
+
+Record:  python lostsignal_server.py --events events/
+         python lostsignal_load.py --events events/ --players 20000 --rate 0
+Query:   python lostsignal_telemetry.py events/
+Check:   python lostsignal_telemetry.py --check /tmp
+         python lostsignal_telemetry.py events/ --funnel intro raid_event raid_event:timeout
+"""
+
+import argparse
+import glob
+import mmap
+import os
+import random
+import struct
+import time
+from array import array
+from collections import Counter
+
+MAGIC = b"LSEV"
+VERSION = 1
+SEGMENT = struct.Struct("<4sBxxxId")    # magic, version, run, started (epoch seconds)
+BLOCK = struct.Struct("<IHHI")          # events, new passages, new choices, names bytes
+SEGMENT_BYTES = 64 * 1024 * 1024
+BATCH = 8192            # events per block
+FLUSH_MS = 2000         # ...or fewer, once the oldest has waited this long (checked per event)
+MAX_MS = 2**32 - 1
+
+FIRST = 1 << 31
+ENTER, TIMEOUT, OTHER = 0, 1, 2
+CHOICE_NAMES = ("enter", "timeout", "other")
+MAX_CHOICES = 0x7FFF
+LONGEST_CHOICE = 24
+
+# Where a player gets to in the demo, in order.
+FUNNEL = ("main_menu", "intro", "talk_to_bartender", "talk_to_bartender.correct",
+          "basement_scene", "combat_system.won", "raid_event", "demo_end")
+
+
+# ============================================================
+#                   RECORDING
+# ============================================================
+
+class Telemetry:
+    """Writes every recording session's events to segment files named
+    DIR/PREFIX-NNNNN.lse. Each writer numbers its own sessions and tags
+    its segments with a random run id, so several processes (or restarts)
+    can write to one directory."""
+
+    def __init__(self, directory, prefix="events", segment_bytes=SEGMENT_BYTES, batch=BATCH):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.prefix = prefix
+        self.segment_bytes = segment_bytes
+        self.batch = batch
+        self.run = random.getrandbits(32)
+        self.passages = {}                  # {name: id}
+        self.choices = {name: number for number, name in enumerate(CHOICE_NAMES)}
+        self.named = (0, 0)                 # passages and choices this segment has named
+        self.sessions = array("I")
+        self.ms = array("I")
+        self.keys = array("I")
+        self.started = 0.0
+        self.first_ms = None                # ms of the oldest event waiting
+        self.file = None
+        earlier = glob.glob(os.path.join(directory, f"{prefix}-{'[0-9]' * 5}.lse"))
+        self.number = max((int(path[-9:-4]) for path in earlier), default=0)
+        self.recorders = 0
+        self.events = 0
+        self.blocks = 0
+        self.segments = 0
+        self.bytes = 0
+        self._open()
+
+    def session(self):
+        """Returns the session.events recorder for one new session."""
+        recorder = SessionEvents(self, self.recorders & 0xFFFFFFFF)
+        self.recorders += 1
+        return recorder
+
+    def _open(self):
+        self.number += 1
+        path = os.path.join(self.directory, f"{self.prefix}-{self.number:05d}.lse")
+        self.file = open(path, "xb")
+        self.started = time.time()
+        self.file.write(SEGMENT.pack(MAGIC, VERSION, self.run, self.started))
+        self.named = (0, 0)
+        self.segments += 1
+
+    def record(self, recorder, passage, choice):
+        passage_id = self.passages.get(passage)
+        if passage_id is None:
+            passage_id = self.passages[passage] = len(self.passages)
+        key = passage_id | choice << 16
+        if key not in recorder.seen:
+            recorder.seen.add(key)
+            key |= FIRST
+        ms = int((time.time() - self.started) * 1000)
+        if ms > MAX_MS:
+            self.flush()
+            self._rotate()
+            ms = 0
+        self.sessions.append(recorder.id)
+        self.ms.append(ms)
+        self.keys.append(key)
+        if self.first_ms is None:
+            self.first_ms = ms
+        elif len(self.keys) >= self.batch or ms - self.first_ms >= FLUSH_MS:
+            self.flush()
+
+    def choice(self, answer):
+        """Returns the id for an answer."""
+        if answer is None:
+            return TIMEOUT
+        answer = answer[:LONGEST_CHOICE]
+        choice = self.choices.get(answer)
+        if choice is None:
+            if len(self.choices) > MAX_CHOICES:
+                return OTHER
+            choice = self.choices[answer] = len(self.choices)
+        return choice
+
+    def flush(self):
+        """Writes the waiting events out as one block."""
+        count = len(self.keys)
+        if not count:
+            return
+        passages, choices = self.named
+        names = list(self.passages)[passages:] + list(self.choices)[choices:]
+        text = "\n".join(names).encode("utf-8")
+        text += b"\0" * (-len(text) % 4)      # keeps the columns 4-byte aligned
+        self.file.write(BLOCK.pack(count, len(self.passages) - passages,
+                                   len(self.choices) - choices, len(text)))
+        self.file.write(text)
+        self.file.write(self.sessions)
+        self.file.write(self.ms)
+        self.file.write(self.keys)
+        self.named = (len(self.passages), len(self.choices))
+        del self.sessions[:], self.ms[:], self.keys[:]
+        self.first_ms = None
+        self.events += count
+        self.blocks += 1
+        self.bytes += BLOCK.size + len(text) + 12 * count
+        if self.file.tell() >= self.segment_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        self.file.close()
+        self._open()
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def metrics(self):
+        return {
+            "sessions": self.recorders,
+            "events": self.events + len(self.keys),
+            "blocks": self.blocks,
+            "segments": self.segments,
+            "kb": self.bytes / 1024,
+            "passages": len(self.passages),
+            "choices": len(self.choices),
+        }
+
+
+class SessionEvents:
+    """session.events: what one session saw and answered."""
+
+    __slots__ = ("telemetry", "id", "seen")
+
+    def __init__(self, telemetry, number):
+        self.telemetry = telemetry
+        self.id = number
+        self.seen = set()       # keys recorded so far, for FIRST
+
+    def enter(self, passage):
+        self.telemetry.record(self, passage, ENTER)
+
+    def answer(self, passage, answer):
+        """Records the answer to a passage's prompt: None if it ran out."""
+        self.telemetry.record(self, passage, self.telemetry.choice(answer))
+
+
+# ============================================================
+#                   QUERYING
+# ============================================================
+
+def read_segment(path):
+    """Yields (passage names, choice names, sessions, ms, keys) for every
+    block of a segment, where the columns are memoryviews of u32 into the
+    mapped file and the name lists hold every name the segment has
+    defined so far. The first thing yielded is the segment's run id."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < SEGMENT.size:
+            return
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(data)
+    magic, version, run, _ = SEGMENT.unpack_from(view, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a version {VERSION} events segment")
+    yield run
+    passages, choices = [], []
+    offset = SEGMENT.size
+    while offset + BLOCK.size <= len(view):
+        count, new_passages, new_choices, text_size = BLOCK.unpack_from(view, offset)
+        offset += BLOCK.size
+        end = offset + text_size + 12 * count
+        if end > len(view):
+            break       # a block cut off by a crash
+        names = []
+        if new_passages or new_choices:     # an Enter answer's name is "", so count, don't test
+            names = bytes(view[offset:offset + text_size]).rstrip(b"\0").decode("utf-8").split("\n")
+        passages += names[:new_passages]
+        choices += names[new_passages:new_passages + new_choices]
+        offset += text_size
+        columns = view[offset:end].cast("I")
+        yield passages, choices, columns[:count], columns[count:2 * count], columns[2 * count:]
+        offset = end
+
+
+class Summary:
+    """Event and session counts for every (passage, choice)."""
+
+    def __init__(self):
+        self.events = Counter()     # {(passage, choice): events}
+        self.reached = Counter()    # {(passage, choice): sessions}
+        self.left = Counter()       # {(passage, choice): sessions whose last event it was}
+        self.total = 0
+        self.segments = 0
+        self.bytes = 0
+
+    def sessions(self):
+        return sum(self.left.values())
+
+    def add(self, counts, last, passages, choices):
+        def name(key):
+            return passages[key & 0xFFFF], choices[(key >> 16) & 0x7FFF]
+
+        for key, count in counts.items():
+            self.events[name(key)] += count
+            if key & FIRST:
+                self.reached[name(key)] += count
+        for key, count in Counter(last.values()).items():
+            self.left[name(key)] += count
+
+
+def summarize(paths):
+    """Reads segments and returns a Summary. A run's segments are read
+    together, oldest first, since its sessions carry on across them."""
+    runs = {}       # {run: (key counts, {session: last key}, passages, choices)}
+    summary = Summary()
+    for path in sorted(paths):
+        blocks = read_segment(path)
+        run = next(blocks, None)
+        if run is None:
+            continue
+        summary.segments += 1
+        summary.bytes += os.path.getsize(path)
+        counts, last, passages, choices = runs.setdefault(run, (Counter(), {}, [], []))
+        for passages_now, choices_now, sessions, _, keys in blocks:
+            counts.update(keys)
+            last.update(zip(sessions, keys))
+            summary.total += len(keys)
+            passages[:] = passages_now
+            choices[:] = choices_now
+    for counts, last, passages, choices in runs.values():
+        summary.add(counts, last, passages, choices)
+    return summary
+
+
+def check(directory):
+    """Writes a segment whose second block names only the empty answer,
+    and checks that it reads back with every name in place. Returns the
+    number of events read."""
+    telemetry = Telemetry(directory, "check")
+    path = telemetry.file.name
+    first, second = telemetry.session(), telemetry.session()
+    first.enter("intro")
+    second.enter("intro")
+    telemetry.flush()
+    first.answer("intro", "")
+    second.answer("intro", None)
+    telemetry.flush()
+    first.answer("intro", "yes")
+    telemetry.close()
+
+    try:
+        blocks = read_segment(path)
+        next(blocks)
+        read = []
+        for passages, choices, sessions, _, keys in blocks:
+            read += [(session, passages[key & 0xFFFF], choices[(key >> 16) & 0x7FFF])
+                     for session, key in zip(sessions, keys)]
+        summary = summarize([path])
+    finally:
+        os.remove(path)
+    expected = [(0, "intro", "enter"), (1, "intro", "enter"), (0, "intro", ""),
+                (1, "intro", "timeout"), (0, "intro", "yes")]
+    assert read == expected, f"read back {read}, expected {expected}"
+    assert summary.reached["intro", ""] == 1 and summary.sessions() == 2, summary.reached
+    return len(read)
+
+
+def step_key(step):
+    """'passage' means shown; 'passage:choice' means answered so."""
+    passage, _, choice = step.partition(":")
+    return passage, choice or "enter"
+
+
+def funnel(summary, steps=FUNNEL):
+    """Prints how many sessions reached each step, and what share of the
+    step before."""
+    def share(part, whole):
+        return f"{part / whole:.1%}" if whole else "-"
+
+    counts = [summary.reached[step_key(step)] for step in steps]
+    print(f"{'step':<34}{'sessions':>10}{'of start':>10}{'of prev':>9}")
+    for number, (step, reached) in enumerate(zip(steps, counts)):
+        previous = share(reached, counts[number - 1]) if number else ""
+        print(f"{step:<34}{reached:>10,}{share(reached, counts[0]):>10}{previous:>9}")
+
+
+def choices_report(summary, limit=12):
+    """Prints, for every passage with a prompt, how the sessions that saw
+    it answered and how many stopped playing at its prompt."""
+    answered = {}
+    for (passage, choice), sessions in summary.reached.items():
+        if choice != "enter":
+            answered.setdefault(passage, []).append((sessions, choice))
+    for passage in sorted(answered, key=lambda p: -summary.reached[p, "enter"]):
+        shown = summary.reached[passage, "enter"]
+        stopped = summary.left[passage, "enter"]
+        print(f"\n{passage}: {shown:,} sessions saw it, {stopped:,} ({stopped / max(1, shown):.1%}) "
+              "left without answering")
+        rows = sorted(answered[passage], reverse=True)
+        for sessions, choice in rows[:limit]:
+            print(f"  {choice!r:<{LONGEST_CHOICE + 2}}{sessions:>9,} sessions "
+                  f"{summary.events[passage, choice]:>10,} answers")
+        if len(rows) > limit:
+            print(f"  ...and {len(rows) - limit} more")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lost Signal telemetry funnels")
+    parser.add_argument("paths", nargs="*", metavar="PATH",
+                        help="segment files, or directories of them")
+    parser.add_argument("--funnel", nargs="+", metavar="STEP", default=FUNNEL,
+                        help="steps to count sessions through: a passage name, or "
+                             "passage:choice for an answer (passage:timeout, when it ran out)")
+    parser.add_argument("--choices", action="store_true",
+                        help="also break every prompt down by answer, with drop-off")
+    parser.add_argument("--check", metavar="DIR",
+                        help="round-trip a small segment in DIR and check it reads back")
+    args = parser.parse_args()
+
+    if args.check:
+        print(f"segment ok: {check(args.check)} events read back")
+        raise SystemExit
+    if not args.paths:
+        parser.error("give segment files or directories to read")
+    paths = []
+    for path in args.paths:
+        paths += glob.glob(os.path.join(path, "*.lse")) if os.path.isdir(path) else [path]
+    started = time.perf_counter()
+    summary = summarize(paths)
+    seconds = time.perf_counter() - started
+    print(f"{summary.total:,} events from {summary.sessions():,} sessions in {summary.segments} "
+          f"segments ({summary.bytes / 1024 / 1024:.1f} MB), read in {seconds:.2f} s "
+          f"({summary.total / max(seconds, 1e-9) / 1e6:.1f} M events/s)\n")
+    funnel(summary, args.funnel)
+    caught = summary.reached["got_caught", "enter"]
+    ended = summary.reached["demo_end", "enter"]
+    print(f"\nraid outcomes: {ended:,} reached demo_end, {caught:,} were caught")
+    if args.choices:
+        choices_report(summary)
@@ -1,745 +1,1421 @@
+"""Lost Signal, a text adventure.
+
+Importing this module loads the game without starting it. A host drives
+sessions with step() (see STEPPING), or runs run_game() on an event loop
+with an I/O object of its own, as lostsignal_server.py does.
+
+Play with:  python lostsignalgame.py
+"""
+
+import os
 import time
 import random
 import sys
 import select
+from array import array
+from collections import OrderedDict, deque
+from itertools import chain, repeat
+
+import lostsignal_content
+import lostsignal_metrics
+import lostsignal_replay
+import lostsignal_save
+import lostsignal_solver
 
 # ============================================================
 #                   UTILITY FUNCTIONS
 # ============================================================
 
-def slow_print(text, delay=0.02):
-    """Prints dialog with a typewriter effect."""
-    for char in text:
-        print(char, end="", flush=True)
-        time.sleep(delay)
-    print()
-
-def input_with_timeout(prompt, timeout=8):
-    slow_print(prompt)
-    sys.stdout.flush()
-    ready, _, _ = select.select([sys.stdin], [], [], timeout)
-
-    if ready:
-        return sys.stdin.readline().strip().lower()
-    else:
-        return None  # timed out
-# ============================================================
-#                   GLOBAL GAME STATE
-# ============================================================
+TEXT_SPEEDS = {"slow": 0.5, "normal": 1.0, "fast": 2.0, "instant": 0}
+
+
+class Frames:
+    """One line of dialog cut into typewriter frames.
+
+    The whole line is encoded once into `data`, and `ends` holds where each
+    frame stops in it, always on a character boundary. Frames are handed
+    out as memoryview slices of data, so writing one copies nothing and
+    encodes nothing. I/O that doesn't encode keeps data as a str.
+
+    Frames are sliced with map() and zip() rather than a generator, so the
+    loop stays in C and a frame costs one memoryview and no bytecode.
+    """
+
+    __slots__ = ("data", "ends", "pause")
+
+    def __init__(self, data, ends, pause=0):
+        self.data = data
+        self.ends = ends        # array of offsets into data, one per frame
+        self.pause = pause      # seconds after every frame
+
+    def __len__(self):
+        return len(self.ends)
+
+    def __iter__(self):
+        """Returns an iterator of (chunk, pause) for every frame."""
+        ends = self.ends
+        if len(ends) == 1:
+            return iter(((self.data, self.pause),))     # a whole line needs no slicing
+        data = self.data
+        view = data if isinstance(data, str) else memoryview(data)
+        return zip(map(view.__getitem__, map(slice, chain((0,), ends), ends)),
+                   repeat(self.pause))
+
+    def rest(self, index):
+        """Everything after frame `index`, for skipping to the end of the line."""
+        data = self.data
+        view = data if isinstance(data, str) else memoryview(data)
+        return view[self.ends[index]:]
+
+    def size(self):
+        return sys.getsizeof(self) + sys.getsizeof(self.data) + sys.getsizeof(self.ends)
+
+
+class FrameCache:
+    """Typewriter frames for lines already typed, shared by every session.
+
+    Most of what the game prints is the same for everyone (banners, menus,
+    story lines), so each line is cut into frames and encoded once per
+    pacing and I/O type, then reused. The least recently used lines are
+    dropped once the frames held pass max_bytes.
+
+    The content's own lines, cut and encoded when it loads (see
+    Typewriter.preload), are pinned: they sit in the same table, so a
+    lookup is one dict access either way, but are never dropped and don't
+    count against max_bytes.
+    """
+
+    def __init__(self, max_bytes=4 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()    # {key: (frames, size)}, oldest first
+        self.pinned = {}                # {key: size} of the entries that are the content's lines
+        self.pinned_bytes = 0
+        self.bytes = 0                  # held by entries that aren't pinned
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, frames):
+        size = sys.getsizeof(key[0]) + frames.size()
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.bytes -= old[1]
+        self.entries[key] = (frames, size)
+        self.bytes += size
+        while self.bytes > self.max_bytes and len(self.entries) > len(self.pinned) + 1:
+            oldest, entry = self.entries.popitem(last=False)
+            if oldest in self.pinned:
+                self.entries[oldest] = entry    # kept, as the newest
+                continue
+            self.bytes -= entry[1]
+            self.evictions += 1
+        return frames
+
+    def pin(self, entries):
+        """Pins entries, {key: frames}, in place of the lines pinned before."""
+        for key in self.pinned.keys() - entries.keys():
+            del self.entries[key]
+        pinned = {}
+        for key, frames in entries.items():
+            size = sys.getsizeof(key[0]) + frames.size()
+            old = self.entries.pop(key, None)
+            if old is not None and key not in self.pinned:
+                self.bytes -= old[1]        # it was in the LRU
+            self.entries[key] = (frames, size)
+            pinned[key] = size
+        self.pinned = pinned
+        self.pinned_bytes = sum(pinned.values())
+
+    def metrics(self):
+        lookups = self.hits + self.misses
+        return {
+            "lines": len(self.entries) - len(self.pinned),
+            "kb": self.bytes / 1024,
+            "cap_kb": self.max_bytes / 1024,
+            "pinned_lines": len(self.pinned),
+            "pinned_kb": self.pinned_bytes / 1024,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+FRAMES = FrameCache()
+
+
+class Typewriter:
+    """Cuts dialog into typewriter frames.
+
+    Instead of one print/flush/sleep per character, text is cut into frames
+    of `fps` per second, so a line costs one write and one sleep per frame
+    while keeping the same characters-per-second pacing. A speed of 0 prints
+    instantly. Frames come ready to write from the shared FrameCache, as
+    slices of each line encoded once (see Frames). Subclasses decide how
+    lines are encoded and where frames go.
+    """
+
+    def __init__(self, fps=25, speed=1.0, cache=FRAMES):
+        self.fps = fps
+        self.speed = speed
+        self.cache = cache
+        self.scene = None
+        self.stats = {}     # {scene: [lines, chars, writes, sleeps]}
+
+    # Whether encode() does enough work that instant lines and prompts are
+    # worth caching too. If not, there is nothing to cut up, and encoding a
+    # whole line costs less than looking it up.
+    encodes = False
+
+    def encode(self, text):
+        return text
+
+    def frames(self, text, delay=0.02):
+        """Returns the Frames for one line of dialog. The last frame
+        carries the line's newline."""
+        frames = self.cached(text, delay)
+        count = len(frames.ends)
+        stats = self.stats.setdefault(self.scene, [0, 0, 0, 0])
+        stats[0] += 1
+        stats[1] += len(text)
+        stats[2] += count
+        if frames.pause:
+            stats[3] += count
+        return frames
+
+    def cached(self, text, delay=0, end="\n"):
+        """Returns the Frames for a line from the cache, cutting them on a
+        miss. With no delay that is a single frame. A prompt has end=""."""
+        if self.speed <= 0 or delay <= 0:
+            if not self.encodes:
+                line = text + end
+                return Frames(line, (len(line),))
+            key = (text, end, type(self))       # one frame, whatever the pacing
+        else:
+            key = (text, delay, self.fps, self.speed, type(self))
+        frames = self.cache.get(key)
+        if frames is None:
+            frames = self.cache.put(key, self._cut(text, delay, self.speed, end))
+        return frames
+
+    def _cut(self, text, delay, speed, end="\n"):
+        data = self.encode(text + end)
+        if speed <= 0 or delay <= 0 or not text:
+            return Frames(data, array("I", (len(data),)))
+
+        char_delay = delay / speed
+        step = max(1, round(1 / (self.fps * char_delay)))
+        pause = step * char_delay
+
+        ends = array("I")
+        offset = 0
+        for pos in range(0, len(text), step):
+            chunk = text[pos:pos + step]
+            if pos + step >= len(text):
+                chunk += end
+            offset += len(self.encode(chunk))   # encoded length, so a frame never splits a character
+            ends.append(offset)
+        return Frames(data, ends, pause)
+
+    def preload(self, content, delay=0.02):
+        """Cuts and encodes every line of content that reads the same for
+        every player, at every text speed, and pins them in the cache so
+        no session encodes them again. Lines with {fields} are left to the
+        cache's LRU. Call it again with each new version of the content.
+        Returns the number of lines pinned."""
+        entries = {}
+        kind = type(self)
+        for name in content:
+            passage = content.passage(name)
+            lines = [(typed, text) for typed, text in passage.lines if "{" not in text]
+            if passage.prompt is not None and "{" not in passage.prompt:
+                # A timed choice types its prompt; any other asks with it.
+                lines.append((True, passage.prompt) if passage.timeout else (None, passage.prompt))
+            for typed, text in lines:
+                if self.encodes:
+                    end = "" if typed is None else "\n"
+                    entries[text, end, kind] = self._cut(text, 0, 0, end)
+                if typed:
+                    for speed in TEXT_SPEEDS.values():
+                        if speed > 0:
+                            key = (text, delay, self.fps, speed, kind)
+                            entries[key] = self._cut(text, delay, speed)
+        self.cache.pin(entries)
+        return len(entries)
+
+    def report(self):
+        """Prints the writes and sleeps each scene cost, next to what the
+        old one-character-at-a-time slow_print would have cost."""
+        print(f"\n{'scene':<20}{'lines':>7}{'chars':>8}{'writes':>8}{'sleeps':>8}"
+              f"{'old writes':>12}{'old sleeps':>12}")
+        for name, (lines, chars, writes, sleeps) in self.stats.items():
+            print(f"{name or '-':<20}{lines:>7}{chars:>8}{writes:>8}{sleeps:>8}"
+                  f"{chars + lines:>12}{chars:>12}")
+        print("frame cache:", ", ".join(f"{name} {value:g}"
+                                        for name, value in self.cache.metrics().items()))
+
+
+class ConsoleIO(Typewriter):
+    """Plays what step() returns in this terminal (see play_console).
+    Pressing Enter while a line is typing skips to its end.
+
+    Lines are cached as UTF-8 and go straight to the byte buffer under
+    `out`, so neither this nor the text layer encodes them again on every
+    write. With one player the cache's LRU never fills, so unlike the
+    server the console doesn't preload the content before its first
+    menu. The text layer is switched to write-through, which keeps
+    anything else printed to `out` in order with them.
+    """
+
+    def __init__(self, fps=25, speed=1.0, out=None):
+        super().__init__(fps, speed)
+        self.out = out or sys.stdout
+        self.raw = getattr(self.out, "buffer", None)
+        if self.raw is not None:
+            self.out.reconfigure(write_through=True)
+        else:
+            self.raw = _TextSink(self.out)      # a StringIO or the like
 
-inventory = {}   # {item_name: {"desc": "...", "type": "weapon/lore/buff", "uses": int}}
-badge_buff = False
-basement_unlocked = False
-clone_defeated = False
+    encodes = True
 
+    def encode(self, text):
+        return text.encode("utf-8")
 
+    def write(self, text, delay=0.02):
+        """Types a line out, or prints it at once if it has no delay."""
+        if not delay:
+            self.raw.write(self.cached(text).data)
+            return
+        frames = self.frames(text, delay)
+        for index, (chunk, pause) in enumerate(frames):
+            self.raw.write(chunk)
+            self.raw.flush()
+            if pause and self._pause(pause):
+                self.raw.write(frames.rest(index))
+                self.raw.flush()
+                return
+
+    def read(self, prompt=""):
+        self.raw.flush()
+        return input(prompt)
+
+    def read_timed(self, timeout):
+        self.raw.flush()
+        ready, _, _ = select.select([sys.stdin], [], [], timeout)
+        if ready:
+            return sys.stdin.readline()
+        return None
 
-# ============================================================
-#                   MAIN MENU
-# ============================================================
+    def _pause(self, seconds):
+        """Sleeps for one frame. Returns True if the player hit Enter."""
+        if not sys.stdin.isatty():
+            time.sleep(seconds)
+            return False
 
-def main_menu():
-    while True:
-        slow_print("\n" + "="*55)
-        slow_print("       LOST SIGNAL — MAIN MENU")
-        slow_print("="*55)
-        print("1. Start Game")
-        print("2. View Inventory")
-        print("3. Quit")
+        ready, _, _ = select.select([sys.stdin], [], [], seconds)
+        if ready:
+            sys.stdin.readline()
+            return True
+        return False
 
-        choice = input("\nChoose an option: ").strip()
 
-        if choice == "1":
-            intro()
-        elif choice == "2":
-            open_inventory()
-        elif choice == "3":
-            slow_print("\nExiting game... Signal terminated.")
-            exit()
-        else:
-            slow_print("Invalid choice. Try again.")
+class _TextSink:
+    """ConsoleIO's byte writer for an `out` that only takes text."""
 
+    def __init__(self, out):
+        self.out = out
 
-# ============================================================
-#                   INTRO SCENE
-# ============================================================
+    def write(self, data):
+        self.out.write(str(data, "utf-8"))
 
-def intro():
-    slow_print("\nLost Signal - Demo Version\n")
-    slow_print("...Memory rebooting...\n")
+    def flush(self):
+        self.out.flush()
 
-    slow_print(
-        "You remember flashes of metal scraping, alarms drowning in static,\n"
-        "and silhouettes dragging something from your hands — a black capsule.\n"
-        "It's heavy... important... and dangerous.\n"
-    )
 
-    slow_print(
-        "When you woke, the world was already gone.\n"
-        "Unbeknownst to you, your copies scattered across this wasteland.\n"
-        "Some run. Some fight. Most warn you to stay away.\n"
-    )
+class ScriptIO:
+    """Plays a session from a list of answers, instantly, and keeps
+    everything the game prints. None in the answers is a timed-out choice."""
 
-    slow_print(
-        "You've been wandering ever since. No map. No signal.\n"
-        "Only a feeling that something — or someone — is closing in.\n"
-    )
+    def __init__(self, answers=()):
+        self.answers = deque(answers)
+        self.output = []
+        self.scene = None
 
-    slow_print(
-        "Your steps lead you to the Central Drift;\n"
-        "a floating tavern wedged between corporate sectors and lawless space.\n"
-    )
+    async def say(self, text, delay=0.02):
+        self.output.append(text + "\n")
 
-    input("Press Enter to enter the tavern...")
-    tavern_loop()
+    async def show(self, text=""):
+        self.output.append(text + "\n")
 
+    async def ask(self, prompt=""):
+        self.output.append(prompt)
+        if not self.answers:
+            raise EOFError("script ran out of answers")
+        return self.answers.popleft()
 
+    async def ask_timed(self, timeout):
+        if not self.answers:
+            raise EOFError("script ran out of answers")
+        return self.answers.popleft()
 
-# ============================================================
-#                   INVENTORY SYSTEM
-# ============================================================
+    def transcript(self):
+        return "".join(self.output)
 
-def add_to_inventory(name, desc, item_type, uses=1):
-    inventory[name] = {"desc": desc, "type": item_type, "uses": uses}
-    slow_print(f"You pick up **{name}**.")
 
+async def slow_print(session, text, delay=0.02):
+    """Prints dialog with a typewriter effect."""
+    if session.metrics is None:
+        await session.io.say(text, delay)
+        return
+    started = time.perf_counter()
+    await session.io.say(text, delay)
+    session.metrics.typing(time.perf_counter() - started)
 
-def open_inventory():
-    slow_print("\n===== INVENTORY =====")
 
-    if not inventory:
-        slow_print("You have no items.")
-        return
+async def show(session, text=""):
+    """Prints a line straight away, like menus."""
+    await session.io.show(text)
 
-    for item in inventory:
-        print(f"- {item} ({inventory[item]['type']})")
 
-    while True:
-        choice = input("\nType an item name to inspect or 'exit': ").strip().lower()
+async def ask(session, prompt=""):
+    if session.metrics is None:
+        line = await session.io.ask(prompt)
+    else:
+        started = time.perf_counter()
+        line = await session.io.ask(prompt)
+        session.metrics.answer(time.perf_counter() - started)
+    if session.log is not None:
+        session.log.record(prompt, line)
+    return line.strip().lower()
+
+
+async def input_with_timeout(session, prompt, timeout=8):
+    await slow_print(session, prompt)
+    if session.metrics is None:
+        line = await session.io.ask_timed(timeout)
+    else:
+        started = time.perf_counter()
+        line = await session.io.ask_timed(timeout)
+        session.metrics.answer(time.perf_counter() - started, timed=True, timed_out=line is None)
+    if session.log is not None:
+        session.log.record(prompt, line, timed=True)
+
+    if line is not None:
+        return line.strip().lower()
+    else:
+        return None  # timed out
 
-        if choice == "exit":
-            return
 
-        if choice in inventory:
-            show_item_details(choice)
-        else:
-            slow_print("Item not found.")
+# ============================================================
+#                   STORY CONTENT
+# ============================================================
 
+# Every line of story text lives in lostsignal_content.txt. Only its index
+# is read here; a passage is decoded when a scene reaches it. With --watch,
+# edits to the source replace CONTENT while the game runs (see
+# watch_content); each session picks up the new version at its next scene.
+CONTENT = lostsignal_content.load()
 
-def show_item_details(item):
-    info = inventory[item]
-    slow_print(f"\n--- {item.upper()} ---")
-    slow_print(info["desc"])
 
-    if info["type"] in ["weapon", "buff"]:
-        slow_print(f"Uses left: {info['uses']}")
+async def tell(session, name, /, **values):
+    """Plays a passage from the content file, filling in any {fields}.
+    Returns the player's answer if the passage ends in a prompt."""
+    return await play_passage(session, session.content.passage(name), values, name)
+
+
+async def play_passage(session, passage, values=None, name=None):
+    if session.events is not None:
+        session.events.enter(name)
+    for typed, text in passage.lines:
+        if values:
+            text = text.format(**values)
+        if typed:
+            await slow_print(session, text)
+        else:
+            await show(session, text)
+
+    if passage.prompt is None:
+        return None
+    prompt = passage.prompt.format(**values) if values else passage.prompt
+    if passage.timeout:
+        answer = await input_with_timeout(session, prompt, passage.timeout)
+    else:
+        answer = await ask(session, prompt)
+    if session.events is not None:
+        session.events.answer(name, answer)
+    return answer
 
-    choice = input("\nDiscard this item? (yes/no): ").strip().lower()
-    if choice == "yes":
-        del inventory[item]
-        slow_print(f"{item} discarded.")
 
+async def follow(session, name):
+    """Plays a passage and wherever its answers lead inside the content
+    file. Returns the next scene to run."""
+    while True:
+        passage = session.content.passage(name)
+        answer = await play_passage(session, passage, None, name)
+        name = passage.next_scene(answer)
+
+        if name is None:
+            return None
+        if name.startswith("caught:"):
+            return await got_caught(session, name[len("caught:"):].strip())
+        if "." not in name:
+            return name
+
+
+# Every passage the scenes below play by name, with the {fields} they fill
+# in, and every scene they return by name. A reload has to keep them all.
+PASSAGE_FIELDS = {
+    "main_menu": (), "main_menu.quit": (), "main_menu.invalid": (),
+    "text_speed": (), "text_speed.set": ("speed",), "text_speed.unknown": (),
+    "inventory.pick_up": ("name",), "inventory": (), "inventory.empty": (),
+    "inventory.item": ("name", "type"), "inventory.prompt": (), "inventory.not_found": (),
+    "item.details": ("title", "desc"), "item.uses": ("uses",), "item.discard": (),
+    "item.discarded": ("name",),
+    "explore_tavern": (), "explore_tavern.find": ("name", "desc"), "explore_tavern.done": (),
+    "talk_to_bartender": (), "talk_to_bartender.q1": (), "talk_to_bartender.q2": (),
+    "talk_to_bartender.q3": (), "talk_to_bartender.retry": (),
+    "talk_to_bartender.correct": (), "talk_to_bartender.wrong": (),
+    "basement_scene": (), "basement_scene.clone": (),
+    "combat_system": (), "combat_system.turn": ("player_hp", "clone_hp"),
+    "combat_system.hint": ("move", "chance"), "combat_system.strike": ("damage",),
+    "combat_system.knife": (), "combat_system.bottle": (), "combat_system.heal": (),
+    "combat_system.defend": (), "combat_system.invalid": (),
+    "combat_system.bleed": ("damage",), "combat_system.stunned": (),
+    "combat_system.braced": ("damage", "reduced"), "combat_system.hit": ("damage",),
+    "combat_system.lost": (), "combat_system.won": (),
+    "use_item": (), "use_item.none": (), "use_item.item": ("name",), "use_item.prompt": (),
+    "use_item.invalid": (), "use_item.unusable": (), "use_item.badge": (),
+    "use_item.medkit": ("heal",),
+    "got_caught": ("reason",),
+    "tavern_loop": (), "tavern_loop.leave": (), "tavern_loop.invalid": (),
+}
+SCENE_NAMES = ("main_menu", "intro", "raid_event", "talk_to_bartender", "talk_to_merc",
+               "explore_tavern")
+
+
+def check_content(content):
+    """Turns down a content reload (ValueError) that would break a scene:
+    a passage leading nowhere, a passage or scene the code needs gone or
+    asking for a {field} it isn't given, or tavern finds that aren't
+    items. Checks the whole new version, since removing or renaming one
+    passage can break others that didn't change."""
+    from string import Formatter    # imports re, so only when reloading
+
+    for name in SCENE_NAMES:
+        if name not in content and name not in SCENES:
+            raise ValueError(f"scene [{name}] is gone, and the game still goes there")
+    for name, fields in PASSAGE_FIELDS.items():
+        if name not in content:
+            raise ValueError(f"[{name}] is gone, and the game still plays it")
+        if not fields:
+            continue        # played without values, so braces are left as they are
+        passage = content.passage(name)
+        for _, text in [*passage.lines, (False, passage.prompt or "")]:
+            try:
+                used = [field for _, field, _, _ in Formatter().parse(text) if field is not None]
+            except ValueError as error:
+                raise ValueError(f"[{name}]: {error}") from None
+            for field in used:
+                if field.partition(".")[0].partition("[")[0] not in fields:
+                    raise ValueError(f"[{name}] uses {{{field}}}; it is given only "
+                                     + ", ".join(fields))
+    for name in content:
+        passage = content.passage(name)
+        for target in [*passage.arms.values(), passage.goto]:
+            if target is None or target.startswith("caught:"):
+                continue
+            if target not in content and target not in SCENES:
+                raise ValueError(f"[{name}] leads to [{target}], which doesn't exist")
+    try:
+        discoveries(content)
+    except KeyError as error:
+        raise ValueError(f"[explore_tavern] finds: unknown {error}") from None
+
+
+def watch_content(every=1.0):
+    """Reloads lostsignal_content.txt whenever it's saved (--watch).
+    Returns the Watcher."""
+    def use(content):
+        global CONTENT
+        CONTENT = content
+
+    watcher = lostsignal_content.Watcher(CONTENT, validate=check_content)
+    watcher.watch(use, every)
+    return watcher
 
 # ============================================================
-#                   EXPLORE TAVERN
+#                   SCENE ENGINE
 # ============================================================
 
-def explore_tavern():
-    slow_print("\nYou wander deeper into the tavern...")
+SCENES = {}   # {scene_name: scene coroutine function}
 
-    discoveries = [
-        ("discarded knife", 
-         "A small blade. Rusted, but sharp. Could cause bleeding.",
-         "weapon", 
-         999),  # reusable
 
-        ("broken bottle", 
-         "Shattered at the end. Fragile, but could stun in a fight.",
-         "weapon", 
-         1),    # one-time use
+def scene(func):
+    """Registers a scene. A scene returns the name of the next scene to
+    run, or None when the player quits."""
+    SCENES[func.__name__] = func
+    return func
 
-        ("starfighter badge",
-         "A polished emblem from a long-lost squadron. Wearing it makes you feel steadier.",
-         "buff",
-         999),  # permanent buff
 
-        ("cracked holo-chip",
-         "Displays corrupted coordinates and static faces you don't recognize.",
-         "lore",
-         0),
+async def run_game(session, start="main_menu"):
+    """Runs scenes one after another until the player quits.
 
-         ("medkit",
-          "A compact emergency medkit filled with synthfoam patches. Restores health in combat.",
-          "heal",
-         1),
+    Scenes hand control back here instead of calling each other, so the
+    call stack stays the same depth however long a session lasts. A scene
+    with no Python function is played straight from the content file.
+    """
+    session.scene = start
+    while session.scene is not None:
+        session.scene = await run_scene(session)
 
-        ("torn manifest page",
-         "A manifest log with smeared names. One name isn't smeared: yours.",
-         "lore",
-         0),
-    ]
 
-    for name, desc, item_type, uses in discoveries:
-        slow_print(f"\nYou find {name}.")
-        slow_print(desc)
-        take = input("Take it? (yes/no): ").strip().lower()
+async def run_scene(session):
+    """Runs the session's current scene once and returns the next one."""
+    session.io.scene = name = session.scene
+    session.content = CONTENT
+    if session.metrics is None:
+        return await enter_scene(session)
+    started = time.perf_counter()
+    try:
+        return await enter_scene(session)
+    finally:
+        session.metrics.scene(name, time.perf_counter() - started)
 
-        if take == "yes":
-            add_to_inventory(name, desc, item_type, uses)
 
-    input("\nPress Enter to return to the tavern...")
+async def enter_scene(session):
+    handler = SCENES.get(session.scene)
+    if handler is not None:
+        return await handler(session)
+    return await follow(session, session.scene)
+
+
+def play(session, start="main_menu"):
+    """Runs a session whose I/O never has to wait, like ScriptIO, without
+    an event loop."""
+    game = run_game(session, start)
+    try:
+        game.send(None)
+    except StopIteration:
+        return
+    game.close()
+    raise RuntimeError("play() needs an I/O object that never blocks")
 
 
 # ============================================================
-#                   BARTENDER PUZZLE
+#                   STEPPING
 # ============================================================
 
-def talk_to_bartender():
-    global basement_unlocked
-    slow_print("\nYou approach the bartender. He doesn't look up from his glass.\n")
-    slow_print("Bartender: \"Yeah? You need somethin'?\"")
+class Prompt:
+    """What a stepped session waits on. Awaiting one suspends the session's
+    coroutine all the way out to step(), which resumes it with the answer."""
 
-    correct_sequence = ["yes", "no", "yes"]
-    player_answers = []
+    __slots__ = ("text", "timeout")
 
-    questions = [
-        "Bartender: \"First time in the Drift? (yes/no)\"",
-        "Bartender: \"You get your bearings yet? Know your way around? (yes/no)\"",
-        "Bartender: \"You lookin’ for something? Or someone? (yes/no)\""
+    def __init__(self, text, timeout=None):
+        self.text = text
+        self.timeout = timeout
 
-    ]
+    def __await__(self):
+        return (yield self)
 
-    for q in questions:
-        ans = input(q).strip().lower()
-        while ans not in ["yes", "no"]:
-            ans = input("Answer yes or no: ").strip().lower()
-        player_answers.append(ans)
 
-    if player_answers == correct_sequence:
+class StepIO:
+    """I/O for step(): keeps what the game prints until the next prompt
+    and never waits. Typewriter pacing is left to whoever shows it."""
 
-        slow_print("\nThe bartender studies you for a moment, his expression softening.\n")
-        slow_print("Bartender: \"Yeah... figures. Folks who wander in lookin’ like you—")
-        slow_print("—new place, no bearings, chasin’ something they can’t quite name.\"")
+    __slots__ = ("output", "scene", "speed", "game", "waiting")
 
-        slow_print("\nHe reaches under the counter, rummaging through an old crate.")
-        slow_print("Bartender: \"See all kinds come through the Drift. ")
-        slow_print("People runnin’, people searchin’, people forgettin’.\"")
+    def __init__(self):
+        self.output = []        # [(line, delay)]; a delay of 0 prints at once
+        self.scene = None
+        self.speed = None       # set when the player picks a text speed, for the host to apply
+        self.game = None        # the session's run_game() coroutine, once started
+        self.waiting = None     # the Prompt it's suspended on
 
-        slow_print("\nHe pulls out nothing, but his hand pauses like he remembers something.")
-        slow_print("Bartender: \"Got somethin' downstairs you might wanna check out.\"")
-        slow_print("Bartender: \"Some traveler left it behind awhile back. Said it belonged to")
-        slow_print("someone who might come lookin’. Never knew what they meant.\"")
+    async def say(self, text, delay=0.02):
+        self.output.append((text, delay))
 
-        slow_print("\nHe jerks his chin toward the hallway.")
-        slow_print("Bartender: \"Basement door’s unlocked. Shelf on the right. ")
-        slow_print("Take a look. Might help you find whatever it is you’re after.\"")
+    async def show(self, text=""):
+        self.output.append((text, 0))
 
-        basement_unlocked = True
+    async def ask(self, prompt=""):
+        return await Prompt(prompt)
 
-        choice = input("\nGo to the basement now? (yes/no): ").strip().lower()
-        if choice == "yes":
-            basement_scene()
-    else:
-        slow_print("\nThe bartender shrugs, losing interest.")
-        slow_print("Bartender: 'Alright then. Forget I asked.'")
-        return
+    async def ask_timed(self, timeout):
+        return await Prompt("", timeout)
 
 
+class Step:
+    """What one step() returns: the lines printed since the last step, and
+    the prompt now waiting (None once the game is over). A timed choice
+    has its prompt in the output, prompt "" and the seconds it waits."""
 
+    __slots__ = ("output", "prompt", "timeout")
 
-# ============================================================
-#                   BASEMENT + CLONE ENCOUNTER
-# ============================================================
+    def __init__(self, output, prompt, timeout):
+        self.output = output
+        self.prompt = prompt
+        self.timeout = timeout
 
-def basement_scene():
-    slow_print("\nYou descend the narrow metal stairs, each step groaning under your weight.")
-    slow_print("The air grows colder. Dust hangs in the light of a single flickering bulb.\n")
+    def __repr__(self):
+        return f"Step({len(self.output)} lines, prompt={self.prompt!r}, timeout={self.timeout})"
 
-    slow_print("Old crates line the walls, stamped with faded shipping labels from worlds you don’t recognize.")
-    slow_print("Tools sit untouched on workbenches, coated in a thin layer of gray.\n")
 
-    slow_print("The basement hums quietly — machinery running somewhere deeper in the tavern.\n")
+def new_session(seed=None, **hooks):
+    """Returns a GameSession to drive with step(). hooks are GameSession's
+    log, save, metrics and events."""
+    return GameSession(StepIO(), seed, **hooks)
 
-    slow_print("To your right, a small wooden shelf leans against the wall, cluttered with forgotten belongings.")
-    slow_print("Most of it looks worthless… but one object immediately stands out.\n")
 
-    # ----- ITEM PICKUP ----- #
-    slow_print("A thin metallic card rests on the shelf, pulsing faintly with blue light.")
-    slow_print("As you pick it up, it vibrates — just once — then falls silent.\n")
+def step(session, text=None):
+    """Runs a session up to its next prompt and returns a Step.
+
+    The first step starts the game (at session.scene if it was restored
+    from a save) and ignores text. After that, text answers the waiting
+    prompt; for a timed choice, None means time ran out. Steps are plain
+    calls, so one thread can drive any number of sessions by stepping each
+    in turn.
+    """
+    io = session.io
+    output = io.output = []
+    try:
+        if io.game is None:
+            io.game = run_game(session, session.scene or "main_menu")
+            io.waiting = io.game.send(None)
+        elif io.waiting is not None:
+            if text is None and io.waiting.timeout is None:
+                text = ""
+            io.waiting = io.game.send(text)
+        else:
+            return Step(output, None, None)
+    except StopIteration:
+        io.waiting = None
+        return Step(output, None, None)
+    return Step(output, io.waiting.text, io.waiting.timeout)
 
-    add_to_inventory(
-        "strange access card",
-        "A metallic data card with a faint pulse. It reacts to your touch in a way you can't explain.",
-        "lore",
-        0
-    )
 
-    slow_print("You slip the card into your pocket.\n")
-    slow_print("That’s when you hear it.\n")
+def play_console(session, console):
+    """Plays a stepped session in the terminal until the player quits."""
+    reply = step(session)
+    while True:
+        console.scene = session.io.scene
+        if session.io.speed is not None:
+            console.speed = session.io.speed
+        started = time.perf_counter()
+        for text, delay in reply.output:
+            console.write(text, delay)
+        if session.metrics is not None:
+            session.metrics.typing(time.perf_counter() - started)
+        if reply.prompt is None:
+            return
+        if reply.timeout is None:
+            answer = console.read(reply.prompt)
+        else:
+            answer = console.read_timed(reply.timeout)
+        reply = step(session, answer)
 
-    slow_print("*A soft scrape. Like metal against concrete.*\n")
-    slow_print("You freeze, listening.\n")
 
-    slow_print("A shadow detaches itself from behind a stack of crates.\n")
-    slow_print("Then it steps into the light.\n")
+# ============================================================
+#                   GAME SESSION
+# ============================================================
 
-    slow_print("Your own face stares back at you.\n")
+class GameSession:
+    """One player's game state.
+
+    Nothing about a run lives in module globals, so any number of sessions
+    can share one interpreter. __slots__ keeps each one down to a few
+    pointers plus its inventory.
+
+    Dice rolls come from the session's own RNG, so a seed plus the
+    player's inputs (see lostsignal_replay.py) reproduce a run exactly.
+
+    Code that changes the inventory or a flag tells session.save, so a
+    save file (see lostsignal_save.py) never falls behind.
+    """
+
+    __slots__ = ("inventory", "badge_buff", "basement_unlocked", "clone_defeated",
+                 "scene", "io", "seed", "rng", "log", "save", "metrics", "events", "content")
+
+    def __init__(self, io=None, seed=None, log=None, save=None, metrics=None, events=None):
+        self.inventory = Inventory()
+        self.badge_buff = False
+        self.basement_unlocked = False
+        self.clone_defeated = False
+        self.scene = None
+        self.io = io
+        self.seed = random.randrange(2**32) if seed is None else seed
+        self.rng = None       # created on the first roll; most sessions never fight
+        self.log = log        # records every input when set
+        self.save = save      # journals every change to the state above when set
+        self.metrics = metrics    # records timings and counts when set (lostsignal_metrics.py)
+        self.events = events      # records every passage and answer when set (lostsignal_telemetry.py)
+        self.content = CONTENT    # the content version for the current scene
+
+    def roll(self, low, high):
+        if self.rng is None:
+            self.rng = random.Random(self.seed)
+        return self.rng.randint(low, high)
+
+    def set_flag(self, name, value):
+        setattr(self, name, value)
+        if self.save is not None:
+            self.save.flag(name, value)
 
-    
-    slow_print("Clone: \"Figures we'd cross paths eventually.\"")
 
+# ============================================================
+#                   MAIN MENU
+# ============================================================
 
-    slow_print("\nHis voice is cold, almost mechanical — but the sadness in it is unmistakable.")
-    slow_print("Clone: \"The breach should’ve erased you. That was the point.\"")
-    slow_print("Clone: \"No matter... I can't let you walk out of here with that...\"")
+@scene
+async def main_menu(session):
+    while True:
+        choice = await tell(session, "main_menu")
 
-    slow_print("\nHe steps closer, jaw tightening as if he's fighting some internal command.")
-    slow_print("Clone: \"I don't… want to do this. But I don’t have a choice.\"")
+        if choice == "1":
+            return "intro"
+        elif choice == "2":
+            await open_inventory(session)
+        elif choice == "3":
+            await tell(session, "main_menu.quit")
+            return None
+        elif choice == "4":
+            await text_speed_menu(session)
+        else:
+            await tell(session, "main_menu.invalid")
 
-    input("\nPress Enter as the clone lunges toward you...")
-    combat_system()
 
+async def text_speed_menu(session):
+    choice = await tell(session, "text_speed")
+    if choice in TEXT_SPEEDS:
+        session.io.speed = TEXT_SPEEDS[choice]
+        await tell(session, "text_speed.set", speed=choice)
+    else:
+        await tell(session, "text_speed.unknown")
 
 
 # ============================================================
-#                   COMBAT SYSTEM
+#                   INTRO SCENE
 # ============================================================
 
-def combat_system():
-    global badge_buff
+# The intro is content only: see [intro] in lostsignal_content.txt.
 
-    player_hp = 25
-    clone_hp = 22
-    bleed_turns = 0
-    stun_next_turn = False
 
-    # Badge passive buff?
-    if "starfighter badge" in inventory:
-        badge_buff = True
+# ============================================================
+#                   ITEMS
+# ============================================================
 
-    slow_print("\n===== COMBAT START =====\n")
+# Every item in the game, in the order they are created below. Save files
+# refer to items by their position here, so new items go at the end.
+ITEMS = []
 
-    while player_hp > 0 and clone_hp > 0:
 
-        defend = False
+class Item:
+    """One kind of item. Each is created once, below, and inventories
+    refer to it by its id: its position in ITEMS."""
 
-        # --- Show HP ---
-        slow_print(f"Your HP: {player_hp}   |   Clone HP: {clone_hp}")
+    __slots__ = ("id", "name", "desc", "type", "uses")
 
-        # --- Player's Turn ---
-        print("\nYour options:")
-        print("1. Attack")
-        print("2. Use Item")
-        print("3. Defend")
+    def __init__(self, name, desc, item_type, uses):
+        self.id = len(ITEMS)
+        ITEMS.append(self)
+        self.name = name
+        self.desc = desc
+        self.type = item_type   # weapon, buff, heal or lore
+        self.uses = uses        # uses when picked up
 
-        choice = input("Choose: ").strip()
 
-        # ------------------ ATTACK ------------------
-        if choice == "1":
-            base = 4
-            if badge_buff:
-                base += 2
+KNIFE = Item("discarded knife",
+             "A small blade. Rusted, but sharp. Could cause bleeding.",
+             "weapon",
+             999)    # reusable
 
-            slow_print(f"You strike the clone! ({base} dmg)")
-            clone_hp -= base
+BOTTLE = Item("broken bottle",
+              "Shattered at the end. Fragile, but could stun in a fight.",
+              "weapon",
+              1)     # one-time use
 
-        # ------------------ USE ITEM ------------------
-        elif choice == "2":
-            used = use_item_combat()
+BADGE = Item("starfighter badge",
+             "A polished emblem from a long-lost squadron. Wearing it makes you feel steadier.",
+             "buff",
+             999)    # permanent buff
 
-            if used == "knife":
-                slow_print("The blade cuts deep — the clone begins bleeding!")
-                bleed_turns = 2
+HOLO_CHIP = Item("cracked holo-chip",
+                 "Displays corrupted coordinates and static faces you don't recognize.",
+                 "lore",
+                 0)
 
-            elif used == "bottle":
-                slow_print("The bottle shatters! The clone is stunned!")
-                stun_next_turn = True
+MEDKIT = Item("medkit",
+              "A compact emergency medkit filled with synthfoam patches. Restores health in combat.",
+              "heal",
+              1)
 
-            elif used == "heal":
-                player_hp += 8
-                if player_hp > 25:
-                    player_hp = 25
-                slow_print("You feel your strength returning!")
+MANIFEST = Item("torn manifest page",
+                "A manifest log with smeared names. One name isn't smeared: yours.",
+                "lore",
+                0)
 
+ACCESS_CARD = Item("strange access card",
+                   "A metallic data card with a faint pulse. It reacts to your touch in a way you can't explain.",
+                   "lore",
+                   0)
 
-        # ------------------ DEFEND ------------------
-        elif choice == "3":
-            slow_print("You brace yourself. Incoming damage reduced.")
-            defend = True
-        else:
-            slow_print("Invalid input. You lose your turn.")
-            defend = False
-
-        # ------------------ BLEED DAMAGE ------------------
-        if bleed_turns > 0:
-            slow_print("Clone bleeds... (-2 HP)")
-            clone_hp -= 2
-            bleed_turns -= 1
-
-        if clone_hp <= 0:
-            break
-
-        # ------------------ CLONE TURN ------------------
-        if stun_next_turn:
-            slow_print("\nClone is stunned and cannot act!")
-            stun_next_turn = False
-        else:
-            dmg = random.randint(3, 5)
+ITEM_IDS = {item.name: item.id for item in ITEMS}
 
-            if defend:
-                reduced = max(1, dmg // 2)
-                slow_print(f"\nClone attacks, but you brace! Damage reduced from {dmg} to {reduced}.")
-                player_hp -= reduced
-            else:
-                slow_print(f"\nClone attacks! ({dmg} dmg)")
-                player_hp -= dmg
-
-
-    # ============================================================
-    #                   COMBAT RESULT
-    # ============================================================
+NOT_HELD = 0xFFFF
 
-    if player_hp <= 0:
-        slow_print("\nYou collapse... vision fading.")
-        slow_print("Clone: \"Another failure...\"")
-        slow_print("\nYou awaken back in the tavern.\n")
-        return_tavern()
-        return
 
-    if clone_hp <= 0:
-        slow_print("\nClone staggers, dropping to one knee.")
-        slow_print("Clone: \"If you're alive... the others will come for you.\"")
-        slow_print("Clone: \"Don't trust the capsule... it's not what you think.\"")
-        slow_print("The clone collapses.\n")
+class Inventory:
+    """The items one player holds: uses left per item id, plus the order
+    they were picked up in, which is the order they are listed in."""
 
-        # --- Post-Fight Reflection ---
-    
-        slow_print("\nHis voice distorts mid-sentence. A glitch runs down his neck.")
-        slow_print("You watch in horror as his skin flickers like a damaged hologram.\n")
+    __slots__ = ("uses", "order")
 
-        slow_print("The human mask tears away — revealing metal beneath.")
-        slow_print("Synthetic tendons. Wires. A steel jaw shaped exactly like yours.")
-        slow_print("The clone wasn't human. It was wearing you.\n")
+    def __init__(self):
+        self.uses = array("H", [NOT_HELD]) * len(ITEMS)
+        self.order = bytearray()
 
-        slow_print("Panels split open across his chest, exposing a glowing pulse core.")
-        slow_print("It sputters… flickers… then fires off a sharp electronic burst.\n")
+    def __contains__(self, item):
+        return self.uses[item.id] != NOT_HELD
 
-        slow_print("ALERT PING: **TERMINATION SIGNAL SENT**")
-        slow_print("Someone — somewhere — now knows this clone has been destroyed.\n")
+    def __iter__(self):
+        return (ITEMS[item_id] for item_id in bytes(self.order))
 
-        slow_print("You stumble back, trying to steady your breathing.")
-        slow_print("Who built these things? And why do they look like you?\n")
+    def __len__(self):
+        return len(self.order)
 
-        global clone_defeated
-        clone_defeated = True
+    def find(self, name):
+        """Returns the held item called name, or None."""
+        item_id = ITEM_IDS.get(name)
+        if item_id is None or self.uses[item_id] == NOT_HELD:
+            return None
+        return ITEMS[item_id]
 
-        return_tavern()
+    def uses_left(self, item):
+        return self.uses[item.id]
 
+    def add(self, item, uses):
+        if self.uses[item.id] == NOT_HELD:
+            self.order.append(item.id)
+        self.uses[item.id] = uses
 
+    def set_uses(self, item, uses):
+        self.uses[item.id] = uses
 
+    def remove(self, item):
+        self.uses[item.id] = NOT_HELD
+        del self.order[self.order.index(item.id)]
 
 
 # ============================================================
-#                   COMBAT ITEM HANDLER
+#                   INVENTORY SYSTEM
 # ============================================================
 
-def use_item_combat():
-    if not inventory:
-        slow_print("You have no usable combat items.")
-        return None
+async def add_to_inventory(session, item):
+    session.inventory.add(item, item.uses)
+    if session.save is not None:
+        session.save.pick_up(item, item.uses)
+    await tell(session, "inventory.pick_up", name=item.name)
 
-    slow_print("\nItems available:")
-    for item in inventory:
-        if inventory[item]["type"] in ["weapon", "buff", "heal"]:
-            print(f"- {item}")
 
-    choice = input("Use which item? ").strip().lower()
+def use_once(session, item):
+    """Uses up one of an item's uses, dropping it when none are left."""
+    uses = session.inventory.uses_left(item) - 1
+    if uses == 0:
+        session.inventory.remove(item)
+    else:
+        session.inventory.set_uses(item, uses)
+    if session.save is not None:
+        session.save.uses(item, uses)
 
-    if choice not in inventory:
-        slow_print("Invalid choice.")
-        return None
 
-    item = inventory[choice]
+async def open_inventory(session):
+    await tell(session, "inventory")
 
-    if item["type"] == "weapon":
+    inventory = session.inventory
+    if not inventory:
+        await tell(session, "inventory.empty")
+        return
 
-        if choice == "discarded knife":
-            return "knife"
+    for item in inventory:
+        await tell(session, "inventory.item", name=item.name, type=item.type)
 
-        if choice == "broken bottle":
-            if item["uses"] > 0:
-                item["uses"] -= 1
-                if item["uses"] == 0:
-                    del inventory[choice]
-                return "bottle"
+    while True:
+        choice = await tell(session, "inventory.prompt")
 
-    if item["type"] == "buff":
-        slow_print("You grip the badge. Confidence rises.")
-        return None
-    
-    if item["type"] == "heal":
-        slow_print("You quickly apply the medkit! (+8 HP)")
-        item["uses"] -= 1
-        if item["uses"] == 0:
-            del inventory[choice]
-        return "heal"
+        if choice == "exit":
+            return
 
+        item = inventory.find(choice)
+        if item is not None:
+            await show_item_details(session, item)
+        else:
+            await tell(session, "inventory.not_found")
 
-    slow_print("Item cannot be used in combat.")
-    return None
 
+async def show_item_details(session, item):
+    await tell(session, "item.details", title=item.name.upper(), desc=item.desc)
+
+    if item.type in ["weapon", "buff"]:
+        await tell(session, "item.uses", uses=session.inventory.uses_left(item))
+
+    choice = await tell(session, "item.discard")
+    if choice == "yes":
+        session.inventory.remove(item)
+        if session.save is not None:
+            session.save.discard(item)
+        await tell(session, "item.discarded", name=item.name)
 
 
 # ============================================================
-#                   RETURN TO TAVERN
+#                   EXPLORE TAVERN
 # ============================================================
 
-def return_tavern():
-    input("Press Enter to return to the tavern...")
-    tavern_loop()
+def discoveries(content):
+    """The items found while exploring the tavern, in order. They're listed
+    in [explore_tavern] so a content reload can change them."""
+    names = content.passage("explore_tavern").data["finds"].split(",")
+    return [ITEMS[ITEM_IDS[name.strip()]] for name in names]
+
+
+@scene
+async def explore_tavern(session):
+    await tell(session, "explore_tavern")
+
+    for item in discoveries(session.content):
+        take = await tell(session, "explore_tavern.find", name=item.name, desc=item.desc)
+
+        if take == "yes":
+            await add_to_inventory(session, item)
+
+    return await follow(session, "explore_tavern.done")
+
 
 # ============================================================
-#                   RAID EVENT
+#                   BARTENDER PUZZLE
 # ============================================================
 
-def raid_event():
-    slow_print("\nYou climb out of the basement, breathing hard, metal dust still clinging to your hands.")
-    slow_print("The tavern feels strangely normal. Music hums. Glasses clink. Conversations resume.")
-    slow_print("For a moment, it almost feels like nothing happened.\n")
+@scene
+async def talk_to_bartender(session):
+    await tell(session, "talk_to_bartender")
 
-    slow_print("A group of off-duty corporate soldiers sit at a corner table, helmets off, half-drunk.")
-    slow_print("One of them laughs at a joke you’ll never hear.\n")
-
-    slow_print("Then—\n")
+    correct_sequence = ["yes", "no", "yes"]
+    player_answers = []
 
-    slow_print("**BZZT. BZZT.**")
+    questions = ["talk_to_bartender.q1", "talk_to_bartender.q2", "talk_to_bartender.q3"]
 
-    slow_print("Their comm units crackle to life, all at once.")
-    slow_print("The soldiers freeze mid-sip.\n")
+    for q in questions:
+        ans = await tell(session, q)
+        while ans not in ["yes", "no"]:
+            ans = await tell(session, "talk_to_bartender.retry")
+        player_answers.append(ans)
 
-    slow_print("\"—ALERT: TERMINATION SIGNAL RECEIVED.\"")
-    slow_print("\"—SOURCE IDENTIFIED WITHIN TAVERN PERIMETER.\"")
-    slow_print("\"—PROBABLE CARRIER PRESENT. SECURE IMMEDIATELY.\"\n")
+    if player_answers == correct_sequence:
+        session.set_flag("basement_unlocked", True)
+        return await follow(session, "talk_to_bartender.correct")
+    else:
+        return await follow(session, "talk_to_bartender.wrong")
 
-    slow_print("The soldiers exchange wide-eyed glances.")
-    slow_print("One of them whispers, \"No way… Here?\"")
-    slow_print("Another: \"If a construct was destroyed that close… the carrier must be nearby.\"\n")
 
-    slow_print("Their eyes begin to sweep the tavern… and slowly narrow toward you.")
+# ============================================================
+#                   BASEMENT + CLONE ENCOUNTER
+# ============================================================
 
-    slow_print("\nChaos erupts instantly.")
-    slow_print("The soldiers leap to their feet, drawing weapons. Patrons scream and overturn tables.")
-    slow_print("The alarms are blaring from the soldiers gear.\n")
+@scene
+async def basement_scene(session):
+    await tell(session, "basement_scene")
 
-    slow_print("You don’t know what ‘carrier’ means. You don’t know why they’re here.")
-    slow_print("But you DO know one thing:\n")
+    # ----- ITEM PICKUP ----- #
+    await add_to_inventory(session, ACCESS_CARD)
 
-    slow_print("**They’re coming for you.**\n")
+    return await follow(session, "basement_scene.clone")
 
-    # --- First timed choice ---
-    choice1 = input_with_timeout(
-        "CHOICE (8s): Hide, Run, or Blend In? (hide/run/blend)\n"
-    )
 
-    if choice1 is None:
-        return got_caught("You freeze as a soldier points directly at you.")
+# ============================================================
+#                   COMBAT SYSTEM
+# ============================================================
 
-    if choice1 == "hide":
-        return raid_hide_route()
-    elif choice1 == "run":
-        return raid_run_route()
-    elif choice1 == "blend":
-        return raid_blend_route()
+# Balance numbers. lostsignal_sim.py runs these same rules in bulk.
+PLAYER_HP = 25
+CLONE_HP = 22
+ATTACK_DAMAGE = 4
+BADGE_BONUS = 2
+CLONE_DAMAGE = (3, 5)       # the clone's damage roll, inclusive
+BLEED_TURNS = 2
+BLEED_DAMAGE = 2
+MEDKIT_HEAL = 8
+
+# The same numbers for lostsignal_solver.py, which backs the tactical hint.
+RULES = lostsignal_solver.Rules(PLAYER_HP, CLONE_HP, ATTACK_DAMAGE, BADGE_BONUS, CLONE_DAMAGE,
+                                BLEED_TURNS, BLEED_DAMAGE, MEDKIT_HEAL, BOTTLE.uses, MEDKIT.uses)
+
+
+class Fight:
+    """HP and status effects for one clone fight."""
+
+    __slots__ = ("player_hp", "clone_hp", "bleed_turns", "stun_next_turn", "badge_buff")
+
+    def __init__(self, badge_buff=False):
+        self.player_hp = PLAYER_HP
+        self.clone_hp = CLONE_HP
+        self.bleed_turns = 0
+        self.stun_next_turn = False
+        self.badge_buff = badge_buff
+
+    def over(self):
+        return self.player_hp <= 0 or self.clone_hp <= 0
+
+
+def combat_turn(fight, action, roll):
+    """Plays one round of a fight: the player's action, bleeding, then the
+    clone's attack.
+
+    action is "attack", "defend", "invalid", or what use_item_combat
+    returned ("knife", "bottle", "heal" or None). roll() gives the clone's
+    damage and is only called when the clone attacks. Returns the passages
+    to tell, as (name, values) pairs.
+    """
+    events = []
+    defend = False
+
+    # ------------------ PLAYER TURN ------------------
+    if action == "attack":
+        base = ATTACK_DAMAGE
+        if fight.badge_buff:
+            base += BADGE_BONUS
+
+        events.append(("combat_system.strike", {"damage": base}))
+        fight.clone_hp -= base
+
+    elif action == "knife":
+        events.append(("combat_system.knife", {}))
+        fight.bleed_turns = BLEED_TURNS
+
+    elif action == "bottle":
+        events.append(("combat_system.bottle", {}))
+        fight.stun_next_turn = True
+
+    elif action == "heal":
+        fight.player_hp = min(PLAYER_HP, fight.player_hp + MEDKIT_HEAL)
+        events.append(("combat_system.heal", {}))
+
+    elif action == "defend":
+        events.append(("combat_system.defend", {}))
+        defend = True
+
+    elif action == "invalid":
+        events.append(("combat_system.invalid", {}))
+
+    # ------------------ BLEED DAMAGE ------------------
+    if fight.bleed_turns > 0:
+        events.append(("combat_system.bleed", {"damage": BLEED_DAMAGE}))
+        fight.clone_hp -= BLEED_DAMAGE
+        fight.bleed_turns -= 1
+
+    if fight.clone_hp <= 0:
+        return events
+
+    # ------------------ CLONE TURN ------------------
+    if fight.stun_next_turn:
+        events.append(("combat_system.stunned", {}))
+        fight.stun_next_turn = False
     else:
-        return got_caught("You hesitate, and a soldier locks onto your position.")
+        dmg = roll()
 
+        if defend:
+            reduced = max(1, dmg // 2)
+            events.append(("combat_system.braced", {"damage": dmg, "reduced": reduced}))
+            fight.player_hp -= reduced
+        else:
+            events.append(("combat_system.hit", {"damage": dmg}))
+            fight.player_hp -= dmg
 
-# ---------------------- ROUTE: HIDE ---------------------------
+    return events
 
-def raid_hide_route():
-    slow_print("\nYou dive behind the bar counter as bullets crack overhead.")
-    slow_print("The bartender is already curled up under the shelf, trembling.\n")
 
-    slow_print("Soldier: \"Scan for heat signatures! The carrier is WOUNDED!\"\n")
+@scene
+async def combat_system(session):
 
-    choice = input_with_timeout(
-        "CHOICE (8s): Stay hidden or crawl to the storage room? (stay/crawl)\n"
-    )
+    # Badge passive buff?
+    if BADGE in session.inventory:
+        session.set_flag("badge_buff", True)
 
-    if choice is None:
-        return got_caught("A thermal scanner sweeps the bar. You're found immediately.")
+    fight = Fight(session.badge_buff)
+    await tell(session, "combat_system")
 
-    if choice == "stay":
-        return got_caught("A soldier vaults over the bar and spots you instantly.")
-    elif choice == "crawl":
-        slow_print("\nYou crawl through shattered bottles and spilled liquor.")
-        slow_print("A laser sweeps inches above your back as you slip into the storage room.\n")
-        return escape_vent()
-    else:
-        return got_caught("You hesitate and expose yourself to a patrol.")
+    while not fight.over():
 
+        # --- Show HP, then the player's turn ---
+        choice = await tell(session, "combat_system.turn",
+                            player_hp=fight.player_hp, clone_hp=fight.clone_hp)
 
-# ---------------------- ROUTE: RUN ---------------------------
+        if choice == "1":
+            action = "attack"
+        elif choice == "2":
+            action = await use_item_combat(session)
+        elif choice == "3":
+            action = "defend"
+        elif choice == "4":
+            await tactical_hint(session, fight)
+            continue
+        else:
+            action = "invalid"
 
-def raid_run_route():
-    slow_print("\nYou bolt across the tavern floor—")
-    slow_print("A spotlight immediately snaps to your position.\n")
+        for name, values in combat_turn(fight, action, lambda: session.roll(*CLONE_DAMAGE)):
+            await tell(session, name, **values)
+        if session.metrics is not None:
+            session.metrics.combat_turn()
 
-    slow_print("Soldier: \"TARGET IDENTIFIED! DO NOT LET THEM ESCAPE!\"\n")
+    # ============================================================
+    #                   COMBAT RESULT
+    # ============================================================
 
-    choice = input_with_timeout(
-        "CHOICE (8s): Dive behind tables or sprint to the back exit? (dive/sprint)\n"
-    )
+    if session.metrics is not None:
+        session.metrics.fight(won=fight.player_hp > 0)
 
-    if choice is None:
-        return got_caught("You trip as gunfire erupts behind you.")
+    if fight.player_hp <= 0:
+        return await follow(session, "combat_system.lost")
 
-    if choice == "dive":
-        slow_print("\nYou slide behind a row of overturned tables.")
-        slow_print("Gunfire rips into the wooden frames but misses you narrowly.\n")
-        return escape_kitchen()
-    elif choice == "sprint":
-        return got_caught("A stun round slams into your ribs mid-sprint.")
-    else:
-        return got_caught("You hesitate for half a second—too long.")
+    session.set_flag("clone_defeated", True)
+    return await follow(session, "combat_system.won")
 
 
-# ---------------------- ROUTE: BLEND ---------------------------
+# How the hint names each move the solver can pick.
+HINT_MOVES = {
+    "attack": "Attack (1)",
+    "defend": "Defend (3)",
+    "knife": f"use the {KNIFE.name} (2)",
+    "bottle": f"throw the {BOTTLE.name} (2)",
+    "heal": f"use the {MEDKIT.name} (2)",
+}
 
-def raid_blend_route():
-    slow_print("\nYou shove yourself into a crowd of fleeing mercenaries.")
-    slow_print("Smoke fills the room as the sprinkler system activates.\n")
 
-    slow_print("Soldier: \"Filter the crowd! The anomaly's signal is degrading!\"\n")
+async def tactical_hint(session, fight):
+    """Tells the player the best move from here and their chance of winning
+    with perfect play. Doesn't use up the turn."""
+    inventory = session.inventory
+    table = lostsignal_solver.table(RULES, fight.badge_buff, KNIFE in inventory)
+    bottles = inventory.uses_left(BOTTLE) if BOTTLE in inventory else 0
+    medkits = inventory.uses_left(MEDKIT) if MEDKIT in inventory else 0
+    move, chance = table.lookup(fight.player_hp, fight.clone_hp, fight.bleed_turns,
+                                fight.stun_next_turn, bottles, medkits)
+    # Rounded down, so 100% means the fight can't be lost.
+    await tell(session, "combat_system.hint", move=HINT_MOVES[move],
+               chance=f"{int(chance * 1000) / 10:g}%")
 
-    choice = input_with_timeout(
-        "CHOICE (8s): Move with the crowd or break off toward the vents? (crowd/vents)\n"
-    )
 
-    if choice is None:
-        return got_caught("A soldier grabs your shoulder out of suspicion.")
+# ============================================================
+#                   COMBAT ITEM HANDLER
+# ============================================================
 
-    if choice == "crowd":
-        return got_caught("A scanner picks up your heartbeat pattern. You're pulled from the crowd.")
-    elif choice == "vents":
-        slow_print("\nYou slip away as soldiers focus on the larger group.")
-        slow_print("A maintenance vent hangs open, steam billowing out.\n")
-        return escape_vent()
-    else:
-        return got_caught("Your hesitation draws attention.")
+# What each item does when used in a fight, by item id. An effect returns
+# the action for combat_turn ("knife", "bottle", "heal") or None. Items
+# without one (the lore items) can't be used in a fight.
+EFFECTS = [None] * len(ITEMS)
 
 
-# ---------------------- ESCAPE: VENTS ---------------------------
+def effect(item):
+    """Registers an item's combat effect."""
+    def register(func):
+        EFFECTS[item.id] = func
+        return func
+    return register
 
-def escape_vent():
-    slow_print("\nYou climb into the vent, pulling the grate shut behind you.")
-    slow_print("The metal tunnels vibrate as soldiers pound through the tavern.\n")
 
-    slow_print("A distorted voice echoes faintly through the ducts:")
-    slow_print("\"The carrier is close. Their signal is unstable. Move units downstairs.\"\n")
+@effect(KNIFE)
+async def knife_effect(session, item):
+    return "knife"
 
-    slow_print("You crawl toward a faint blue glow ahead...")
-    demo_end()
 
+@effect(BOTTLE)
+async def bottle_effect(session, item):
+    use_once(session, item)
+    return "bottle"
 
-# ---------------------- ESCAPE: KITCHEN ---------------------------
 
-def escape_kitchen():
-    slow_print("\nYou dart through the swinging kitchen doors.")
-    slow_print("Steam, broken dishes, and shouting cooks blur around you.\n")
+@effect(BADGE)
+async def badge_effect(session, item):
+    await tell(session, "use_item.badge")
+    return None
 
-    slow_print("A back service hatch stands slightly ajar.\n")
 
-    choice = input_with_timeout(
-        "CHOICE (8s): Open the hatch quietly or kick it open? (quiet/kick)\n"
-    )
+@effect(MEDKIT)
+async def medkit_effect(session, item):
+    await tell(session, "use_item.medkit", heal=MEDKIT_HEAL)
+    use_once(session, item)
+    return "heal"
 
-    if choice is None:
-        return got_caught("A patrol enters the kitchen as you freeze in place.")
 
-    if choice == "quiet":
-        slow_print("\nYou slip through the hatch silently, disappearing into the alley beyond.\n")
-        demo_end()
-    elif choice == "kick":
-        return got_caught("The loud crash alerts the soldiers immediately.")
-    else:
-        return got_caught("That moment of uncertainty seals your fate.")
+async def use_item_combat(session):
+    inventory = session.inventory
+    if not inventory:
+        await tell(session, "use_item.none")
+        return None
 
+    await tell(session, "use_item")
+    for item in inventory:
+        if EFFECTS[item.id] is not None:
+            await tell(session, "use_item.item", name=item.name)
+
+    choice = await tell(session, "use_item.prompt")
+
+    item = inventory.find(choice)
+    if item is None:
+        await tell(session, "use_item.invalid")
+        return None
+
+    use = EFFECTS[item.id]
+    if use is None:
+        await tell(session, "use_item.unusable")
+        return None
+    return await use(session, item)
 
-# ---------------------- FAILURE STATE ---------------------------
 
-def got_caught(reason):
-    slow_print(f"\n{reason}")
-    slow_print("A stun baton cracks against your skull as everything goes dark...")
-    slow_print("\n*** DEMO OVER: YOU WERE CAPTURED ***\n")
-    main_menu()
+# ============================================================
+#                   RAID EVENT
+# ============================================================
 
-# ---------------------- DEMO END ---------------------------
-def demo_end():
-    slow_print("\nYou stumble into the narrow service passage behind the tavern, lit by flickering holo-signs.")
-    slow_print("Sirens echo in the distance as corporate drones swarm overhead.\n")
+# The return to the tavern, the raid, its three routes and both escapes are
+# content only: their text and timed choices are [return_tavern],
+# [raid_event], [raid_*_route], [escape_*] and [demo_end] in
+# lostsignal_content.txt.
 
-    slow_print("You clutch your chest, catching your breath.")
-    slow_print("Whatever that clone was… whatever the capsule is…")
-    slow_print("One thing is certain now:\n")
+# ---------------------- FAILURE STATE ---------------------------
 
-    slow_print("**Someone built those constructs. And they’re still looking for you.**\n")
+async def got_caught(session, reason):
+    await tell(session, "got_caught", reason=reason)
+    return "main_menu"
 
-    slow_print("*** DEMO COMPLETE — THANK YOU FOR PLAYING ***\n")
-    main_menu()
 
 # ============================================================
 #                   MERC DIALOGUE
 # ============================================================
 
-def talk_to_merc():
-    slow_print("\nA merc leans against a rusted pillar, armor scraped and mismatched.")
-    slow_print("Merc: \"You lookin' for trouble, or just lost?\"")
-    slow_print("Merc: \"Word of advice: keep 'yer head low.\"")
-    input("Press Enter to return to the tavern...")
+# Content only: see [talk_to_merc].
 
 
 # ============================================================
 #                   TAVERN MAIN LOOP
 # ============================================================
 
-def tavern_loop():
-    global basement_unlocked
-    global clone_defeated
-
-    if clone_defeated:
-        raid_event()
-        clone_defeated = False
-        return
+@scene
+async def tavern_loop(session):
+    if session.clone_defeated:
+        session.set_flag("clone_defeated", False)
+        return "raid_event"
 
     while True:
-        slow_print("\n===== CENTRAL DRIFT TAVERN =====")
-        print("1. Talk to Bartender")
-        print("2. Talk to Merc")
-        print("3. Explore Tavern")
-        print("4. Check Inventory")
-        print("5. Exit Tavern")
-
-        choice = input("\nChoose: ").strip()
+        choice = await tell(session, "tavern_loop")
 
         if choice == "1":
-            talk_to_bartender()
+            return "talk_to_bartender"
         elif choice == "2":
-            talk_to_merc()
+            return "talk_to_merc"
         elif choice == "3":
-            explore_tavern()
+            return "explore_tavern"
         elif choice == "4":
-            open_inventory()
+            await open_inventory(session)
         elif choice == "5":
-            slow_print("You leave the tavern and step into the desolate wasteland...")
-            main_menu()
-            return
+            await tell(session, "tavern_loop.leave")
+            return "main_menu"
         else:
-            slow_print("Invalid choice.")
-
+            await tell(session, "tavern_loop.invalid")
 
 # ============================================================
 #                   RUN GAME
 # ============================================================
 
-main_menu()
+def replay(path, out=None):
+    """Replays a recording made with --record. Returns the session and how
+    many inputs were replayed; raises ReplayDivergence if the game no
+    longer asks what the recording answered."""
+    seed, records = lostsignal_replay.read_log(path)
+    io = lostsignal_replay.ReplayIO(records, out)
+    session = GameSession(io, seed)
+    try:
+        play(session)
+    except EOFError:
+        pass      # the recording stops mid-game
+    return session, io.count
+
+
+def main(argv=None):
+    """The command line: a console in front of step()."""
+    import argparse     # only the command line needs it; importing the game stays quick
+
+    parser = argparse.ArgumentParser(description="Lost Signal - Demo Version")
+    parser.add_argument("--speed", choices=TEXT_SPEEDS, default="normal",
+                        help="how fast dialog is typed out")
+    parser.add_argument("--fps", type=int, default=25,
+                        help="typewriter frames per second")
+    parser.add_argument("--render-stats", action="store_true",
+                        help="print writes and sleeps per scene on exit")
+    parser.add_argument("--seed", type=int,
+                        help="seed for the session's dice rolls")
+    parser.add_argument("--record", metavar="FILE",
+                        help="record every input to FILE")
+    parser.add_argument("--replay", metavar="FILE",
+                        help="replay a recording instantly and check it still plays the same")
+    parser.add_argument("--quiet", action="store_true",
+                        help="with --replay, only print the result")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="write Prometheus metrics for the session to FILE on exit")
+    parser.add_argument("--profile", action="store_true",
+                        help="print where the session's time went on exit")
+    parser.add_argument("--save", metavar="FILE",
+                        help="resume from FILE if it exists, and keep it saved as you play")
+    parser.add_argument("--watch", action="store_true",
+                        help="reload lostsignal_content.txt whenever it's saved")
+    args = parser.parse_args(argv)
+
+    if args.replay:
+        started = time.perf_counter()
+        try:
+            session, count = replay(args.replay, None if args.quiet else sys.stdout)
+        except lostsignal_replay.ReplayDivergence as error:
+            sys.exit(f"\nReplay diverged: {error}")
+        print(f"\nReplayed {count} inputs in {(time.perf_counter() - started) * 1000:.1f} ms, "
+              f"stopped in {session.scene or 'quit'}.")
+        return
+
+    console = ConsoleIO(fps=args.fps, speed=TEXT_SPEEDS[args.speed])
+    session = new_session(args.seed)
+    if args.save:
+        generation = 0
+        if os.path.exists(args.save):
+            started = time.perf_counter()
+            generation = lostsignal_save.load(args.save, session, ITEMS)
+            print(f"Resumed {args.save} in {(time.perf_counter() - started) * 1e6:.0f} µs.")
+        session.save = lostsignal_save.Autosave(args.save, session, generation)
+    if args.record:
+        session.log = lostsignal_replay.InputLog(args.record, session.seed)
+    metrics = lostsignal_metrics.Metrics()
+    if args.metrics or args.profile:
+        session.metrics = metrics.session(profile=args.profile)
+    if args.watch:
+        watch_content()
+    try:
+        play_console(session, console)
+    finally:
+        if session.log is not None:
+            session.log.close()
+        if session.save is not None:
+            session.save.close()
+        if args.metrics:
+            metrics.write(args.metrics)
+        if args.profile:
+            print("\n" + session.metrics.report())
+        if args.render_stats:
+            console.report()
+
+
+if __name__ == "__main__":
+    main()